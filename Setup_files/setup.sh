@@ -18,7 +18,7 @@ echo "🔄 Updating system..."
 sudo apt update && sudo apt upgrade -y
 
 echo "✅ Ensuring required packages..."
-sudo apt install -y git curl lsof
+sudo apt install -y git curl
 
 # --- Clone or Pull Git Repository ---
 echo "📁 Setting up CIAP directory at $CIAP_DIR..."
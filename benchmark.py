@@ -0,0 +1,448 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import serial
+from metrics import process_stats
+
+MARKER = re.compile(r" t=(\d+)")
+TRAFFIC = {
+    "AIS": "AIS,{seq},140,1,01,A,12.971599,N,77.594566,E,0.0,{seq},",
+    "CAN": "CAN 18FEF100 8 {seq:08X} 3C 00 FF 1A 7D 00",
+    "GPS": "$GPRMC,101500.00,A,1258.2959,N,07735.6740,E,0.0,,181026,,,A*{seq}",
+}
+IMEI_BASE = 861234567890000
+
+
+def make_line(kind, seq, length, stamp=None):
+    line = TRAFFIC[kind].format(seq=seq)
+    if stamp is not None:
+        line += f" t={stamp}"
+    return line + " " + "x" * max(0, length - len(line) - 1)
+
+
+def generate(masters, rate, seconds, length, mix, sample_every, results):
+    # Runs in its own process so the traffic source doesn't compete with the
+    # logger for the GIL; both sides share CLOCK_MONOTONIC.
+    for index, master in enumerate(masters):
+        os.write(master, f"boot\r\nIMEI:{IMEI_BASE + index}\r\n".encode())
+    time.sleep(0.5)
+
+    sent = [0] * len(masters)
+    blocked = 0.0
+    longest = 0.0
+    started = time.monotonic()
+    deadline = started + seconds
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        due = int(rate * (now - started))
+        for index, master in enumerate(masters):
+            lines = []
+            for seq in range(sent[index], due):
+                stamp = time.monotonic_ns() if seq % sample_every == 0 else None
+                lines.append(make_line(mix[seq % len(mix)], seq, length, stamp))
+            if lines:
+                # A full pty buffer blocks here: the logger isn't keeping up.
+                before = time.monotonic()
+                os.write(master, ("\r\n".join(lines) + "\r\n").encode())
+                waited = time.monotonic() - before
+                blocked += waited
+                longest = max(longest, waited)
+                sent[index] = due
+        time.sleep(0.005)
+    elapsed = time.monotonic() - started
+    results.put((sum(sent), started, elapsed, blocked / elapsed, longest))
+
+
+def hold_gil(seconds):
+    # sum() over a C iterator never releases the GIL, like a long regex or
+    # Tcl call inside insert_log. Calibrated, so roughly `seconds` long.
+    count = 1000000
+    started = time.perf_counter()
+    sum(itertools.repeat(1, count))
+    rate = count / (time.perf_counter() - started)
+    sum(itertools.repeat(1, int(rate * seconds)))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Probe:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.disk_lines = 0
+            self.disk_latency = []
+            self.ui_lines = 0
+            self.ui_latency = []
+            self.last_disk = None
+
+    def on_disk(self, text):
+        now = time.monotonic_ns()
+        with self.lock:
+            self.disk_lines += text.count("\n")
+            self.disk_latency.extend(now - int(stamp) for stamp in MARKER.findall(text))
+            self.last_disk = time.monotonic()
+
+    def on_ui(self, messages):
+        now = time.monotonic_ns()
+        with self.lock:
+            self.ui_lines += len(messages)
+            for message in messages:
+                match = MARKER.search(message)
+                if match:
+                    self.ui_latency.append(now - int(match.group(1)))
+
+
+class BenchmarkFrontend:
+    def __init__(self, probe):
+        from headless import Scheduler
+
+        self.scheduler = Scheduler()
+        self.probe = probe
+        self.stall_at = None
+        self.stall_seconds = 0.0
+        self.stalled = 0.0
+
+    def after(self, ms, func):
+        return self.scheduler.after(ms, func)
+
+    def stall(self, at, seconds):
+        self.stalled = 0.0
+        self.stall_seconds = seconds
+        self.stall_at = at
+
+    def insert_logs(self, messages, device=None):
+        if device is not None:
+            self.probe.on_ui(messages)
+        if self.stall_at is not None and time.monotonic() >= self.stall_at:
+            # A render call that hogs the GUI thread and the GIL.
+            self.stall_at = None
+            started = time.monotonic()
+            hold_gil(self.stall_seconds)
+            self.stalled = time.monotonic() - started
+
+    def insert_log(self, message, device=None):
+        self.insert_logs([message], device)
+
+    def set_title(self, text):
+        pass
+
+    def set_status(self, text):
+        pass
+
+    def add_device_view(self, device):
+        pass
+
+    def set_device_connected(self, device, connected):
+        pass
+
+
+def instrument_sink(probe):
+    from log_sink import RotatingLogSink
+
+    write = RotatingLogSink.write
+
+    def timed_write(sink, text):
+        result = write(sink, text)
+        probe.on_disk(text)
+        return result
+
+    RotatingLogSink.write = timed_write
+
+
+class LocalTarget:
+    # The logger in this process, as before the capture process existed.
+    def __init__(self, manager, probe):
+        self.manager = manager
+        self.probe = probe
+
+    def counts(self):
+        cpu, rss = process_stats()
+        queues = [self.manager.log_queue] + [s.log_queue for s in self.manager.sessions.values()]
+        return {
+            "written": self.probe.disk_lines,
+            "dropped": sum(q.dropped_total for q in queues),
+            "cpu": cpu,
+            "rss": rss,
+        }
+
+    def flush(self):
+        self.manager.writers.flush()
+
+    def close(self):
+        self.manager.stop_logging()
+        self.manager.writers.stop()
+
+
+class RemoteTarget:
+    # The logger in a capture process; this process only plays the GUI.
+    def __init__(self, capture):
+        self.capture = capture
+        self.last = None
+
+    def counts(self):
+        stats = self.capture.query_stats() or self.last
+        self.last = stats
+        return {
+            "written": stats["lines_written"],
+            "dropped": stats["display_dropped"],
+            "cpu": stats["cpu"],
+            "rss": stats["rss"],
+        }
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.capture.close()
+
+
+def run_step(target, frontend, masters, probe, rate, args):
+    probe.reset()
+    before = target.counts()
+    results = multiprocessing.Queue()
+    generator = multiprocessing.Process(
+        target=generate,
+        args=(masters, rate, args.seconds, args.line_length, args.mix,
+              args.sample_every, results),
+    )
+    started = time.monotonic()
+    generator.start()
+    if args.stall_ui:
+        # The generator sleeps 0.5 s after the preamble before timing starts.
+        frontend.stall(started + 0.5 + args.stall_after, args.stall_ui)
+    sent, send_started, send_time, blocked, longest = results.get()
+    generator.join()
+
+    # Let the pipeline drain what the generator managed to push. Each device
+    # also wrote a two-line boot/IMEI preamble.
+    preamble = 2 * len(masters)
+    drain_deadline = time.monotonic() + args.drain_seconds
+    after = target.counts()
+    while after["written"] - before["written"] - preamble < sent:
+        if time.monotonic() >= drain_deadline:
+            break
+        time.sleep(0.05)
+        after = target.counts()
+    drained = time.monotonic()
+    target.flush()
+    on_disk = max(after["written"] - before["written"] - preamble, 0)
+    elapsed = max((probe.last_disk or drained) - send_started, 1e-6)
+
+    offered = rate * len(masters)
+    ms = lambda ns: None if ns is None else round(ns / 1e6, 2)
+    return {
+        "offered_lps": offered,
+        "sent_lps": round(sent / send_time),
+        "backpressure_percent": round(blocked * 100, 1),
+        "source_max_block_ms": round(longest * 1000, 1),
+        "sustained_lps": round(min(on_disk, sent) / elapsed),
+        "lines_sent": sent,
+        "lines_on_disk": on_disk,
+        "lines_lost": max(sent - on_disk, 0),
+        "ui_stall_s": round(frontend.stalled, 2),
+        "disk_p50_ms": ms(percentile(probe.disk_latency, 0.5)),
+        "disk_p99_ms": ms(percentile(probe.disk_latency, 0.99)),
+        "ui_p50_ms": ms(percentile(probe.ui_latency, 0.5)),
+        "ui_p99_ms": ms(percentile(probe.ui_latency, 0.99)),
+        "display_dropped": after["dropped"] - before["dropped"],
+        "cpu_percent": round((after["cpu"] - before["cpu"]) / (time.monotonic() - started) * 100, 1),
+        "rss_mb": None if after["rss"] is None else round(after["rss"] / 1024 / 1024, 1),
+    }
+
+
+def saturated(step, args):
+    # The source couldn't write at the offered rate or was held up long
+    # enough that a real UART would have overrun, lines never reached disk,
+    # or the display had to drop. A deliberately stalled UI is expected to
+    # drop display lines, so that alone doesn't count.
+    return (
+        step["sent_lps"] < 0.95 * step["offered_lps"]
+        or step["source_max_block_ms"] > args.overrun_ms
+        or step["lines_on_disk"] < step["lines_sent"]
+        or (step["display_dropped"] > 0 and not args.stall_ui)
+    )
+
+
+COLUMNS = (
+    ("offered_lps", "offered/s"), ("sustained_lps", "sustained/s"),
+    ("disk_p50_ms", "disk p50"), ("disk_p99_ms", "disk p99"),
+    ("ui_p50_ms", "ui p50"), ("ui_p99_ms", "ui p99"),
+    ("display_dropped", "dropped"), ("lines_lost", "lost"),
+    ("backpressure_percent", "blocked %"), ("source_max_block_ms", "max block"),
+    ("cpu_percent", "cpu %"), ("rss_mb", "rss MB"),
+)
+
+
+def print_table(steps, baseline=None):
+    print("  ".join(f"{title:>11}" for _, title in COLUMNS))
+    previous_steps = {step["offered_lps"]: step for step in baseline or ()}
+    for step in steps:
+        print("  ".join(f"{'-' if step[key] is None else step[key]:>11}" for key, _ in COLUMNS))
+        previous = previous_steps.get(step["offered_lps"])
+        if previous:
+            deltas = []
+            for key, _ in COLUMNS[1:]:
+                if step[key] is None or previous.get(key) in (None, 0):
+                    deltas.append(f"{'':>11}")
+                else:
+                    deltas.append(f"{(step[key] - previous[key]) / previous[key]:>+11.0%}")
+            print(f"{'vs baseline':>11}  " + "  ".join(deltas))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Drive the logger with virtual TCUs on pty pairs and measure it"
+    )
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument(
+        "--rates", default="500,1000,2000,5000,10000",
+        help="comma-separated lines/s per device, one step each",
+    )
+    parser.add_argument("--seconds", type=float, default=5.0, help="per step")
+    parser.add_argument("--line-length", type=int, default=120)
+    parser.add_argument("--mix", default="AIS,CAN,GPS", help="message kinds, round-robin")
+    parser.add_argument("--sample-every", type=int, default=10,
+                        help="timestamp one line in N for latency")
+    parser.add_argument("--drain-seconds", type=float, default=5.0)
+    parser.add_argument("--reader-engine", choices=("event", "poll"), default="event")
+    parser.add_argument("--display-policy", choices=("drop", "sample", "coalesce"),
+                        default="drop")
+    parser.add_argument("--writer-threads", type=int, default=1)
+    parser.add_argument("--compression", choices=("zstd", "gzip", "none"), default="gzip")
+    parser.add_argument("--capture-process", action="store_true",
+                        help="run the logger in a capture process, as the GUI does")
+    parser.add_argument("--stall-ui", type=float, default=0.0, metavar="SECONDS",
+                        help="once per step, hold the front end (and its GIL) this long")
+    parser.add_argument("--stall-after", type=float, default=1.0,
+                        help="seconds into each step the stall starts")
+    parser.add_argument("--overrun-ms", type=float, default=50.0,
+                        help="a source write blocked longer than this counts as an overrun")
+    parser.add_argument("--keep-going", action="store_true",
+                        help="run every step even after the logger saturates")
+    parser.add_argument("--json", help="write results here")
+    parser.add_argument("--compare", help="earlier --json results to diff against")
+    parser.add_argument("--workdir", help="where logs go (default: a temp dir)")
+    args = parser.parse_args(argv)
+    args.rates = [int(rate) for rate in args.rates.split(",")]
+    args.mix = [kind.strip().upper() for kind in args.mix.split(",")]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    json_path = os.path.abspath(args.json) if args.json else None
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["steps"]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="aepl-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    probe = Probe()
+    frontend = BenchmarkFrontend(probe)
+    options = dict(
+        reader_engine=args.reader_engine,
+        display_policy=args.display_policy,
+        writer_threads=args.writer_threads,
+        compression=args.compression,
+        monitor_ports=False,
+    )
+
+    masters, slaves = [], []
+    for _ in range(args.devices):
+        master, slave = os.openpty()
+        masters.append(master)
+        slaves.append(slave)
+    paths = [os.ttyname(slave) for slave in slaves]
+
+    if args.capture_process:
+        from capture_process import CaptureProcess
+
+        capture = CaptureProcess(frontend, ports=paths, **options)
+        deadline = time.monotonic() + 10.0
+        while len(capture.alive) < len(paths) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        target = RemoteTarget(capture)
+    else:
+        from device_session import DeviceSession
+        from serial_handler import SerialManager
+
+        instrument_sink(probe)
+        manager = SerialManager(frontend, **options)
+        for path in paths:
+            port = serial.Serial(path, 115200, timeout=0.05)
+            session = DeviceSession(manager, port)
+            manager.sessions[port.port] = session
+            session.start()
+        target = LocalTarget(manager, probe)
+
+    print(
+        f"{args.devices} device(s), {args.line_length}-byte {'/'.join(args.mix)} lines, "
+        f"{args.seconds:.0f}s per step, reader={args.reader_engine}, "
+        f"writers={args.writer_threads}, compression={args.compression}, "
+        f"{'capture process' if args.capture_process else 'in-process'}"
+        f"{f', UI stalled {args.stall_ui:g}s per step' if args.stall_ui else ''}, "
+        f"logs in {workdir}",
+        flush=True,
+    )
+    steps = []
+    saturation = None
+    for rate in args.rates:
+        step = run_step(target, frontend, masters, probe, rate, args)
+        steps.append(step)
+        print(
+            f"  {step['offered_lps']} lines/s offered -> {step['sustained_lps']} sustained, "
+            f"{step['lines_lost']} lost, source blocked {step['source_max_block_ms']} ms max",
+            flush=True,
+        )
+        if saturated(step, args):
+            saturation = saturation or step["offered_lps"]
+            if not args.keep_going:
+                break
+
+    target.close()
+
+    print()
+    print_table(steps, baseline)
+    if saturation:
+        print(f"\nSaturates at {saturation} lines/s offered "
+              f"({saturation // args.devices} per device).")
+    else:
+        print("\nNo saturation up to the highest rate tested.")
+
+    if json_path:
+        report = {
+            "config": {
+                key: getattr(args, key)
+                for key in ("devices", "seconds", "line_length", "mix", "reader_engine",
+                            "display_policy", "writer_threads", "compression",
+                            "capture_process", "stall_ui")
+            },
+            "python": sys.version.split()[0],
+            "steps": steps,
+            "saturation_lps": saturation,
+        }
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+import functools
+import multiprocessing
+import threading
+import time
+from collections import deque
+
+# What the GUI may ask of the SerialManager in the capture process.
+COMMANDS = (
+    "start_logging",
+    "stop_logging",
+    "send_command",
+    "run_macro",
+    "stop_macro",
+    "record_profile",
+    "add_port",
+    "note_startup",
+)
+
+# How the GUI runs capture, in a child process or in-process. Kept here so
+# main.py can start capture before importing tkinter or the UI.
+GUI_OPTIONS = dict(
+    metrics_port=None,
+    tap=None,
+    triggers="Assets/triggers.json",
+    first_byte_budget=5.0,
+)
+
+
+def gui_options(argv):
+    # main.py's flags for the GUI. Metrics and the tap have no
+    # authentication, so they only run when asked for.
+    import argparse
+
+    parser = argparse.ArgumentParser(description="AEPL Logger")
+    parser.add_argument(
+        "--in-process", action="store_true", help="capture in the GUI process (debugging)"
+    )
+    parser.add_argument(
+        "--metrics-port", type=int, default=0, help="serve /metrics and /profile on 127.0.0.1"
+    )
+    parser.add_argument(
+        "--tap", default="", help="publish the live stream on host:port or unix:/path"
+    )
+    parser.add_argument(
+        "--fsync-interval", type=float, default=0.0, help="fsync log files this often (seconds)"
+    )
+    parser.add_argument(
+        "--device-profile", help="validation profile in Assets/device.json for macros"
+    )
+    args = parser.parse_args(argv)
+    options = dict(
+        GUI_OPTIONS,
+        metrics_port=args.metrics_port or None,
+        tap=args.tap or None,
+        fsync_interval=args.fsync_interval or None,
+        device_profile=args.device_profile,
+    )
+    return args.in_process, options
+
+
+def capture_stats(manager):
+    from metrics import process_stats
+
+    cpu, rss = process_stats()
+    sessions = list(manager.sessions.values())
+    return {
+        "lines_read": sum(s.reader_stats.lines for s in sessions),
+        "lines_written": sum(w.writes for w in manager.writers.writers),
+        "display_dropped": sum(
+            q.dropped_total for q in [manager.log_queue] + [s.log_queue for s in sessions]
+        ),
+        "cpu": cpu,
+        "rss": rss,
+    }
+
+
+class PipeFrontend:
+    # The capture process's stand-in for the GUI. Front-end calls become
+    # messages that one sender thread writes to the pipe, so a GUI that stops
+    # reading only ever blocks that thread: readers, log writers and timers
+    # carry on, and lines wait in the display queues under their policy.
+    def __init__(self, conn):
+        from headless import Scheduler
+
+        self.conn = conn
+        self.scheduler = Scheduler()
+        self.manager = None
+        self.outbox = deque()
+        self.condition = threading.Condition()
+        self.unacked = 0
+        self.closed = False
+        self.last_state = None
+        self.device_connected = {}
+        self.thread = threading.Thread(target=self._send_loop, name="gui-pipe", daemon=True)
+        self.thread.start()
+
+    def after(self, ms, func):
+        return self.scheduler.after(ms, func)
+
+    def set_title(self, text):
+        self._post(("ui", "set_title", (text,)))
+
+    def set_status(self, text):
+        self._post(("ui", "set_status", (text,)))
+
+    def add_device_view(self, device):
+        self._post(("ui", "add_device_view", (device,)))
+
+    def set_device_connected(self, device, connected):
+        # The manager repeats this every tick; only changes cross the pipe.
+        if self.device_connected.get(device) != connected:
+            self.device_connected[device] = connected
+            self._post(("ui", "set_device_connected", (device, connected)))
+
+    def insert_logs(self, messages, device=None):
+        with self.condition:
+            self.unacked += len(messages)
+        self._post(("ui", "insert_logs", (messages, device)))
+
+    def insert_log(self, message, device=None):
+        self.insert_logs([message], device)
+
+    def backlog(self):
+        # Lines sent to the GUI that it hasn't acknowledged rendering yet.
+        return self.unacked
+
+    def serve(self):
+        # Handles the GUI's requests on the calling thread until it says
+        # stop or the pipe closes.
+        manager = self.manager
+        self._report()
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                return
+            kind = message[0]
+            if kind == "ack":
+                _, lines, seconds = message
+                with self.condition:
+                    self.unacked = max(self.unacked - lines, 0)
+                manager.note_render(lines, seconds)
+            elif kind == "call" and message[1] in COMMANDS:
+                self.after(0, functools.partial(getattr(manager, message[1]), *message[2]))
+            elif kind == "active_port":
+                manager.active_port = message[1]
+            elif kind == "stats":
+                self._post(("stats", capture_stats(manager)))
+            elif kind == "stop":
+                return
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join(2.0)
+        self.scheduler.stop()
+
+    def _report(self):
+        if self.closed:
+            return
+        sessions = list(self.manager.sessions.items())
+        state = (
+            self.manager.logging_active,
+            tuple(sorted(port for port, _ in sessions)),
+            tuple(sorted(port for port, session in sessions if session.is_alive)),
+        )
+        if state != self.last_state:
+            self.last_state = state
+            self._post(("state",) + state)
+        self.after(200, self._report)
+
+    def _post(self, message):
+        with self.condition:
+            self.outbox.append(message)
+            self.condition.notify()
+
+    def _send_loop(self):
+        while True:
+            with self.condition:
+                while not self.outbox and not self.closed:
+                    self.condition.wait()
+                if not self.outbox:
+                    return
+                batch = list(self.outbox)
+                self.outbox.clear()
+            try:
+                self.conn.send(batch)
+            except (OSError, ValueError):
+                return
+
+
+def run_capture(conn, options):
+    # Entry point of the capture process: port monitoring, readers, log
+    # writers, metrics and the tap, with the GUI at the other end of conn.
+    from serial_handler import SerialManager
+    from triggers import load_triggers
+
+    options = dict(options)
+    ports = options.pop("ports", ())
+    triggers = options.pop("triggers", None)
+    if triggers:
+        options["triggers"] = load_triggers(triggers, on_error=print)
+
+    frontend = PipeFrontend(conn)
+    manager = SerialManager(frontend, remote_ui=True, **options)
+    frontend.manager = manager
+    for port in ports:
+        manager.add_port(port)
+    try:
+        frontend.serve()
+    finally:
+        manager.close()
+        frontend.close()
+
+
+class CaptureProcess:
+    # The GUI's handle on a SerialManager running in a child process. It
+    # offers the calls the UI makes on a SerialManager; the state the UI
+    # reads comes from the child's reports. Lines are rendered on the GUI's
+    # own tick and acknowledged, and the child hands over no more than the
+    # GUI has shown it can render in a frame.
+    frame_budget = 0.025
+
+    def __init__(self, ui=None, **options):
+        self.ui = None
+        self.logging_active = False
+        self.ports = ()
+        self.alive = ()
+        self._active_port = None
+        self.stats = None
+        self.stats_ready = threading.Event()
+        self.send_lock = threading.Lock()
+        self.stopped = False
+
+        # spawn, not fork: the child must not inherit Tk or the GUI's threads.
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=run_capture, args=(child_conn, options), name="aepl-capture", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        if ui is not None:
+            self.attach(ui)
+
+    def attach(self, ui):
+        # Capture can start before the GUI exists. Until it attaches, lines
+        # wait in the child's display queues like for a stalled GUI; the
+        # logs don't wait for it.
+        self.ui = ui
+        self.ui.after(50, self.poll)
+
+    @property
+    def active_port(self):
+        return self._active_port
+
+    @active_port.setter
+    def active_port(self, port):
+        self._active_port = port
+        self._send(("active_port", port))
+
+    @property
+    def connected(self):
+        if self._active_port in self.ports:
+            return self._active_port in self.alive
+        return bool(self.alive)
+
+    def start_logging(self):
+        self._call("start_logging")
+
+    def stop_logging(self):
+        self._call("stop_logging")
+
+    def send_command(self, command):
+        self._call("send_command", command)
+
+    def run_macro(self, source, name="macro"):
+        self._call("run_macro", source, name)
+
+    def stop_macro(self):
+        self._call("stop_macro")
+
+    def record_profile(self, seconds=10.0):
+        self._call("record_profile", seconds)
+
+    def add_port(self, path):
+        self._call("add_port", path)
+
+    def note_startup(self, stage):
+        # Stamped here, so the stage isn't late by the pipe's backlog.
+        self._call("note_startup", stage, time.time())
+
+    def query_stats(self, timeout=5.0):
+        # Answered through poll(), so the GUI tick must be running.
+        self.stats_ready.clear()
+        self._send(("stats",))
+        if self.stats_ready.wait(timeout):
+            return self.stats
+        return None
+
+    def close(self, timeout=10.0):
+        # The child stops its sessions and flushes the logs before exiting.
+        self._send(("stop",))
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.stopped = True
+        self.conn.close()
+
+    def poll(self):
+        if self.stopped:
+            return
+        started = time.perf_counter()
+        lines = 0
+        try:
+            while self.conn.poll():
+                for message in self.conn.recv():
+                    lines += self._handle(message)
+                if time.perf_counter() - started >= self.frame_budget:
+                    break
+        except (EOFError, OSError):
+            self._lost()
+            return
+        if lines:
+            self._send(("ack", lines, time.perf_counter() - started))
+        self.ui.after(50, self.poll)
+
+    def _handle(self, message):
+        kind = message[0]
+        if kind == "ui":
+            _, name, args = message
+            getattr(self.ui, name)(*args)
+            return len(args[0]) if name == "insert_logs" else 0
+        if kind == "state":
+            _, self.logging_active, self.ports, self.alive = message
+        elif kind == "stats":
+            self.stats = message[1]
+            self.stats_ready.set()
+        return 0
+
+    def _lost(self):
+        self.stopped = True
+        self.logging_active = False
+        self.alive = ()
+        self.ui.set_title("AEPL Logger (capture stopped)")
+        self.ui.insert_log(
+            f"The capture process exited (code {self.process.exitcode}); restart the logger."
+        )
+
+    def _call(self, name, *args):
+        self._send(("call", name, args))
+
+    def _send(self, message):
+        if self.stopped:
+            return
+        with self.send_lock:
+            try:
+                self.conn.send(message)
+            except (OSError, ValueError):
+                pass
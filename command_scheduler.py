@@ -0,0 +1,200 @@
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from device_validation import response_prefix
+from metrics import Histogram
+
+URGENT = 0  # typed or pasted by the user
+NORMAL = 1  # macros and fleet runs
+BACKGROUND = 2  # IMEI probing, trigger reactions
+
+
+class CommandResult:
+    __slots__ = ("command", "response", "sent", "latency")
+
+    def __init__(self, command, response, sent, latency):
+        self.command = command
+        self.response = response
+        self.sent = sent
+        self.latency = latency
+
+    def __repr__(self):
+        return f"CommandResult({self.command!r}, {self.response!r}, {self.latency * 1000:.1f} ms)"
+
+
+class QueuedCommand:
+    __slots__ = ("priority", "seq", "command", "expect", "timeout", "not_before", "sent", "future")
+
+    def __init__(self, priority, seq, command, expect, timeout, not_before):
+        self.priority = priority
+        self.seq = seq
+        self.command = command
+        self.expect = expect
+        self.timeout = timeout
+        self.not_before = not_before
+        self.sent = None
+        self.future = Future()
+
+
+class CommandScheduler:
+    # Owns the write side of one port. Commands from every source are
+    # written one at a time, in priority order, at least `gap` apart. A
+    # command that has a reply is matched to the first line containing its
+    # STATUS#<key># prefix, so several GETs can be in flight at once and
+    # each caller gets its own reply. Futures complete on the reader thread,
+    # so done-callbacks must not block.
+    def __init__(self, write, gap=0.05, timeout=10.0, name="commands"):
+        self.write = write
+        self.gap = gap
+        self.timeout = timeout
+        self.name = name
+        self.condition = threading.Condition()
+        self.counter = itertools.count()
+        self.queue = []
+        self.in_flight = []
+        self.last_write = 0.0
+        self.running = False
+        self.thread = None
+
+        self.latency = Histogram()
+        self.sent = 0
+        self.timeouts = 0
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self, reason="port closed"):
+        with self.condition:
+            self.running = False
+            pending = self.queue + self.in_flight
+            self.queue = []
+            self.in_flight = []
+            self.condition.notify()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(1.0)
+        for entry in pending:
+            if not entry.future.cancel() and not entry.future.done():
+                entry.future.set_exception(ConnectionError(f"{entry.command}: {reason}"))
+
+    def submit(self, command, priority=NORMAL, expect=True, timeout=None, delay=0.0, callback=None):
+        # expect=True waits for the STATUS# reply to a GET, a string waits
+        # for that text, and False completes once written. SETs don't wait
+        # by default: not every firmware answers them, and an unanswered SET
+        # would take the reply meant for a later GET of the same key.
+        if expect is True:
+            expect = response_prefix(command) if "*GET#" in command else None
+        entry = QueuedCommand(
+            priority,
+            next(self.counter),
+            command,
+            expect or None,
+            self.timeout if timeout is None else timeout,
+            time.monotonic() + delay,
+        )
+        if callback:
+            entry.future.add_done_callback(callback)
+        with self.condition:
+            if self.running:
+                self.queue.append(entry)
+                self.condition.notify()
+                return entry.future
+        entry.future.set_exception(ConnectionError(f"{command}: port not open"))
+        return entry.future
+
+    def query(self, commands, priority=NORMAL, timeout=None):
+        # Pipelines the commands and returns their replies in order; a
+        # command that failed or timed out gives None.
+        futures = [self.submit(command, priority, timeout=timeout) for command in commands]
+        responses = []
+        for future in futures:
+            try:
+                responses.append(future.result().response)
+            except Exception:
+                responses.append(None)
+        return responses
+
+    def depth(self):
+        return len(self.queue) + len(self.in_flight)
+
+    def on_line(self, line, timestamp=None):
+        if not self.in_flight:
+            return
+        with self.condition:
+            for entry in self.in_flight:
+                if entry.expect in line:
+                    self.in_flight.remove(entry)
+                    break
+            else:
+                return
+        latency = time.monotonic() - entry.sent
+        self.latency.observe(latency)
+        if not entry.future.done():
+            entry.future.set_result(CommandResult(entry.command, line, entry.sent, latency))
+
+    def _run(self):
+        while True:
+            with self.condition:
+                entry = None
+                while self.running:
+                    expired = self._expire(time.monotonic())
+                    if expired:
+                        break
+                    entry, wait = self._next(time.monotonic())
+                    if entry is not None:
+                        self.queue.remove(entry)
+                        break
+                    self.condition.wait(wait)
+                if not self.running:
+                    return
+            if entry is None:
+                for stale in expired:
+                    if not stale.future.done():
+                        stale.future.set_exception(
+                            TimeoutError(f"No {stale.expect} reply to {stale.command}")
+                        )
+                continue
+
+            if not entry.future.set_running_or_notify_cancel():
+                continue
+            try:
+                self.write(entry.command)
+            except Exception as e:
+                entry.future.set_exception(e)
+                continue
+            sent = time.monotonic()
+            self.sent += 1
+            with self.condition:
+                self.last_write = sent
+                if entry.expect:
+                    entry.sent = sent
+                    self.in_flight.append(entry)
+            if not entry.expect:
+                entry.future.set_result(CommandResult(entry.command, None, sent, 0.0))
+
+    def _expire(self, now):
+        expired = [e for e in self.in_flight if now - e.sent >= e.timeout]
+        for entry in expired:
+            self.in_flight.remove(entry)
+        self.timeouts += len(expired)
+        return expired
+
+    def _next(self, now):
+        # The best command that is due, if the gap since the last write has
+        # passed; otherwise how long to sleep before looking again.
+        due = [e for e in self.queue if e.not_before <= now and not e.future.cancelled()]
+        for entry in [e for e in self.queue if e.future.cancelled()]:
+            self.queue.remove(entry)
+        wakeups = [e.not_before for e in self.queue if e.not_before > now]
+        wakeups += [e.sent + e.timeout for e in self.in_flight]
+        if due:
+            ready_at = self.last_write + self.gap
+            if ready_at <= now:
+                return min(due, key=lambda e: (e.priority, e.seq)), None
+            wakeups.append(ready_at)
+        return None, (max(min(wakeups) - now, 0.001) if wakeups else None)
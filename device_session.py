@@ -0,0 +1,390 @@
+import glob
+import os
+import re
+import threading
+import time
+import platform
+from datetime import datetime
+from serial_reader import ANSI_ESCAPE, LineFramer, TimestampCache, ReaderStats
+from display_queue import DisplayQueue
+from log_index import index_path
+from log_sink import RotatingLogSink
+from raw_capture import TX, CaptureWriter, capture_path
+from packet_store import PacketRecorder
+from triggers import TriggerRunner
+from command_scheduler import BACKGROUND, NORMAL, CommandScheduler
+
+SPOOL_NAME = re.compile(
+    r"^\.spool_(.+)_(\d{8}_\d{6})(?:_p(\d+))?(_\d{4}\.log(?:\.gz|\.zst)?)(\.part)?$"
+)
+
+
+def process_alive(pid):
+    # Only checked on POSIX. Elsewhere a live logger's open spool can't be
+    # renamed anyway, so recover_spools skips it.
+    if os.name != "posix":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def recover_spools(log_root, publish):
+    # Spool segments left by a logger that died during IMEI detection become
+    # ordinary logs under their port name, as if no IMEI had come. Spools of
+    # a logger that is still running are left alone.
+    recovered = []
+    for path in sorted(glob.glob(os.path.join(log_root, "*", ".spool_*"))):
+        match = SPOOL_NAME.match(os.path.basename(path))
+        if not match:
+            continue
+        port_id, timestamp, pid, suffix, part = match.groups()
+        if pid and process_alive(int(pid)):
+            continue
+        segment_path = path[: -len(part)] if part else path
+        new_path = os.path.join(
+            os.path.dirname(path), f"serial_log_{port_id}_{platform.node()}_{timestamp}{suffix}"
+        )
+        try:
+            os.replace(path, new_path)
+            if os.path.exists(index_path(segment_path)):
+                os.replace(index_path(segment_path), index_path(new_path))
+        except OSError:
+            continue
+        publish(new_path)
+        recovered.append(new_path)
+    return recovered
+
+
+class DeviceSession:
+    IMEI_COMMANDS = ["*GET#IMEI#", "*GET,IMEI#", "CMN *GET#IMEI#"]
+    imei_pattern = re.compile(r"IMEI[:#\s]*(\d{14,17})", re.IGNORECASE)
+    imei_window = 7.0
+    spool_limit = 4 * 1024 * 1024
+
+    def __init__(self, manager, serial_port):
+        self.manager = manager
+        self.serial_port = serial_port
+        self.port_name = serial_port.port
+        self.writer = manager.writers.assign()
+        self.log_queue = DisplayQueue(maxsize=5000, policy=manager.display_policy)
+        self.reader_stats = ReaderStats()
+        self.thread = None
+        self.logging_active = False
+        self.closed = False
+        self.log_file = None
+        self.spool_bytes = 0
+        self.imei = None
+        self.detecting_imei = False
+        self.detect_lock = threading.Lock()
+        self.line_listeners = ()
+        self.capture = None
+        self.packets = None
+        self.commands = CommandScheduler(
+            self._write, gap=manager.command_gap, name=f"commands {self.port_name}"
+        )
+        self.imei_requests = []
+        self.triggers = None
+        if manager.triggers:
+            self.triggers = TriggerRunner(manager.triggers, self)
+
+    @property
+    def is_alive(self):
+        return (
+            self.logging_active
+            and self.serial_port is not None
+            and self.serial_port.is_open
+        )
+
+    def _port_id(self):
+        # Replay sources are named like "replay:t.cap"; keep file names plain.
+        return re.sub(r"[^\w.-]+", "_", os.path.basename(self.port_name)) or "port"
+
+    def _generate_log_path(self, device_id):
+        user = platform.node()
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        filename = f"serial_log_{device_id}_{user}_{timestamp}"
+        return os.path.join(self.manager._get_log_folder(), filename)
+
+    def _open_session_log(self, base_path, hold=False):
+        return RotatingLogSink(
+            base_path,
+            max_bytes=self.manager.segment_bytes,
+            max_seconds=self.manager.segment_seconds,
+            compression=self.manager.compression,
+            on_segment_closed=self.manager.publish_segment,
+            hold=hold,
+        )
+
+    def _open_spool(self):
+        # Until the IMEI is known, lines go to a per-session spool with their
+        # own timestamps. It is renamed to the final log, never rewritten.
+        # The pid tells a later start whether the spool's logger is still running.
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        base_path = os.path.join(
+            self.manager._get_log_folder(),
+            f".spool_{self._port_id()}_{timestamp}_p{os.getpid()}",
+        )
+        self.spool_bytes = 0
+        return self._open_session_log(base_path, hold=True)
+
+    def _finish_detection(self, imei, spool=None, closing=False):
+        with self.detect_lock:
+            if not self.detecting_imei or (spool is not None and spool is not self.log_file):
+                return
+            self.detecting_imei = False
+            for request in self.imei_requests:
+                request.cancel()
+            self.imei_requests = []
+            if imei:
+                self.imei = imei
+            elif self.logging_active:
+                self.log_queue.put(
+                    f"No IMEI from {self.port_name}, logging under the port name."
+                )
+            log_file = self.log_file
+            base_path = self._generate_log_path(imei or self._port_id())
+            if closing:
+                # Close first so the rename doesn't leave an empty segment.
+                self.writer.call(log_file.close)
+            self.writer.call(lambda: log_file.rebase(base_path))
+
+    def _packet_folder(self):
+        device_id = self.imei or self._port_id()
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        return os.path.join(
+            self.manager._get_log_folder(), f"packets_{device_id}_{timestamp}"
+        )
+
+    def start(self):
+        if self.logging_active:
+            return
+        if not self.serial_port.is_open:
+            self.serial_port.open()
+
+        self.logging_active = True
+        self.closed = False
+        if self.imei:
+            self.log_file = self._open_session_log(self._generate_log_path(self.imei))
+        else:
+            self.log_file = self._open_spool()
+        self.detecting_imei = self.imei is None
+        if self.manager.raw_capture:
+            self.capture = CaptureWriter(
+                capture_path(self.manager._get_log_folder(), self.port_name), self.port_name
+            )
+        if self.manager.decode_packets:
+            self.packets = PacketRecorder(self.writer, self._packet_folder)
+            self.add_line_listener(self.packets.on_line)
+        if self.manager.tap:
+            self.add_line_listener(self._tap_line)
+        self.add_line_listener(self.commands.on_line)
+        self.commands.start()
+        self.thread = threading.Thread(
+            target=self.read_serial, name=f"reader {self.port_name}", daemon=True
+        )
+        self.thread.start()
+        if self.detecting_imei:
+            self.detect_and_send_imei_command()
+
+    def stop(self):
+        self.logging_active = False
+        self.commands.stop()
+        self.remove_line_listener(self.commands.on_line)
+        if self.serial_port and self.serial_port.is_open:
+            self.serial_port.close()
+        if (
+            self.thread
+            and self.thread.is_alive()
+            and self.thread is not threading.current_thread()
+        ):
+            self.thread.join(1.0)
+        self._finish_detection(None, closing=True)
+        if self.log_file:
+            self.writer.close(self.log_file)
+            self.log_file = None
+        if self.capture:
+            self.capture.close()
+            self.capture = None
+        if self.packets:
+            self.remove_line_listener(self.packets.on_line)
+            self.packets.close()
+            self.log_queue.put(self.packets.summary())
+            self.packets = None
+        self.remove_line_listener(self._tap_line)
+        if self.triggers and self.triggers.summary():
+            self.log_queue.put(self.triggers.summary())
+        self.writer.flush()
+        self.closed = True
+        self.log_queue.put("Logging stopped.")
+
+    def add_line_listener(self, listener):
+        # Listeners run on the reader thread for every line and must not block.
+        # Bound methods are new objects on every access, so compare with ==.
+        if listener not in self.line_listeners:
+            self.line_listeners = self.line_listeners + (listener,)
+
+    def remove_line_listener(self, listener):
+        self.line_listeners = tuple(l for l in self.line_listeners if l != listener)
+
+    def _tap_line(self, line, timestamp):
+        self.manager.tap.publish_line(self.port_name, line, timestamp)
+
+    def send_command(self, command, priority=NORMAL, **options):
+        # Every write goes through the scheduler; the returned future gives
+        # the command's STATUS# reply and latency.
+        return self.commands.submit(command, priority, **options)
+
+    def _write(self, command):
+        if not (self.serial_port and self.serial_port.is_open):
+            raise ConnectionError(f"{self.port_name} is not open")
+        data = (command + "\n").encode()
+        self.serial_port.write(data)
+        capture = self.capture
+        if capture:
+            capture.record(data, TX)
+
+    def detect_and_send_imei_command(self):
+        # Variants go out 2 s apart; the ones still queued are dropped as
+        # soon as an IMEI shows up.
+        self.imei_requests = [
+            self.send_command(cmd, BACKGROUND, expect=False, delay=i * 2.0)
+            for i, cmd in enumerate(self.IMEI_COMMANDS)
+        ]
+        spool = self.log_file
+        self.manager.after(
+            int(self.imei_window * 1000), lambda: self._finish_detection(None, spool)
+        )
+
+    def read_serial(self):
+        if self.manager.reader_engine == "poll":
+            self._read_serial_polling()
+        else:
+            self._read_serial_event()
+        self.log_queue.put(self.reader_stats.summary())
+
+        if self.logging_active:
+            # The port failed underneath us; release it so the monitor can
+            # pick the device up again.
+            self.stop()
+
+    def _read_serial_event(self):
+        framer = LineFramer()
+        clock = TimestampCache()
+        stats = self.reader_stats
+        port = self.serial_port
+        port.timeout = self.manager.read_timeout
+        capture = self.capture
+        tap = self.manager.tap
+        stats.start()
+
+        while self.logging_active:
+            try:
+                # Blocks in select() until data arrives or the timeout expires.
+                data = port.read(port.in_waiting or 1)
+                if not data:
+                    continue
+                if capture:
+                    capture.record(data)
+                if tap:
+                    tap.publish_raw(self.port_name, data)
+
+                timestamp = clock.now()
+                lines = framer.feed(data)
+                for line in lines:
+                    self._handle_line(line, timestamp)
+                stats.record(len(data), len(lines))
+            except Exception as e:
+                if self.logging_active:
+                    self.log_queue.put(f"Error: {e}")
+                break
+
+        # Whatever came after the last newline is still a line. stop() joins
+        # this thread before it closes the log file, so it reaches the sink.
+        lines = framer.flush()
+        if lines:
+            timestamp = clock.now()
+            for line in lines:
+                self._handle_line(line, timestamp)
+            stats.record(0, len(lines))
+        stats.stop()
+
+    def _read_serial_polling(self):
+        stats = self.reader_stats
+        capture = self.capture
+        tap = self.manager.tap
+        stats.start()
+        buffer = ""
+
+        while self.logging_active:
+            try:
+                if self.serial_port.in_waiting:
+                    data = self.serial_port.read(self.serial_port.in_waiting)
+                    if capture:
+                        capture.record(data)
+                    if tap:
+                        tap.publish_raw(self.port_name, data)
+                    raw_data = data.decode("utf-8", errors="ignore")
+                    buffer += raw_data
+                    lines = buffer.splitlines(keepends=False)
+                    if raw_data and not raw_data.endswith("\n"):
+                        buffer = lines.pop() if lines else buffer
+                    else:
+                        buffer = ""
+
+                    count = 0
+                    for line in lines:
+                        clean_line = ANSI_ESCAPE.sub("", line).rstrip()
+                        if not clean_line:
+                            continue
+
+                        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+                        self._handle_line(clean_line, timestamp)
+                        count += 1
+                    stats.record(len(raw_data), count)
+
+            except Exception as e:
+                if self.logging_active:
+                    self.log_queue.put(f"Error: {e}")
+                break
+            time.sleep(0.01)
+
+        clean_line = ANSI_ESCAPE.sub("", buffer).rstrip()
+        if clean_line:
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+            self._handle_line(clean_line, timestamp)
+            stats.record(0, 1)
+        stats.stop()
+
+    def _handle_line(self, clean_line, timestamp):
+        entry = f"[{timestamp}] - {clean_line}\n"
+        log_file = self.log_file
+        if log_file is not None:
+            self.writer.write(log_file, entry)
+
+        if self.detecting_imei:
+            match = self.imei_pattern.search(clean_line)
+            self.spool_bytes += len(entry)
+            if match:
+                self._finish_detection(match.group(1))
+            elif self.spool_bytes >= self.spool_limit:
+                self._finish_detection(None)
+
+        triggers = self.triggers
+        if triggers is not None:
+            try:
+                clean_line = triggers.on_line(clean_line, timestamp)
+            except Exception as e:
+                self.log_queue.put(f"Trigger error: {e}")
+
+        for listener in self.line_listeners:
+            try:
+                listener(clean_line, timestamp)
+            except Exception as e:
+                self.log_queue.put(f"Line listener error: {e}")
+
+        self.log_queue.put(clean_line)
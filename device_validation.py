@@ -0,0 +1,209 @@
+import json
+import os
+import re
+import threading
+import time
+
+COMMAND_KEY = re.compile(r"\*(?:GET|SET)#([^#]+)#")
+
+
+def response_prefix(command):
+    match = COMMAND_KEY.search(command)
+    return f"STATUS#{match.group(1)}#" if match else None
+
+
+class ValidationRule:
+    def __init__(self, command, spec):
+        self.command = command
+        self.spec = spec
+        self.prefix = response_prefix(command)
+        self.set_command = spec.get("set_command")
+
+        if "expected_regex" in spec:
+            pattern = re.compile(spec["expected_regex"])
+            self.expected = f"/{pattern.pattern}/"
+            self.matches = lambda line: pattern.search(line) is not None
+        elif "expected_range" in spec:
+            low, high = spec["expected_range"]
+            field = spec.get("field", 0)
+            prefix = self.prefix or ""
+            self.expected = f"{prefix}[{field}] in {low}..{high}"
+
+            def in_range(line):
+                fields = line[len(prefix):].split("#") if line.startswith(prefix) else ()
+                try:
+                    return low <= float(fields[field]) <= high
+                except (IndexError, ValueError):
+                    return False
+
+            self.matches = in_range
+        else:
+            expected = spec["expected"]
+            self.expected = expected
+            self.matches = lambda line: expected in line
+
+        # The reply we wait for; rules without a recognisable GET fall back
+        # to waiting for the expectation itself, as before.
+        self.reply = self.prefix or (spec.get("expected") or "")
+
+
+class ValidationProfile:
+    def __init__(self, name, spec):
+        self.name = name
+        self.detect = [re.compile(pattern) for pattern in spec.get("detect", ())]
+        self.rules = {
+            command: ValidationRule(command, rule)
+            for command, rule in spec.items()
+            if isinstance(rule, dict)
+        }
+
+
+class ValidationRules:
+    def __init__(self, profiles):
+        self.profiles = {name: ValidationProfile(name, spec) for name, spec in profiles.items()}
+        # Most commands appear in several profiles; index them once so a
+        # response costs a single dict lookup.
+        self.by_command = {}
+        for profile in self.profiles.values():
+            for command, rule in profile.rules.items():
+                self.by_command.setdefault(command, []).append((profile.name, rule))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def names(self):
+        return list(self.profiles)
+
+
+class ValidationCache:
+    def __init__(self, path, max_age=24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def profile(self, imei):
+        with self.lock:
+            return self.entries.get(imei, {}).get("profile")
+
+    def set_profile(self, imei, profile):
+        with self.lock:
+            entry = self.entries.setdefault(imei, {"profile": None, "confirmed": {}})
+            if entry["profile"] != profile:
+                entry["profile"] = profile
+                entry["confirmed"] = {}
+                self.save()
+
+    def confirmed(self, imei, command):
+        with self.lock:
+            hit = self.entries.get(imei, {}).get("confirmed", {}).get(command)
+        if hit and time.time() - hit["at"] < self.max_age:
+            return hit["response"]
+        return None
+
+    def confirm(self, imei, command, response):
+        with self.lock:
+            entry = self.entries.setdefault(imei, {"profile": None, "confirmed": {}})
+            entry["confirmed"][command] = {"response": response, "at": time.time()}
+            self.save()
+
+    def invalidate(self, imei, command):
+        with self.lock:
+            if self.entries.get(imei, {}).get("confirmed", {}).pop(command, None):
+                self.save()
+
+
+class DeviceValidator:
+    def __init__(self, rules, imei=None, cache=None, profile=None, revalidate=False):
+        self.rules = rules
+        self.imei = imei
+        self.cache = cache if imei else None
+        self.revalidate = revalidate
+        if profile is None and self.cache:
+            profile = self.cache.profile(imei)
+        elif profile in rules.profiles and self.cache:
+            # A profile chosen by the user replaces whatever was detected.
+            self.cache.set_profile(imei, profile)
+        self.profile = profile if profile in rules.profiles else None
+        self.candidates = [self.profile] if self.profile else rules.names()
+        self.skipped = []
+        self.undecided = []
+
+    def profiles_for(self, command):
+        entries = self.rules.by_command.get(command, ())
+        return [name for name, _ in entries if name in self.candidates]
+
+    def rule_for(self, command):
+        entries = self.rules.by_command.get(command)
+        if not entries:
+            return None
+        matching = [rule for name, rule in entries if name in self.candidates]
+        if not matching:
+            return None
+        # Profiles that define a command the same way give the same verdict.
+        # When they differ and neither the replies nor a detect pattern told
+        # them apart, only the user can say which one applies.
+        if any(rule.spec != matching[0].spec for rule in matching[1:]):
+            self.undecided.append(command)
+            return None
+        return matching[0]
+
+    def observe(self, line):
+        if self.profile:
+            return
+        for name in self.candidates:
+            if any(pattern.search(line) for pattern in self.rules.profiles[name].detect):
+                self._resolve([name])
+                return
+
+    def replied(self, rule):
+        # Only profiles that define this exact command (e.g. the "CMN "
+        # dialect of the 2G units) can have produced the reply.
+        if self.profile:
+            return
+        answering = [name for name, _ in self.rules.by_command[rule.command]]
+        self._resolve([name for name in self.candidates if name in answering])
+
+    def _resolve(self, candidates):
+        if not candidates:
+            return
+        self.candidates = candidates
+        if len(candidates) == 1:
+            self.profile = candidates[0]
+            if self.cache:
+                self.cache.set_profile(self.imei, self.profile)
+
+    def cached_response(self, rule):
+        if self.cache is None or self.revalidate:
+            return None
+        response = self.cache.confirmed(self.imei, rule.command)
+        if response is not None:
+            self.skipped.append(rule.command)
+        return response
+
+    def record(self, rule, response, passed):
+        if self.cache is None:
+            return
+        if passed:
+            self.cache.confirm(self.imei, rule.command, response)
+        else:
+            self.cache.invalidate(self.imei, rule.command)
@@ -0,0 +1,86 @@
+import threading
+from collections import deque
+
+
+class DisplayQueue:
+    POLICIES = ("drop", "sample", "coalesce")
+
+    def __init__(self, maxsize=5000, policy="drop", sample_every=10, high_water=0.8):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.sample_every = sample_every
+        self.sample_threshold = int(maxsize * high_water)
+
+        self.items = deque()
+        self.lock = threading.Lock()
+        self.skipped = 0
+        self.latest_skipped = None
+        self.sample_counter = 0
+
+        self.dropped_total = 0
+        self.accepted_total = 0
+        self.max_depth = 0
+
+    def put(self, message):
+        with self.lock:
+            depth = len(self.items)
+
+            if self.policy == "sample" and depth >= self.sample_threshold:
+                self.sample_counter += 1
+                if self.sample_counter % self.sample_every:
+                    self._skip(message)
+                    return False
+
+            if depth >= self.maxsize:
+                self._skip(message)
+                return False
+
+            if self.skipped:
+                self.items.append(self._marker())
+            self.items.append(message)
+            self.accepted_total += 1
+            if len(self.items) > self.max_depth:
+                self.max_depth = len(self.items)
+            return True
+
+    def drain(self, max_items=None):
+        with self.lock:
+            count = len(self.items)
+            if max_items is not None:
+                count = min(count, max_items)
+            messages = [self.items.popleft() for _ in range(count)]
+            if not self.items and self.skipped:
+                messages.append(self._marker())
+            return messages
+
+    def qsize(self):
+        return len(self.items)
+
+    def empty(self):
+        return not self.items and not self.skipped
+
+    def stats(self):
+        return {
+            "depth": len(self.items),
+            "maxsize": self.maxsize,
+            "max_depth": self.max_depth,
+            "dropped": self.dropped_total,
+            "accepted": self.accepted_total,
+            "policy": self.policy,
+        }
+
+    def _skip(self, message):
+        self.skipped += 1
+        self.dropped_total += 1
+        self.latest_skipped = message
+
+    def _marker(self):
+        if self.policy == "coalesce" and self.latest_skipped is not None:
+            marker = f"... {self.skipped} lines skipped, latest: {self.latest_skipped}"
+        else:
+            marker = f"... {self.skipped} lines skipped ..."
+        self.skipped = 0
+        self.latest_skipped = None
+        return marker
@@ -0,0 +1,319 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from xml.etree import ElementTree
+from device_validation import DeviceValidator, ValidationCache, ValidationRules
+from macro_engine import MacroRunner, compile_macro
+
+
+class DeviceResult:
+    def __init__(self, port, imei):
+        self.port = port
+        self.imei = imei
+        self.status = "pending"
+        self.error = None
+        self.duration = 0.0
+        self.steps = []
+        self.mismatches = []
+        self.corrections = []
+        self.failed_waits = []
+        self.profile = None
+        self.skipped = []
+        self.unvalidated = []
+
+    @property
+    def passed(self):
+        return self.status == "passed"
+
+    def to_dict(self):
+        return {
+            "port": self.port,
+            "imei": self.imei,
+            "status": self.status,
+            "profile": self.profile,
+            "error": self.error,
+            "duration_s": round(self.duration, 3),
+            "mismatches": self.mismatches,
+            "corrections": self.corrections,
+            "failed_waits": self.failed_waits,
+            "skipped_confirmed": self.skipped,
+            "unvalidated": self.unvalidated,
+            "steps": [
+                {
+                    "line": step.line_no,
+                    "step": step.text,
+                    "op": step.op,
+                    "result": step.result,
+                    "duration_ms": round(step.duration * 1000, 1),
+                }
+                for step in self.steps
+            ],
+        }
+
+
+def run_on_session(
+    program, session, timeout, rules=None, cache=None, revalidate=False, profile=None
+):
+    result = DeviceResult(session.port_name, session.imei)
+    validator = None
+    if rules is not None:
+        validator = DeviceValidator(rules, session.imei, cache, profile, revalidate)
+    runner = MacroRunner(
+        program,
+        send=session.send_command,
+        log=lambda message: session.log_queue.put(message),
+        validator=validator,
+    )
+    timer = threading.Timer(timeout, runner.cancel) if timeout else None
+
+    session.add_line_listener(runner.on_line)
+    started = time.monotonic()
+    try:
+        if timer:
+            timer.start()
+        runner.run()
+    except Exception as e:
+        result.error = str(e)
+    finally:
+        if timer:
+            timer.cancel()
+        session.remove_line_listener(runner.on_line)
+    result.duration = time.monotonic() - started
+
+    result.steps = runner.steps
+    result.mismatches = runner.mismatches
+    result.corrections = runner.corrections
+    result.failed_waits = [f"line {step.line_no}: {step.text}" for step in runner.timed_out_waits]
+    if validator:
+        result.profile = validator.profile
+        result.skipped = validator.skipped
+        result.unvalidated = validator.undecided
+    if result.error:
+        result.status = "error"
+    elif runner.cancelled:
+        result.status = "timeout"
+    elif result.mismatches or result.failed_waits or result.unvalidated:
+        result.status = "failed"
+    else:
+        result.status = "passed"
+    result.imei = session.imei
+    return result
+
+
+def run_fleet(
+    program, sessions, timeout=120, rules=None, cache=None, revalidate=False, profile=None
+):
+    results = [None] * len(sessions)
+
+    def worker(index, session):
+        results[index] = run_on_session(
+            program, session, timeout, rules, cache, revalidate, profile
+        )
+
+    threads = [
+        threading.Thread(target=worker, args=(i, session), daemon=True)
+        for i, session in enumerate(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def write_json(path, program, results, wall_time):
+    report = {
+        "macro": program.name,
+        "wall_time_s": round(wall_time, 3),
+        "passed": sum(result.passed for result in results),
+        "failed": sum(not result.passed for result in results),
+        "devices": [result.to_dict() for result in results],
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def write_csv(path, program, results, wall_time):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["macro", "port", "imei", "status", "device_duration_s", "line", "step",
+             "result", "step_duration_ms", "mismatches", "corrections"]
+        )
+        for result in results:
+            details = [
+                f"{result.port}", f"{result.imei or ''}", result.status,
+                f"{result.duration:.3f}",
+            ]
+            mismatches = "; ".join(
+                [
+                    f"{m['command']} expected {m['expected']} got {m['received']}"
+                    for m in result.mismatches
+                ]
+                + [f"{command} not validated" for command in result.unvalidated]
+            )
+            corrections = "; ".join(result.corrections)
+            if not result.steps:
+                writer.writerow([program.name, *details, "", "", "", "", mismatches, corrections])
+            for step in result.steps:
+                writer.writerow(
+                    [program.name, *details, step.line_no, step.text, step.result,
+                     f"{step.duration * 1000:.1f}", mismatches, corrections]
+                )
+
+
+def write_junit(path, program, results, wall_time):
+    suite = ElementTree.Element(
+        "testsuite",
+        name=program.name,
+        tests=str(len(results)),
+        failures=str(sum(result.status in ("failed", "timeout") for result in results)),
+        errors=str(sum(result.status == "error" for result in results)),
+        time=f"{wall_time:.3f}",
+    )
+    for result in results:
+        case = ElementTree.SubElement(
+            suite,
+            "testcase",
+            classname=program.name,
+            name=f"{result.port} ({result.imei or 'unknown IMEI'})",
+            time=f"{result.duration:.3f}",
+        )
+        if result.status == "error":
+            ElementTree.SubElement(case, "error", message=result.error or "")
+        elif result.status != "passed":
+            lines = [
+                f"{m['command']}: expected {m['expected']}, got {m['received']}"
+                for m in result.mismatches
+            ]
+            lines += [f"no response: {wait}" for wait in result.failed_waits]
+            lines += [
+                f"not validated, choose --device-profile: {command}"
+                for command in result.unvalidated
+            ]
+            failure = ElementTree.SubElement(case, "failure", message=result.status)
+            failure.text = "\n".join(lines)
+        output = ElementTree.SubElement(case, "system-out")
+        output.text = "\n".join(
+            [f"correction sent: {c}" for c in result.corrections]
+            + [
+                f"line {step.line_no}: {step.text} -> {step.result} "
+                f"in {step.duration * 1000:.1f} ms"
+                for step in result.steps
+            ]
+        )
+    ElementTree.ElementTree(suite).write(path, encoding="utf-8", xml_declaration=True)
+
+
+REPORT_WRITERS = {"json": write_json, "csv": write_csv, "junit": write_junit}
+
+
+def wait_for_sessions(manager, count, devices, discover_seconds, settle_seconds):
+    deadline = time.monotonic() + discover_seconds
+    while time.monotonic() < deadline:
+        sessions = [s for s in list(manager.sessions.values()) if s.is_alive]
+        if devices:
+            sessions = [s for s in sessions if s.port_name in devices]
+        if count and len(sessions) >= count:
+            break
+        time.sleep(0.2)
+
+    sessions = [s for s in list(manager.sessions.values()) if s.is_alive]
+    if devices:
+        sessions = [s for s in sessions if s.port_name in devices]
+
+    # Let IMEI detection finish so its GET commands don't interleave with
+    # the macro's.
+    deadline = time.monotonic() + settle_seconds
+    while time.monotonic() < deadline and any(s.detecting_imei for s in sessions):
+        time.sleep(0.2)
+    return sorted(sessions, key=lambda s: s.port_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run one .ttl macro on every attached TCU at once"
+    )
+    parser.add_argument("macro")
+    parser.add_argument("--devices", nargs="*", help="only use these ports")
+    parser.add_argument("--count", type=int, default=0, help="wait for this many devices")
+    parser.add_argument("--discover-seconds", type=float, default=10.0)
+    parser.add_argument("--settle-seconds", type=float, default=8.0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="per device, seconds")
+    parser.add_argument("--validation", default="Assets/device.json")
+    parser.add_argument(
+        "--revalidate", action="store_true", help="ignore GETs already confirmed per IMEI"
+    )
+    parser.add_argument(
+        "--device-profile", help="profile in the validation file, instead of detecting it"
+    )
+    parser.add_argument("--report", default="fleet_report.json")
+    parser.add_argument("--format", choices=sorted(REPORT_WRITERS))
+    args = parser.parse_args(argv)
+
+    from headless import HeadlessFrontend
+    from serial_handler import SerialManager
+
+    with open(args.macro, "r") as f:
+        program = compile_macro(f.read(), os.path.basename(args.macro))
+
+    rules = None
+    if args.validation and os.path.exists(args.validation):
+        rules = ValidationRules.load(args.validation)
+        if args.device_profile and args.device_profile not in rules.profiles:
+            print(
+                f"Unknown device profile {args.device_profile!r}; "
+                f"{args.validation} has {', '.join(rules.names())}",
+                file=sys.stderr,
+            )
+            return 2
+
+    report_format = args.format or {
+        ".csv": "csv", ".xml": "junit"
+    }.get(os.path.splitext(args.report)[1], "json")
+
+    manager = SerialManager(HeadlessFrontend(status_interval=0))
+    sessions = wait_for_sessions(
+        manager, args.count, args.devices, args.discover_seconds, args.settle_seconds
+    )
+    # A port the running logger holds can't be opened here; running on the
+    # rest would quietly leave those devices out of the report.
+    busy = sorted(
+        port for port in manager.busy_ports - {s.port_name for s in sessions}
+        if not args.devices or port in args.devices
+    )
+    if busy:
+        print(
+            f"In use by another process (is the logger running?): {', '.join(busy)}",
+            file=sys.stderr,
+        )
+        manager.close()
+        return 2
+    if not sessions:
+        print("No devices found.", file=sys.stderr)
+        return 2
+
+    print(f"Running {program.name} on {len(sessions)} device(s)...", flush=True)
+    started = time.monotonic()
+    cache = ValidationCache(os.path.join("logs", "validation_cache.json"))
+    results = run_fleet(
+        program, sessions, args.timeout, rules, cache, args.revalidate, args.device_profile
+    )
+    wall_time = time.monotonic() - started
+
+    REPORT_WRITERS[report_format](args.report, program, results, wall_time)
+    for result in results:
+        print(f"{result.port} {result.imei or '-'}: {result.status} in {result.duration:.1f}s")
+    print(f"Wall time {wall_time:.1f}s, report written to {args.report}")
+
+    manager.stop_logging()
+    manager.writers.stop()
+    return 0 if all(result.passed for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
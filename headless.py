@@ -0,0 +1,244 @@
+import argparse
+import heapq
+import itertools
+import signal
+import sys
+import threading
+import time
+from serial_handler import SerialManager
+from metrics import dump_profile
+from triggers import load_triggers
+
+
+class Scheduler:
+    def __init__(self):
+        self.timers = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def after(self, ms, func):
+        with self.condition:
+            heapq.heappush(
+                self.timers, (time.monotonic() + ms / 1000, next(self.counter), func)
+            )
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join(2.0)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    if not self.timers:
+                        self.condition.wait()
+                        continue
+                    delay = self.timers[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self.condition.wait(delay)
+                if not self.running:
+                    return
+                _, _, func = heapq.heappop(self.timers)
+
+            try:
+                func()
+            except Exception as e:
+                print(f"Scheduled task error: {e}", file=sys.stderr, flush=True)
+
+
+class HeadlessFrontend:
+    def __init__(self, echo=False, status_interval=60.0):
+        self.scheduler = Scheduler()
+        self.echo = echo
+        self.status_interval = status_interval
+        self.title = None
+        self.status = None
+        self.last_status_print = 0.0
+
+    def after(self, ms, func):
+        return self.scheduler.after(ms, func)
+
+    def set_title(self, text):
+        if text != self.title:
+            self.title = text
+            self._print(text)
+
+    def add_device_view(self, device):
+        self._print(f"Device attached: {device}")
+
+    def set_device_connected(self, device, connected):
+        pass
+
+    def insert_logs(self, messages, device=None):
+        # Device output always goes to the log files; echoing it is optional
+        # so the journal doesn't end up with a second copy.
+        if device is None:
+            for message in messages:
+                self._print(message)
+        elif self.echo:
+            for message in messages:
+                self._print(f"[{device}] {message}")
+
+    def insert_log(self, message, device=None):
+        self.insert_logs([message], device)
+
+    def set_status(self, text):
+        self.status = text
+        now = time.monotonic()
+        if self.status_interval and now - self.last_status_print >= self.status_interval:
+            self.last_status_print = now
+            self._print(text)
+
+    def _print(self, text):
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {text}", flush=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="AEPL Logger without the Tk GUI")
+    parser.add_argument(
+        "--reader-engine", choices=SerialManager.READER_ENGINES, default="event"
+    )
+    parser.add_argument(
+        "--display-policy", choices=("drop", "sample", "coalesce"), default="drop"
+    )
+    parser.add_argument("--writer-threads", type=int, default=1)
+    parser.add_argument(
+        "--compression", choices=("zstd", "gzip", "none"), default="gzip"
+    )
+    parser.add_argument(
+        "--segment-mb", type=float, default=32, help="rotate after this much text"
+    )
+    parser.add_argument(
+        "--segment-minutes", type=float, default=60, help="rotate after this long"
+    )
+    parser.add_argument(
+        "--echo", action="store_true", help="print device lines to stdout"
+    )
+    parser.add_argument(
+        "--status-interval",
+        type=float,
+        default=60.0,
+        help="seconds between status lines (0 disables)",
+    )
+    parser.add_argument(
+        "--raw-capture",
+        action="store_true",
+        help="also record every received chunk to logs/<date>/raw_*.cap",
+    )
+    parser.add_argument(
+        "--decode-packets",
+        action="store_true",
+        help="store AIS/GPS/CAN packets as columns in logs/<date>/packets_*",
+    )
+    parser.add_argument(
+        "--replay",
+        action="append",
+        metavar="CAPTURE",
+        help="feed a raw capture through the pipeline instead of real ports",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        help="replay speed multiplier (0 = as fast as possible)",
+    )
+    parser.add_argument(
+        "--triggers",
+        default="Assets/triggers.json",
+        help="trigger rules; only rules that count, alert or send are used",
+    )
+    parser.add_argument(
+        "--tap",
+        default="",
+        help="publish the live stream on host:port or unix:/path (off by default)",
+    )
+    parser.add_argument(
+        "--command-gap",
+        type=float,
+        default=0.05,
+        help="minimum seconds between commands written to one port",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="serve /metrics and /profile on 127.0.0.1 on this port (off by default)",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=60.0,
+        help="seconds between throughput/latency stats lines (0 disables)",
+    )
+    parser.add_argument(
+        "--fsync-interval",
+        type=float,
+        default=0.0,
+        help="fsync log files at most this many seconds after a write (0: leave it to the OS)",
+    )
+    parser.add_argument(
+        "--first-byte-budget",
+        type=float,
+        default=5.0,
+        help="warn when the first logged byte comes later than this after start (0 disables)",
+    )
+    parser.add_argument(
+        "--profile-seconds",
+        type=float,
+        default=10.0,
+        help="length of the profile SIGUSR1 writes to logs/profile_*.folded",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    frontend = HeadlessFrontend(echo=args.echo, status_interval=args.status_interval)
+    manager = SerialManager(
+        frontend,
+        reader_engine=args.reader_engine,
+        display_policy=args.display_policy,
+        writer_threads=args.writer_threads,
+        compression=args.compression,
+        segment_bytes=int(args.segment_mb * 1024 * 1024),
+        segment_seconds=args.segment_minutes * 60,
+        raw_capture=args.raw_capture,
+        decode_packets=args.decode_packets,
+        monitor_ports=not args.replay,
+        metrics_port=args.metrics_port or None,
+        stats_interval=args.stats_interval,
+        triggers=load_triggers(args.triggers, on_error=frontend._print, tags=False),
+        tap=args.tap or None,
+        command_gap=args.command_gap,
+        fsync_interval=args.fsync_interval or None,
+        first_byte_budget=args.first_byte_budget or None,
+    )
+    replays = [manager.add_replay(path, args.replay_speed) for path in args.replay or ()]
+
+    stop_event = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop_event.set())
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(
+            signal.SIGUSR1, lambda *_: dump_profile(manager, args.profile_seconds)
+        )
+
+    frontend.set_title("AEPL Logger (Disconnected)")
+    while not stop_event.wait(0.2 if replays else 1.0):
+        if replays and not any(session.logging_active for session in replays):
+            break
+
+    manager.close()
+    frontend.scheduler.stop()
+    manager.process_log_queue()
+
+
+if __name__ == "__main__":
+    main()
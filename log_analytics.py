@@ -0,0 +1,448 @@
+import argparse
+import csv
+import json
+import mmap
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from log_index import MESSAGE_CLASSES, STAMP_LENGTH, LogIndex, find_segments
+from log_reader import iter_lines
+from packet_store import parse_ais140, parse_rmc
+
+# Bump when a summary field changes meaning, so cached results are redone.
+ANALYSIS_VERSION = 1
+SESSION_PATTERN = re.compile(
+    r"^(?P<base>serial_log_.+)_(?P<index>\d{4})\.log(?:\.gz|\.zst)?(?:\.part)?$"
+)
+STATUS_KEY = re.compile(r"STATUS#([^#\s]+)#")
+IMEI_VALUE = re.compile(r"IMEI[:#\s]*(\d{14,17})", re.IGNORECASE)
+CRST_MARKS = ("*SET#CRST#", "STATUS#CRST#")
+# A CRST command and its echo or reply show up as a burst of lines.
+CRST_WINDOW_MS = 5000
+
+
+class StampClock:
+    # Log stamps to epoch ms. mktime runs once per minute of log, not
+    # once per line.
+    def __init__(self):
+        self.minute = None
+        self.base = 0
+
+    def ms(self, stamp):
+        minute = stamp[:16]
+        if minute != self.minute:
+            try:
+                self.base = int(time.mktime(time.strptime(minute, "%Y-%m-%d %H:%M")) * 1000)
+            except ValueError:
+                return None
+            self.minute = minute
+        try:
+            return self.base + int(stamp[17:19]) * 1000 + int(stamp[20:23])
+        except ValueError:
+            return None
+
+
+def mapped_lines(path):
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b""):
+                yield line.decode("utf-8", errors="ignore")
+
+
+def segment_lines(path):
+    # Indexed segments are read block by block from an mmap, and so are
+    # plain logs; older compressed ones are streamed.
+    try:
+        index = LogIndex(path)
+    except (OSError, ValueError):
+        if os.path.basename(path).endswith((".log", ".log.part")):
+            return mapped_lines(path)
+        return iter_lines([path])
+    return index.query()
+
+
+def summarize_segment(path, gap_ms):
+    clock = StampClock()
+    classes = dict.fromkeys(MESSAGE_CLASSES + ("other",), 0)
+    status = {}
+    imeis = {}
+    lines = 0
+    first = last = None
+    fixes = no_fix = fix_gaps = max_fix_gap = 0
+    first_fix = last_fix = None
+    crst = 0
+    first_crst = last_crst = None
+
+    for line in segment_lines(path):
+        lines += 1
+        if line.startswith("["):
+            stamp = line[1:STAMP_LENGTH - 1]
+            if first is None:
+                first = stamp
+            last = stamp
+        else:
+            stamp = None
+
+        for name in MESSAGE_CLASSES:
+            if name in line:
+                classes[name] += 1
+                break
+        else:
+            classes["other"] += 1
+
+        if "STATUS#" in line:
+            for key in STATUS_KEY.findall(line):
+                status[key] = status.get(key, 0) + 1
+        if "IMEI" in line or "imei" in line:
+            for imei in IMEI_VALUE.findall(line):
+                imeis[imei] = imeis.get(imei, 0) + 1
+
+        if "CRST#" in line and stamp and any(mark in line for mark in CRST_MARKS):
+            now = clock.ms(stamp)
+            if now is not None:
+                if last_crst is None or now - last_crst > CRST_WINDOW_MS:
+                    crst += 1
+                if first_crst is None:
+                    first_crst = now
+                last_crst = now
+
+        packet = None
+        try:
+            if "RMC," in line:
+                packet = parse_rmc(line)
+            elif "$" in line:
+                packet = parse_ais140(line)
+                packet = packet and packet[2:]
+        except (ValueError, IndexError):
+            pass
+        if packet and stamp:
+            if packet[0] != 1:
+                no_fix += 1
+                continue
+            now = clock.ms(stamp)
+            if now is None:
+                continue
+            fixes += 1
+            if last_fix is not None:
+                gap = now - last_fix
+                max_fix_gap = max(max_fix_gap, gap)
+                if gap > gap_ms:
+                    fix_gaps += 1
+            if first_fix is None:
+                first_fix = now
+            last_fix = now
+
+    return {
+        "lines": lines,
+        "first": first,
+        "last": last,
+        "first_ms": clock.ms(first) if first else None,
+        "last_ms": clock.ms(last) if last else None,
+        "classes": classes,
+        "status": status,
+        "imeis": imeis,
+        "crst": crst,
+        "first_crst": first_crst,
+        "last_crst": last_crst,
+        "fixes": fixes,
+        "no_fix": no_fix,
+        "fix_gaps": fix_gaps,
+        "max_fix_gap": max_fix_gap,
+        "first_fix": first_fix,
+        "last_fix": last_fix,
+    }
+
+
+def analyze_file(path, gap_ms):
+    # Runs in a pool worker.
+    try:
+        return path, summarize_segment(path, gap_ms), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+def file_key(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class AnalysisCache:
+    # Per-file summaries keyed by path, valid while size and mtime match.
+    def __init__(self, path, gap_ms):
+        self.path = path
+        self.gap_ms = gap_ms
+        self.entries = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+                if data.get("version") == ANALYSIS_VERSION and data.get("gap_ms") == gap_ms:
+                    self.entries = data.get("files", {})
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, path, key):
+        entry = self.entries.get(path)
+        if entry and entry["size"] == key[0] and entry["mtime_ns"] == key[1]:
+            return entry["summary"]
+        return None
+
+    def put(self, path, key, summary):
+        self.entries[path] = {"size": key[0], "mtime_ns": key[1], "summary": summary}
+        self.dirty = True
+
+    def prune(self, paths):
+        for path in set(self.entries) - set(paths):
+            del self.entries[path]
+            self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(
+                {"version": ANALYSIS_VERSION, "gap_ms": self.gap_ms, "files": self.entries}, f
+            )
+        os.replace(temp, self.path)
+
+
+def session_of(path):
+    name = os.path.basename(path)
+    match = SESSION_PATTERN.match(name)
+    if not match:
+        # A single-file log from before rotation.
+        return name[:name.find(".log")], 0
+    return match.group("base"), int(match.group("index"))
+
+
+def parse_session_name(base):
+    # serial_log_<imei or port>_<host>_<YYYYmmdd>_<HHMMSS>
+    parts = base[len("serial_log_"):].split("_")
+    if len(parts) < 4:
+        return base, ""
+    return parts[0], "_".join(parts[1:-2])
+
+
+def merge_session(base, folder, segments, gap_ms):
+    # segments: (index, path, size, summary) in index order.
+    device, host = parse_session_name(base)
+    summaries = [summary for _, _, _, summary in segments]
+    classes = dict.fromkeys(MESSAGE_CLASSES + ("other",), 0)
+    status = {}
+    imeis = {}
+    for summary in summaries:
+        for name, count in summary["classes"].items():
+            classes[name] = classes.get(name, 0) + count
+        for key, count in summary["status"].items():
+            status[key] = status.get(key, 0) + count
+        for imei, count in summary["imeis"].items():
+            imeis[imei] = imeis.get(imei, 0) + count
+
+    # Fix gaps and CRST bursts can straddle a segment boundary.
+    fix_gaps = sum(s["fix_gaps"] for s in summaries)
+    max_fix_gap = max((s["max_fix_gap"] for s in summaries), default=0)
+    crst = sum(s["crst"] for s in summaries)
+    last_fix = last_crst = None
+    for summary in summaries:
+        if last_fix is not None and summary["first_fix"] is not None:
+            gap = summary["first_fix"] - last_fix
+            max_fix_gap = max(max_fix_gap, gap)
+            if gap > gap_ms:
+                fix_gaps += 1
+        if last_crst is not None and summary["first_crst"] is not None:
+            if summary["first_crst"] - last_crst <= CRST_WINDOW_MS:
+                crst -= 1
+        last_fix = summary["last_fix"] if summary["last_fix"] is not None else last_fix
+        last_crst = summary["last_crst"] if summary["last_crst"] is not None else last_crst
+
+    stamped = [s for s in summaries if s["first"]]
+    first = stamped[0] if stamped else None
+    last = stamped[-1] if stamped else None
+    duration = None
+    if first and last and first["first_ms"] is not None and last["last_ms"] is not None:
+        duration = round((last["last_ms"] - first["first_ms"]) / 1000, 3)
+
+    row = {
+        "device": device,
+        "session": base,
+        "folder": folder,
+        "host": host,
+        "segments": len(segments),
+        "bytes": sum(size for _, _, size, _ in segments),
+        "start": first["first"] if first else None,
+        "end": last["last"] if last else None,
+        "duration_s": duration,
+        "lines": sum(s["lines"] for s in summaries),
+    }
+    for name, count in classes.items():
+        row[f"{name.lower()}_lines"] = count
+    row.update({
+        "crst_resets": crst,
+        "gps_fixes": sum(s["fixes"] for s in summaries),
+        "gps_no_fix": sum(s["no_fix"] for s in summaries),
+        "fix_gaps": fix_gaps,
+        "max_fix_gap_s": round(max_fix_gap / 1000, 3),
+        "imei_responses": sum(imeis.values()),
+        "imeis_seen": ";".join(sorted(imeis)),
+        "status_responses": sum(status.values()),
+        "status_keys": ";".join(f"{key}:{count}" for key, count in sorted(status.items())),
+    })
+    return row
+
+
+def summarize_devices(sessions):
+    devices = {}
+    for row in sessions:
+        device = devices.setdefault(row["device"], {
+            "device": row["device"], "sessions": 0, "first_start": None, "last_end": None,
+            "duration_s": 0.0, "lines": 0, "crst_resets": 0, "fix_gaps": 0,
+            "max_fix_gap_s": 0.0, "status_responses": 0,
+        })
+        device["sessions"] += 1
+        if row["start"] and (device["first_start"] is None or row["start"] < device["first_start"]):
+            device["first_start"] = row["start"]
+        if row["end"] and (device["last_end"] is None or row["end"] > device["last_end"]):
+            device["last_end"] = row["end"]
+        device["duration_s"] = round(device["duration_s"] + (row["duration_s"] or 0), 3)
+        for key in ("lines", "crst_resets", "fix_gaps", "status_responses"):
+            device[key] += row[key]
+        device["max_fix_gap_s"] = max(device["max_fix_gap_s"], row["max_fix_gap_s"])
+    return sorted(devices.values(), key=lambda d: d["device"])
+
+
+def analyze(paths, workers=None, cache_path=None, gap_s=5.0, imei=None, progress=None):
+    gap_ms = int(gap_s * 1000)
+    cache = AnalysisCache(cache_path, gap_ms)
+    files = {os.path.abspath(path): path for path in find_segments(paths, imei)}
+    keys = {}
+    summaries = {}
+    todo = []
+    for path in files:
+        try:
+            keys[path] = file_key(path)
+        except OSError:
+            continue
+        summary = cache.get(path, keys[path])
+        if summary is None:
+            todo.append(path)
+        else:
+            summaries[path] = summary
+    if not imei:
+        cache.prune(keys)
+
+    errors = []
+    # Biggest files first, so one long file doesn't finish last on its own.
+    todo.sort(key=lambda path: keys[path][0], reverse=True)
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            results = (analyze_file(path, gap_ms) for path in todo)
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            results = (
+                future.result()
+                for future in as_completed([pool.submit(analyze_file, path, gap_ms) for path in todo])
+            )
+        try:
+            for done, (path, summary, error) in enumerate(results, 1):
+                if error:
+                    errors.append((path, error))
+                else:
+                    summaries[path] = summary
+                    cache.put(path, keys[path], summary)
+                if progress:
+                    progress(done, len(todo))
+        finally:
+            if workers > 1:
+                pool.shutdown()
+        cache.save()
+
+    by_session = {}
+    for path, summary in summaries.items():
+        base, index = session_of(path)
+        folder = os.path.basename(os.path.dirname(path))
+        by_session.setdefault((folder, base), []).append((index, path, keys[path][0], summary))
+    sessions = [
+        merge_session(base, folder, sorted(segments), gap_ms)
+        for (folder, base), segments in sorted(by_session.items())
+    ]
+    return {
+        "files": len(keys),
+        "analyzed": len(todo),
+        "cached": len(keys) - len(todo),
+        "errors": errors,
+        "sessions": sessions,
+        "devices": summarize_devices(sessions),
+    }
+
+
+def write_csv(path, rows):
+    if not rows:
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Summarise every session under a logs/ tree, in parallel"
+    )
+    parser.add_argument("paths", nargs="*", default=["logs"], help="log folders or segments")
+    parser.add_argument("--imei", help="only sessions of this device")
+    parser.add_argument("--csv", help="one row per session")
+    parser.add_argument("--devices-csv", help="one row per device")
+    parser.add_argument("--json", help="sessions and devices")
+    parser.add_argument("--workers", type=int, help="processes (default: all cores)")
+    parser.add_argument("--gap", type=float, default=5.0, help="count GPS fix gaps over SECONDS")
+    parser.add_argument(
+        "--cache",
+        help="per-file results (default: analytics_cache.json in the first folder)",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="analyze every file again")
+    args = parser.parse_args(argv)
+
+    cache_path = args.cache
+    if cache_path is None and os.path.isdir(args.paths[0]):
+        cache_path = os.path.join(args.paths[0], "analytics_cache.json")
+    if args.no_cache:
+        cache_path = None
+
+    def progress(done, total):
+        if done == total or done % 50 == 0:
+            print(f"\r{done}/{total} files", end="\n" if done == total else "",
+                  file=sys.stderr, flush=True)
+
+    started = time.perf_counter()
+    report = analyze(args.paths, args.workers, cache_path, args.gap, args.imei, progress)
+    elapsed = time.perf_counter() - started
+
+    for path, error in report["errors"]:
+        print(f"{path}: {error}", file=sys.stderr)
+    if args.csv:
+        write_csv(args.csv, report["sessions"])
+    if args.devices_csv:
+        write_csv(args.devices_csv, report["devices"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({key: report[key] for key in ("sessions", "devices")}, f, indent=2)
+
+    print(f"{'device':<17} {'sessions':>8} {'hours':>7} {'lines':>10} "
+          f"{'resets':>6} {'fix gaps':>8} {'max gap s':>9}")
+    for device in report["devices"]:
+        print(f"{device['device']:<17} {device['sessions']:>8} "
+              f"{device['duration_s'] / 3600:>7.2f} {device['lines']:>10} "
+              f"{device['crst_resets']:>6} {device['fix_gaps']:>8} {device['max_fix_gap_s']:>9}")
+    print(f"{report['files']} files ({report['analyzed']} analyzed, {report['cached']} cached), "
+          f"{len(report['sessions'])} sessions in {elapsed:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import tkinter as tk
+from tkinter import scrolledtext
+
+
+class LogConsole(scrolledtext.ScrolledText):
+    def __init__(self, master, max_lines=20000, trim_slack=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.max_lines = max_lines
+        # Trim in bulk once we overshoot by this many lines, not on every tick.
+        self.trim_slack = trim_slack if trim_slack is not None else max(max_lines // 10, 1)
+        self.line_count = 0
+        self.user_scrolled = False
+
+    def append_lines(self, items, follow=True):
+        if not items:
+            return
+
+        args = []
+        chunk = []
+        chunk_tag = None
+        for text, tag in items:
+            if chunk and tag != chunk_tag:
+                args.extend(("".join(chunk), chunk_tag or ()))
+                chunk = []
+            chunk.append(text + "\n")
+            chunk_tag = tag
+        if chunk:
+            args.extend(("".join(chunk), chunk_tag or ()))
+
+        self.insert(tk.END, *args)
+        self.line_count += len(items)
+
+        if self.line_count > self.max_lines + self.trim_slack:
+            self.trim(follow)
+        if follow:
+            self.yview(tk.END)
+
+    def trim(self, follow=True):
+        excess = self.line_count - self.max_lines
+        if excess <= 0:
+            return
+
+        first_visible = None
+        if not follow:
+            first_visible = int(self.index("@0,0").split(".")[0])
+
+        self.delete("1.0", f"{excess + 1}.0")
+        self.line_count -= excess
+
+        if first_visible is not None:
+            self.yview(f"{max(first_visible - excess, 1)}.0")
+
+    def clear(self):
+        self.delete("1.0", tk.END)
+        self.line_count = 0
@@ -0,0 +1,269 @@
+import argparse
+import bisect
+import glob
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MESSAGE_CLASSES = ("AIS", "CVP", "CAN", "NET", "PLA", "FOT")
+CLASS_BITS = {name: 1 << bit for bit, name in enumerate(MESSAGE_CLASSES)}
+ALL_CLASSES = (1 << len(MESSAGE_CLASSES)) - 1
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"AEPLIDX1"
+# start_ts, end_ts, comp_start, comp_end, raw_start, raw_end, class mask, lines
+BLOCK = struct.Struct("<qqQQQQHI")
+STAMP_LENGTH = len("[2025-01-01 00:00:00.000]")
+
+
+def has_class(line, classes):
+    # A line is in every class it mentions, the same rule the block masks
+    # use, so the filter keeps whatever made the index select a block.
+    return any(name in line for name in classes)
+
+
+def stamp_key(stamp):
+    # "YYYY-mm-dd HH:MM:SS.mmm" -> YYYYmmddHHMMSSmmm, ordered like the text.
+    try:
+        return int(
+            stamp[0:4] + stamp[5:7] + stamp[8:10] + stamp[11:13]
+            + stamp[14:16] + stamp[17:19] + stamp[20:23]
+        )
+    except ValueError:
+        return 0
+
+
+def index_path(segment_path):
+    if segment_path.endswith(".part"):
+        segment_path = segment_path[: -len(".part")]
+    return segment_path + INDEX_SUFFIX
+
+
+class IndexBuilder:
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(INDEX_MAGIC)
+        self.file.flush()
+        self.reset(0, 0)
+
+    def reset(self, comp_start, raw_start):
+        self.comp_start = comp_start
+        self.raw_start = raw_start
+        self.block_bytes = 0
+        self.start_ts = None
+        self.last_text = ""
+        self.mask = 0
+        self.lines = 0
+
+    def note(self, text, nbytes):
+        if self.start_ts is None and text.startswith("["):
+            self.start_ts = stamp_key(text[1:STAMP_LENGTH - 1])
+        self.last_text = text
+        self.block_bytes += nbytes
+        self.lines += text.count("\n")
+        if self.mask != ALL_CLASSES:
+            for name, bit in CLASS_BITS.items():
+                if not self.mask & bit and name in text:
+                    self.mask |= bit
+
+    def finish_block(self, comp_end, raw_end):
+        if not self.block_bytes:
+            return
+        last = self.last_text.rfind("\n[", 0, len(self.last_text) - 1) + 1
+        end_ts = stamp_key(self.last_text[last + 1 : last + STAMP_LENGTH - 1])
+        self.file.write(
+            BLOCK.pack(
+                self.start_ts or 0, end_ts or self.start_ts or 0,
+                self.comp_start, comp_end, self.raw_start, raw_end,
+                self.mask, self.lines,
+            )
+        )
+        self.file.flush()
+        self.reset(comp_end, raw_end)
+
+    def close(self):
+        self.file.close()
+
+
+class LogIndex:
+    def __init__(self, segment_path):
+        self.segment_path = segment_path
+        self.compression = (
+            "gzip" if ".gz" in os.path.basename(segment_path)
+            else "zstd" if ".zst" in os.path.basename(segment_path)
+            else "none"
+        )
+        with open(index_path(segment_path), "rb") as f:
+            data = f.read()
+        if not data.startswith(INDEX_MAGIC):
+            raise ValueError(f"{index_path(segment_path)}: not a log index")
+        body = data[len(INDEX_MAGIC):]
+        usable = len(body) - len(body) % BLOCK.size
+        self.blocks = [BLOCK.unpack_from(body, offset) for offset in range(0, usable, BLOCK.size)]
+        self.start_keys = [block[0] for block in self.blocks]
+        self.postings = {
+            name: [i for i, block in enumerate(self.blocks) if block[6] & bit]
+            for name, bit in CLASS_BITS.items()
+        }
+
+    def select(self, start_key=None, end_key=None, classes=None):
+        # Blocks are in time order, so the time range is two bisections; the
+        # class filter is a merge of the per-class posting lists.
+        first = 0
+        if start_key is not None:
+            first = max(bisect.bisect_right(self.start_keys, start_key) - 1, 0)
+            while first < len(self.blocks) and self.blocks[first][1] < start_key:
+                first += 1
+        last = len(self.blocks)
+        if end_key is not None:
+            last = bisect.bisect_right(self.start_keys, end_key)
+
+        if classes:
+            wanted = sorted(
+                set(i for name in classes for i in self.postings.get(name, ()) if first <= i < last)
+            )
+        else:
+            wanted = list(range(first, last))
+        return [self.blocks[i] for i in wanted]
+
+    def read_block(self, mm, comp_start, comp_end):
+        data = mm[comp_start:comp_end]
+        if self.compression == "gzip":
+            return zlib.decompressobj(-zlib.MAX_WBITS).decompress(data)
+        if self.compression == "zstd":
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read .zst logs")
+            return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        return data
+
+    def query(self, start=None, end=None, classes=None):
+        start_key = stamp_key(start) if start else None
+        end_key = stamp_key(end) if end else None
+        blocks = self.select(start_key, end_key, classes)
+        self.blocks_read = len(blocks)
+
+        with open(self.segment_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                ranges = [(block[2], block[3]) for block in blocks]
+                # The block still being written has no index entry yet.
+                if self.blocks:
+                    tail, tail_key = self.blocks[-1][3], self.blocks[-1][1]
+                else:
+                    tail, tail_key = self.tail_start(mm), 0
+                if tail < size and (end_key is None or tail_key <= end_key):
+                    ranges.append((tail, size))
+
+                for comp_start, comp_end in ranges:
+                    text = self.read_block(mm, comp_start, comp_end).decode(
+                        "utf-8", errors="ignore"
+                    )
+                    for line in text.splitlines(keepends=True):
+                        stamp = line[1 : STAMP_LENGTH - 1]
+                        if start and stamp < start:
+                            continue
+                        if end and stamp > end:
+                            continue
+                        if classes and not has_class(line, classes):
+                            continue
+                        yield line
+
+    def tail_start(self, mm):
+        if self.compression != "gzip":
+            return 0
+        # Skip the gzip member header; FNAME is the only optional field set.
+        offset = 10
+        if mm[3] & 0x08:
+            offset = mm.find(b"\0", offset) + 1
+        return offset
+
+
+def find_segments(paths, imei=None):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = glob.glob(os.path.join(path, "**", "serial_log_*"), recursive=True)
+        else:
+            candidates = [path]
+        for candidate in candidates:
+            name = os.path.basename(candidate)
+            if candidate.endswith(INDEX_SUFFIX) or ".log" not in name:
+                continue
+            if imei and not name.startswith(f"serial_log_{imei}_"):
+                continue
+            found.append(candidate)
+    return sorted(found)
+
+
+def parse_bound(value, date, upper=False):
+    if value is None:
+        return None
+    if len(value) <= len("HH:MM:SS.mmm"):
+        value = f"{date} {value}"
+    fill = "9999-12-31 23:59:59.999" if upper else "0000-01-01 00:00:00.000"
+    return value + fill[len(value):]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Query serial logs by time range and message class using their index"
+    )
+    parser.add_argument("paths", nargs="+", help="segments or folders of segments")
+    parser.add_argument("--imei")
+    parser.add_argument("--from", dest="start", help="'HH:MM[:SS]' or 'YYYY-mm-dd HH:MM[:SS]'")
+    parser.add_argument("--to", dest="end")
+    parser.add_argument("--date", default=time.strftime("%Y-%m-%d"),
+                        help="date for --from/--to given as a time of day")
+    parser.add_argument("--class", dest="classes", action="append",
+                        choices=MESSAGE_CLASSES)
+    parser.add_argument("--stats", action="store_true", help="print timing to stderr")
+    args = parser.parse_args(argv)
+
+    start = parse_bound(args.start, args.date)
+    end = parse_bound(args.end, args.date, upper=True)
+
+    from log_reader import iter_lines
+
+    started = time.perf_counter()
+    blocks_read = matched = 0
+    try:
+        for segment in find_segments(args.paths, args.imei):
+            try:
+                index = LogIndex(segment)
+            except (OSError, ValueError):
+                # Logs written before indexing existed: scan them.
+                for line in iter_lines([segment]):
+                    stamp = line[1 : STAMP_LENGTH - 1]
+                    if (start and stamp < start) or (end and stamp > end):
+                        continue
+                    if args.classes and not has_class(line, args.classes):
+                        continue
+                    matched += 1
+                    sys.stdout.write(line)
+                continue
+            for line in index.query(start, end, args.classes):
+                matched += 1
+                sys.stdout.write(line)
+            blocks_read += index.blocks_read
+    except BrokenPipeError:
+        return
+    if args.stats:
+        print(
+            f"{matched} lines from {blocks_read} blocks in "
+            f"{(time.perf_counter() - started) * 1000:.1f} ms",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import glob
+import gzip
+import io
+import os
+import re
+import sys
+from log_sink import PART_SUFFIX
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SEGMENT_PATTERN = re.compile(r"^(?P<base>.+)_(?P<index>\d{4})\.log(?:\.gz|\.zst)?$")
+
+
+def open_log(path, mode="rt"):
+    text = "t" in mode
+    if path.endswith(PART_SUFFIX):
+        path_type = path[: -len(PART_SUFFIX)]
+    else:
+        path_type = path
+
+    if path_type.endswith(".gz"):
+        stream = gzip.open(path, "rb")
+    elif path_type.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read .zst logs")
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+        stream = io.BufferedReader(stream)
+    else:
+        stream = open(path, "rb")
+
+    if text:
+        return io.TextIOWrapper(stream, encoding="utf-8", errors="ignore")
+    return stream
+
+
+def session_segments(path):
+    match = SEGMENT_PATTERN.match(os.path.basename(path))
+    if not match:
+        return [path]
+    base = os.path.join(os.path.dirname(path), match.group("base"))
+    segments = [
+        candidate
+        for candidate in glob.glob(glob.escape(base) + "_[0-9][0-9][0-9][0-9].log*")
+        if SEGMENT_PATTERN.match(os.path.basename(candidate))
+    ]
+    return sorted(segments, key=lambda p: SEGMENT_PATTERN.match(os.path.basename(p)).group("index"))
+
+
+def iter_lines(paths, whole_session=False):
+    for path in paths:
+        segments = session_segments(path) if whole_session else [path]
+        for segment in segments:
+            # gzip streams cut off by a crash still yield what was synced.
+            try:
+                with open_log(segment) as f:
+                    for line in f:
+                        yield line
+            except (EOFError, gzip.BadGzipFile) as e:
+                print(f"{segment}: {e}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Print plain, gzip or zstd serial logs as text"
+    )
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument(
+        "-s",
+        "--session",
+        action="store_true",
+        help="print every segment of the session each path belongs to",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        for line in iter_lines(args.paths, whole_session=args.session):
+            sys.stdout.write(line)
+    except BrokenPipeError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import gzip
+import os
+import time
+import zlib
+from log_index import IndexBuilder, index_path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PART_SUFFIX = ".part"
+SEGMENT_MANIFEST = "closed_segments.txt"
+COMPRESSIONS = ("zstd", "gzip", "none")
+EXTENSIONS = {"zstd": ".log.zst", "gzip": ".log.gz", "none": ".log"}
+
+
+def publish_closed_segment(manifest_path, segment_path):
+    # One short O_APPEND write per segment, so readers never see half a line.
+    line = (os.path.abspath(segment_path) + "\n").encode("utf-8")
+    fd = os.open(manifest_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def resolve_compression(compression):
+    if compression == "zstd" and zstandard is None:
+        return "gzip"
+    return compression
+
+
+class RotatingLogSink:
+    def __init__(
+        self,
+        base_path,
+        max_bytes=32 * 1024 * 1024,
+        max_seconds=3600,
+        compression="gzip",
+        sync_interval=5.0,
+        on_segment_closed=None,
+        index=True,
+        checkpoint_bytes=1024 * 1024,
+        hold=False,
+    ):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.base_path = base_path
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.compression = resolve_compression(compression)
+        self.extension = EXTENSIONS[self.compression]
+        self.sync_interval = sync_interval
+        self.on_segment_closed = on_segment_closed
+        self.index_enabled = index
+        self.checkpoint_bytes = checkpoint_bytes
+        self.index = None
+        self.hold = hold
+        self.held = []
+
+        self.segment_index = 0
+        self.segment_path = None
+        self.raw = None
+        self.stream = None
+        self.segment_bytes = 0
+        self.segment_started = 0.0
+        self.last_sync = 0.0
+        self.closed_segments = []
+        self._open_segment()
+
+    @property
+    def name(self):
+        return self.segment_path
+
+    def write(self, text):
+        if self.segment_bytes and (
+            self.segment_bytes >= self.max_bytes
+            or time.monotonic() - self.segment_started >= self.max_seconds
+        ):
+            self.rotate()
+        data = text.encode("utf-8", errors="ignore")
+        self.stream.write(data)
+        self.segment_bytes += len(data)
+        if self.index:
+            self.index.note(text, len(data))
+            if self.index.block_bytes >= self.checkpoint_bytes:
+                self._checkpoint()
+        return len(text)
+
+    def _checkpoint(self):
+        # A full flush (or a new zstd frame) makes the next block decodable
+        # on its own, so a query can start decompressing at its offset.
+        if self.compression == "gzip":
+            self.stream.flush(zlib.Z_FULL_FLUSH)
+        elif self.compression == "zstd":
+            self.stream.flush(zstandard.FLUSH_FRAME)
+        self.index.finish_block(self.raw.tell(), self.segment_bytes)
+
+    def flush(self):
+        # Syncing a compressor costs ratio, so only push its buffered
+        # state to the file every sync_interval seconds.
+        now = time.monotonic()
+        if now - self.last_sync < self.sync_interval:
+            return
+        self._flush_stream(now)
+
+    def sync(self):
+        # Puts everything written so far on disk, including what the
+        # compressor is still holding. Used by the writer's fsync policy.
+        if self.stream is None:
+            return
+        self._flush_stream(time.monotonic())
+        os.fsync(self.raw.fileno())
+
+    def _flush_stream(self, now):
+        self.last_sync = now
+        if self.compression == "gzip":
+            self.stream.flush(zlib.Z_SYNC_FLUSH)
+        elif self.compression == "zstd":
+            self.stream.flush(zstandard.FLUSH_BLOCK)
+        else:
+            self.stream.flush()
+        self.raw.flush()
+
+    def fileno(self):
+        return self.raw.fileno()
+
+    def rotate(self):
+        self._close_segment()
+        self._open_segment()
+
+    def close(self):
+        if self.stream is not None:
+            self._close_segment()
+
+    def rebase(self, base_path):
+        # Renames everything written so far (including the open segment) to
+        # a new base path and carries on there. Used to turn a session's
+        # spool into its final log once the IMEI is known. The open segment
+        # is renamed in place and keeps being written.
+        reopen = False
+        if self.stream is not None:
+            new_path = base_path + self.segment_path[len(self.base_path):]
+            try:
+                os.replace(self.segment_path + PART_SUFFIX, new_path + PART_SUFFIX)
+            except OSError:
+                # Windows can't rename an open file; close it and go on in a
+                # new segment instead.
+                self._close_segment()
+                reopen = True
+            else:
+                if self.index:
+                    os.replace(index_path(self.segment_path), index_path(new_path))
+                self.segment_path = new_path
+        renamed = []
+        for old_path in self.held:
+            new_path = base_path + old_path[len(self.base_path):]
+            os.replace(old_path, new_path)
+            if os.path.exists(index_path(old_path)):
+                os.replace(index_path(old_path), index_path(new_path))
+            renamed.append(new_path)
+        self.closed_segments = [
+            path for path in self.closed_segments if path not in self.held
+        ] + renamed
+        self.base_path = base_path
+        self.hold = False
+        self.held = []
+        if self.on_segment_closed:
+            for path in renamed:
+                self.on_segment_closed(path)
+        if reopen:
+            self._open_segment()
+
+    def _open_segment(self):
+        self.segment_index += 1
+        self.segment_path = f"{self.base_path}_{self.segment_index:04d}{self.extension}"
+        self.raw = open(self.segment_path + PART_SUFFIX, "wb")
+        if self.compression == "gzip":
+            self.stream = gzip.GzipFile(
+                filename=os.path.basename(self.segment_path)[: -len(".gz")],
+                mode="wb",
+                fileobj=self.raw,
+                compresslevel=6,
+            )
+        elif self.compression == "zstd":
+            self.stream = zstandard.ZstdCompressor(level=3).stream_writer(
+                self.raw, closefd=False
+            )
+        else:
+            self.stream = self.raw
+        if self.index_enabled:
+            self.index = IndexBuilder(index_path(self.segment_path))
+            self.index.reset(self.raw.tell(), 0)
+        self.segment_bytes = 0
+        self.segment_started = time.monotonic()
+        self.last_sync = self.segment_started
+
+    def _close_segment(self):
+        if self.index:
+            self._checkpoint()
+            self.index.close()
+            self.index = None
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.close()
+        self.stream = None
+        self.raw = None
+
+        # The rename is what tells the uploader the segment is complete.
+        os.replace(self.segment_path + PART_SUFFIX, self.segment_path)
+        self.closed_segments.append(self.segment_path)
+        if self.hold:
+            self.held.append(self.segment_path)
+        elif self.on_segment_closed:
+            self.on_segment_closed(self.segment_path)
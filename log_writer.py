@@ -0,0 +1,193 @@
+import os
+import queue
+import threading
+import time
+from metrics import Histogram
+
+_WRITE = 0
+_CLOSE = 1
+_CALL = 2
+_FLUSH = 3
+_STOP = 4
+
+
+class LogWriter:
+    def __init__(
+        self, max_batch_bytes=64 * 1024, max_delay=0.2, fsync_interval=None, on_error=None
+    ):
+        self.max_batch_bytes = max_batch_bytes
+        self.max_delay = max_delay
+        self.fsync_interval = fsync_interval
+        self.on_error = on_error
+
+        self.queue = queue.Queue()
+        self.pending = {}
+        self.pending_bytes = 0
+        self.unsynced = set()
+        self.last_fsync = time.monotonic()
+
+        self.bytes_written = 0
+        self.writes = 0
+        self.batches = 0
+        self.fsyncs = 0
+        self.max_commit_latency = 0.0
+        self.commit_latency = Histogram()
+        self.first_commit = None  # wall-clock time data first reached a file
+
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, log_file, text):
+        self.queue.put((_WRITE, log_file, text))
+
+    def close(self, log_file):
+        self.queue.put((_CLOSE, log_file, None))
+
+    def call(self, func):
+        # Runs func on the writer thread after everything queued before it.
+        self.queue.put((_CALL, None, func))
+
+    def flush(self, timeout=5.0):
+        done = threading.Event()
+        self.queue.put((_FLUSH, None, done))
+        if threading.current_thread() is not self.thread:
+            done.wait(timeout)
+
+    def stop(self, timeout=5.0):
+        self.queue.put((_STOP, None, None))
+        self.thread.join(timeout)
+
+    def summary(self):
+        return (
+            f"Writer: {self.bytes_written} bytes, {self.writes} writes in "
+            f"{self.batches} batches, {self.fsyncs} fsyncs, "
+            f"worst commit {self.max_commit_latency * 1000:.1f} ms"
+        )
+
+    def _run(self):
+        deadline = None
+        while True:
+            timeout = None
+            if self.pending:
+                timeout = max(0.0, deadline - time.monotonic())
+            elif self.unsynced and self.fsync_interval is not None:
+                # The last commit's fsync was skipped; don't wait for another
+                # write to do it.
+                timeout = max(0.0, self.last_fsync + self.fsync_interval - time.monotonic())
+            try:
+                kind, log_file, payload = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                if self.pending:
+                    self._commit()
+                else:
+                    self._sync(time.monotonic())
+                continue
+
+            if kind == _WRITE:
+                if not self.pending:
+                    deadline = time.monotonic() + self.max_delay
+                parts = self.pending.get(log_file)
+                if parts is None:
+                    parts = self.pending[log_file] = []
+                parts.append(payload)
+                self.pending_bytes += len(payload)
+                if self.pending_bytes >= self.max_batch_bytes:
+                    self._commit()
+                continue
+
+            self._commit()
+            if kind == _CLOSE:
+                self.unsynced.discard(log_file)
+                self._guard(log_file.close)
+            elif kind == _CALL:
+                self._guard(payload)
+            elif kind == _FLUSH:
+                payload.set()
+            elif kind == _STOP:
+                break
+
+    def _commit(self):
+        if not self.pending:
+            return
+
+        started = time.monotonic()
+        for log_file, parts in self.pending.items():
+            data = "".join(parts)
+            try:
+                log_file.write(data)
+                log_file.flush()
+            except Exception as e:
+                self._report(f"Log write error: {e}")
+                continue
+            self.bytes_written += len(data)
+            self.writes += len(parts)
+            self.unsynced.add(log_file)
+            if self.first_commit is None:
+                self.first_commit = time.time()
+
+        self.pending.clear()
+        self.pending_bytes = 0
+        self._sync(started)
+
+        self.batches += 1
+        elapsed = time.monotonic() - started
+        self.commit_latency.observe(elapsed)
+        self.max_commit_latency = max(self.max_commit_latency, elapsed)
+
+    def _sync(self, now):
+        if self.fsync_interval is None or now - self.last_fsync < self.fsync_interval:
+            return
+        for log_file in self.unsynced:
+            # A compressing sink must push out its compressor's buffer
+            # first, or the fsync misses the newest lines.
+            sync = getattr(log_file, "sync", None)
+            self._guard(sync or (lambda: os.fsync(log_file.fileno())))
+            self.fsyncs += 1
+        self.unsynced.clear()
+        self.last_fsync = now
+
+    def _guard(self, func):
+        try:
+            func()
+        except Exception as e:
+            self._report(f"Log writer error: {e}")
+
+    def _report(self, message):
+        if self.on_error:
+            self.on_error(message)
+
+
+class LogWriterPool:
+    def __init__(self, size=1, **writer_options):
+        self.writers = [LogWriter(**writer_options) for _ in range(max(size, 1))]
+        self.next_index = 0
+        self.lock = threading.Lock()
+
+    def assign(self):
+        with self.lock:
+            writer = self.writers[self.next_index % len(self.writers)]
+            self.next_index += 1
+            return writer
+
+    def flush(self, timeout=5.0):
+        for writer in self.writers:
+            writer.flush(timeout)
+
+    def stop(self, timeout=5.0):
+        for writer in self.writers:
+            writer.stop(timeout)
+
+    @property
+    def bytes_written(self):
+        return sum(writer.bytes_written for writer in self.writers)
+
+    @property
+    def batches(self):
+        return sum(writer.batches for writer in self.writers)
+
+    @property
+    def max_commit_latency(self):
+        return max(writer.max_commit_latency for writer in self.writers)
+
+    def summary(self):
+        return "\n".join(writer.summary() for writer in self.writers)
@@ -0,0 +1,703 @@
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+
+class MacroError(Exception):
+    def __init__(self, line_no, message):
+        super().__init__(f"line {line_no}: {message}")
+        self.line_no = line_no
+
+
+# ---------------------------------------------------------------- expressions
+
+TOKEN_PATTERN = re.compile(
+    r"\s*(?:(?P<number>\d+)|'(?P<squote>[^']*)'|\"(?P<dquote>[^\"]*)\""
+    r"|(?P<name>[A-Za-z_][A-Za-z0-9_]*)"
+    r"|(?P<op>==|<>|!=|<=|>=|&&|\|\||[=<>+\-*/%()!]))"
+)
+
+COMPARISONS = {
+    "=": lambda a, b: a == b,
+    "==": lambda a, b: a == b,
+    "<>": lambda a, b: a != b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+}
+ARITHMETIC = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": lambda a, b: int(a / b),
+    "%": lambda a, b: a % b,
+}
+
+
+def tokenize(text, line_no):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN_PATTERN.match(text, pos)
+        if not match or match.end() == pos:
+            raise MacroError(line_no, f"unexpected input: {text[pos:]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind in ("squote", "dquote"):
+            tokens.append(("string", match.group(kind)))
+        elif kind == "number":
+            tokens.append(("number", int(match.group(kind))))
+        elif kind == "name":
+            word = match.group(kind)
+            if word.lower() in ("and", "or", "not"):
+                tokens.append(("op", word.lower()))
+            else:
+                tokens.append(("name", word))
+        else:
+            tokens.append(("op", match.group(kind)))
+    return tokens
+
+
+class ExpressionParser:
+    def __init__(self, tokens, line_no):
+        self.tokens = tokens
+        self.pos = 0
+        self.line_no = line_no
+
+    def parse(self):
+        expr = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise MacroError(self.line_no, f"unexpected {self.tokens[self.pos][1]!r}")
+        return expr
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse_or(self):
+        left = self.parse_and()
+        while self.peek()[1] in ("or", "||"):
+            self.take()
+            right = self.parse_and()
+            left = (lambda l, r: lambda env: int(bool(l(env)) or bool(r(env))))(left, right)
+        return left
+
+    def parse_and(self):
+        left = self.parse_not()
+        while self.peek()[1] in ("and", "&&"):
+            self.take()
+            right = self.parse_not()
+            left = (lambda l, r: lambda env: int(bool(l(env)) and bool(r(env))))(left, right)
+        return left
+
+    def parse_not(self):
+        if self.peek()[1] in ("not", "!"):
+            self.take()
+            operand = self.parse_not()
+            return lambda env: int(not operand(env))
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.parse_sum()
+        while self.peek()[1] in COMPARISONS:
+            compare = COMPARISONS[self.take()[1]]
+            right = self.parse_sum()
+            left = (lambda l, r, c: lambda env: int(c(l(env), r(env))))(left, right, compare)
+        return left
+
+    def parse_sum(self):
+        left = self.parse_product()
+        while self.peek()[1] in ("+", "-"):
+            apply = ARITHMETIC[self.take()[1]]
+            right = self.parse_product()
+            left = (lambda l, r, a: lambda env: a(l(env), r(env)))(left, right, apply)
+        return left
+
+    def parse_product(self):
+        left = self.parse_unary()
+        while self.peek()[1] in ("*", "/", "%"):
+            apply = ARITHMETIC[self.take()[1]]
+            right = self.parse_unary()
+            left = (lambda l, r, a: lambda env: a(l(env), r(env)))(left, right, apply)
+        return left
+
+    def parse_unary(self):
+        if self.peek()[1] == "-":
+            self.take()
+            operand = self.parse_unary()
+            return lambda env: -operand(env)
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, value = self.take()
+        if kind in ("number", "string"):
+            return lambda env: value
+        if kind == "name":
+            name = value.lower()
+            return lambda env: env.get(name, 0)
+        if value == "(":
+            expr = self.parse_or()
+            if self.take()[1] != ")":
+                raise MacroError(self.line_no, "missing ')'")
+            return expr
+        raise MacroError(self.line_no, f"unexpected {value!r}")
+
+
+def compile_expression(text, line_no):
+    tokens = tokenize(text, line_no)
+    if not tokens:
+        raise MacroError(line_no, "missing expression")
+    return ExpressionParser(tokens, line_no).parse()
+
+
+def compile_arguments(text, line_no):
+    # Tera Term commands take space separated operands: 'a' 'b' var
+    tokens = tokenize(text, line_no)
+    return [ExpressionParser([token], line_no).parse() for token in tokens]
+
+
+# ------------------------------------------------------------------- compiler
+
+
+class Instruction:
+    __slots__ = ("op", "args", "line_no", "text", "target")
+
+    def __init__(self, op, args, line_no, text, target=None):
+        self.op = op
+        self.args = args
+        self.line_no = line_no
+        self.text = text
+        self.target = target
+
+
+class MacroProgram:
+    def __init__(self, instructions, name=""):
+        self.instructions = instructions
+        self.name = name
+
+
+RAW_COMMAND = re.compile(r"^(?:CMN\s+)?\*")
+ASSIGNMENT = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)\s*=(?!=)\s*(.+)$")
+FOR_PATTERN = re.compile(r"^(\w+)\s+(.+?)\s+(\S+)$")
+
+
+def strip_comment(line):
+    quote = None
+    for i, char in enumerate(line):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == ";":
+            return line[:i]
+    return line
+
+
+class MacroCompiler:
+    def __init__(self, name=""):
+        self.name = name
+        self.code = []
+        self.blocks = []
+
+    def emit(self, op, args, line_no, text, target=None):
+        self.code.append(Instruction(op, args, line_no, text, target))
+        return len(self.code) - 1
+
+    def compile(self, source):
+        for line_no, raw_line in enumerate(source.splitlines(), 1):
+            line = raw_line.strip()
+            if not line:
+                continue
+            if RAW_COMMAND.match(line):
+                # Plain device commands, as in the existing .ttl files.
+                self.emit("send", [lambda env, c=line: c], line_no, line)
+                continue
+            line = strip_comment(line).strip()
+            if line and not line.startswith(":"):
+                self.statement(line, line_no)
+
+        if self.blocks:
+            block = self.blocks[-1]
+            raise MacroError(block["line"], f"unterminated '{block['kind']}'")
+        self.emit("end", [], 0, "end")
+        return MacroProgram(self.code, self.name)
+
+    def statement(self, line, line_no):
+        if RAW_COMMAND.match(line):
+            self.emit("send", [lambda env, c=line: c], line_no, line)
+            return
+        word, _, rest = line.partition(" ")
+        command = word.lower()
+        rest = rest.strip()
+
+        assignment = ASSIGNMENT.match(line)
+        if assignment and command not in ("if", "elseif", "while"):
+            self.emit(
+                "set",
+                [assignment.group(1).lower(), compile_expression(assignment.group(2), line_no)],
+                line_no,
+                line,
+            )
+            return
+
+        handler = getattr(self, f"cmd_{command}", None)
+        if handler is None:
+            self.emit("ignored", [], line_no, line)
+            return
+        handler(rest, line_no, line)
+
+    # -- simple commands
+
+    def cmd_sendln(self, rest, line_no, line):
+        self.emit("send", compile_arguments(rest, line_no), line_no, line)
+
+    def cmd_send(self, rest, line_no, line):
+        self.cmd_sendln(rest, line_no, line)
+
+    def cmd_wait(self, rest, line_no, line):
+        args = compile_arguments(rest, line_no)
+        if not args:
+            raise MacroError(line_no, "wait needs at least one string")
+        self.emit("wait", args, line_no, line)
+
+    def cmd_waitln(self, rest, line_no, line):
+        self.cmd_wait(rest, line_no, line)
+
+    def cmd_waitregex(self, rest, line_no, line):
+        args = compile_arguments(rest, line_no)
+        if len(args) != 1:
+            raise MacroError(line_no, "waitregex needs one pattern")
+        self.emit("waitregex", args, line_no, line)
+
+    def cmd_pause(self, rest, line_no, line):
+        self.emit("pause", [compile_expression(rest, line_no), 1.0], line_no, line)
+
+    def cmd_mpause(self, rest, line_no, line):
+        self.emit("pause", [compile_expression(rest, line_no), 0.001], line_no, line)
+
+    def cmd_timeout(self, rest, line_no, line):
+        # "timeout 5" without '=' is accepted too.
+        self.emit("set", ["timeout", compile_expression(rest, line_no)], line_no, line)
+
+    def cmd_mtimeout(self, rest, line_no, line):
+        self.emit("set", ["mtimeout", compile_expression(rest, line_no)], line_no, line)
+
+    def cmd_dispstr(self, rest, line_no, line):
+        self.emit("display", compile_arguments(rest, line_no), line_no, line)
+
+    def cmd_flushrecv(self, rest, line_no, line):
+        self.emit("flush", [], line_no, line)
+
+    def cmd_end(self, rest, line_no, line):
+        self.emit("end", [], line_no, line)
+
+    def cmd_exit(self, rest, line_no, line):
+        self.emit("end", [], line_no, line)
+
+    # -- if / elseif / else / endif
+
+    def cmd_if(self, rest, line_no, line):
+        match = re.match(r"^(.*?)\s+then$", rest, re.IGNORECASE)
+        if match:
+            condition = compile_expression(match.group(1), line_no)
+            jump = self.emit("jump_if_false", [condition], line_no, line)
+            self.blocks.append({"kind": "if", "line": line_no, "next": jump, "exits": []})
+            return
+
+        # Single line form: if <expr> <statement>
+        for split in re.finditer(r"\s+", rest):
+            statement = rest[split.end():]
+            if not self._is_statement(statement):
+                continue
+            try:
+                condition = compile_expression(rest[: split.start()], line_no)
+            except MacroError:
+                continue
+            jump = self.emit("jump_if_false", [condition], line_no, line)
+            self.statement(statement, line_no)
+            self.code[jump].target = len(self.code)
+            return
+        raise MacroError(line_no, "if needs 'then' or a statement")
+
+    def _is_statement(self, text):
+        word = text.split(None, 1)[0].lower()
+        return bool(
+            RAW_COMMAND.match(text)
+            or ASSIGNMENT.match(text)
+            or getattr(self, f"cmd_{word}", None)
+        )
+
+    def cmd_elseif(self, rest, line_no, line):
+        block = self._block("if", line_no, "elseif")
+        block["exits"].append(self.emit("jump", [], line_no, line))
+        self.code[block["next"]].target = len(self.code)
+        match = re.match(r"^(.*?)\s+then$", rest, re.IGNORECASE)
+        condition = compile_expression(match.group(1) if match else rest, line_no)
+        block["next"] = self.emit("jump_if_false", [condition], line_no, line)
+
+    def cmd_else(self, rest, line_no, line):
+        block = self._block("if", line_no, "else")
+        block["exits"].append(self.emit("jump", [], line_no, line))
+        self.code[block["next"]].target = len(self.code)
+        block["next"] = None
+
+    def cmd_endif(self, rest, line_no, line):
+        block = self._block("if", line_no, "endif")
+        self.blocks.pop()
+        end = len(self.code)
+        if block["next"] is not None:
+            self.code[block["next"]].target = end
+        for jump in block["exits"]:
+            self.code[jump].target = end
+
+    # -- loops: do/loop, while/endwhile, for/next, break, continue
+
+    def _open_loop(self, kind, line_no, exits=(), var=None):
+        self.blocks.append(
+            {
+                "kind": kind,
+                "line": line_no,
+                "start": len(self.code) - len(exits),
+                "resume": None,
+                "exits": list(exits),
+                "continues": [],
+                "var": var,
+            }
+        )
+
+    def _close_loop(self, block):
+        end = len(self.code)
+        for jump in block["exits"]:
+            self.code[jump].target = end
+        resume = block["resume"] if block["resume"] is not None else block["start"]
+        for jump in block["continues"]:
+            self.code[jump].target = resume
+
+    def cmd_do(self, rest, line_no, line):
+        exits = []
+        if rest.lower().startswith("while"):
+            condition = compile_expression(rest[5:], line_no)
+            exits.append(self.emit("jump_if_false", [condition], line_no, line))
+        self._open_loop("do", line_no, exits)
+
+    def cmd_loop(self, rest, line_no, line):
+        block = self._block("do", line_no, "loop")
+        self.blocks.pop()
+        block["resume"] = len(self.code)
+        if rest.lower().startswith("while"):
+            condition = compile_expression(rest[5:], line_no)
+            self.emit("jump_if_true", [condition], line_no, line, block["start"])
+        elif rest.lower().startswith("until"):
+            condition = compile_expression(rest[5:], line_no)
+            self.emit("jump_if_false", [condition], line_no, line, block["start"])
+        else:
+            self.emit("jump", [], line_no, line, block["start"])
+        self._close_loop(block)
+
+    def cmd_while(self, rest, line_no, line):
+        condition = compile_expression(rest, line_no)
+        jump = self.emit("jump_if_false", [condition], line_no, line)
+        self._open_loop("while", line_no, [jump])
+
+    def cmd_endwhile(self, rest, line_no, line):
+        block = self._block("while", line_no, "endwhile")
+        self.blocks.pop()
+        self.emit("jump", [], line_no, line, block["start"])
+        self._close_loop(block)
+
+    def cmd_for(self, rest, line_no, line):
+        match = FOR_PATTERN.match(rest)
+        if not match:
+            raise MacroError(line_no, "for needs: for <var> <start> <end>")
+        var = match.group(1).lower()
+        self.emit("set", [var, compile_expression(match.group(2), line_no)], line_no, line)
+        end = compile_expression(match.group(3), line_no)
+        jump = self.emit("for_check", [var, end], line_no, line)
+        self._open_loop("for", line_no, [jump], var)
+
+    def cmd_next(self, rest, line_no, line):
+        block = self._block("for", line_no, "next")
+        self.blocks.pop()
+        block["resume"] = self.emit("for_next", [block["var"]], line_no, line, block["start"])
+        self._close_loop(block)
+
+    def cmd_break(self, rest, line_no, line):
+        block = self._loop_block(line_no, "break")
+        block["exits"].append(self.emit("jump", [], line_no, line))
+
+    def cmd_continue(self, rest, line_no, line):
+        block = self._loop_block(line_no, "continue")
+        block["continues"].append(self.emit("jump", [], line_no, line))
+
+    def _block(self, kind, line_no, keyword):
+        if not self.blocks or self.blocks[-1]["kind"] != kind:
+            raise MacroError(line_no, f"'{keyword}' without '{kind}'")
+        return self.blocks[-1]
+
+    def _loop_block(self, line_no, keyword):
+        for block in reversed(self.blocks):
+            if block["kind"] in ("do", "while", "for"):
+                return block
+        raise MacroError(line_no, f"'{keyword}' outside a loop")
+
+
+def compile_macro(source, name=""):
+    return MacroCompiler(name).compile(source)
+
+
+# -------------------------------------------------------------------- runtime
+
+
+class MacroStep:
+    __slots__ = ("op", "line_no", "text", "started", "duration", "result")
+
+    def __init__(self, op, line_no, text, started, duration, result):
+        self.op = op
+        self.line_no = line_no
+        self.text = text
+        self.started = started
+        self.duration = duration
+        self.result = result
+
+
+class MacroRunner:
+    def __init__(self, program, send, log, validator=None, default_timeout=10):
+        self.program = program
+        self.send = send
+        self.log = log
+        self.validator = validator
+        self.env = {"result": 0, "timeout": default_timeout, "mtimeout": 0, "inputstr": ""}
+        self.lines = deque(maxlen=2000)
+        self.condition = threading.Condition()
+        self.cancelled = False
+        self.steps = []
+        self.mismatches = []
+        self.corrections = []
+        self.last_line = None
+        self.started = None
+        self.finished = None
+
+    def on_line(self, line, timestamp=None):
+        if self.validator:
+            self.validator.observe(line)
+        with self.condition:
+            self.lines.append(line)
+            self.condition.notify()
+
+    def cancel(self):
+        with self.condition:
+            self.cancelled = True
+            self.condition.notify()
+
+    def run(self):
+        self.started = time.monotonic()
+        code = self.program.instructions
+        env = self.env
+        pc = 0
+
+        while not self.cancelled:
+            instruction = code[pc]
+            pc += 1
+            op = instruction.op
+
+            if op == "end":
+                break
+            elif op == "set":
+                env[instruction.args[0]] = instruction.args[1](env)
+            elif op == "jump":
+                pc = instruction.target
+            elif op == "jump_if_false":
+                if not instruction.args[0](env):
+                    pc = instruction.target
+            elif op == "jump_if_true":
+                if instruction.args[0](env):
+                    pc = instruction.target
+            elif op == "for_check":
+                if env.get(instruction.args[0], 0) > instruction.args[1](env):
+                    pc = instruction.target
+            elif op == "for_next":
+                env[instruction.args[0]] = env.get(instruction.args[0], 0) + 1
+                pc = instruction.target
+            elif op == "send":
+                command = "".join(str(arg(env)) for arg in instruction.args)
+                self._timed(instruction, lambda: self._send(command))
+            elif op == "wait":
+                patterns = [str(arg(env)) for arg in instruction.args]
+                self._timed(instruction, lambda: self._wait(patterns))
+            elif op == "waitregex":
+                pattern = re.compile(str(instruction.args[0](env)))
+                self._timed(instruction, lambda: self._wait([pattern], regex=True))
+            elif op == "pause":
+                seconds = instruction.args[0](env) * instruction.args[1]
+                self._timed(instruction, lambda: self._sleep(seconds))
+            elif op == "display":
+                self.log("".join(str(arg(env)) for arg in instruction.args))
+            elif op == "flush":
+                with self.condition:
+                    self.lines.clear()
+            elif op == "ignored":
+                self.log(f"ℹ️ Ignored non-command: {instruction.text}")
+
+        self.finished = time.monotonic()
+        return self.steps
+
+    def _timed(self, instruction, action):
+        started = time.monotonic()
+        result = action()
+        duration = time.monotonic() - started
+        self.steps.append(
+            MacroStep(
+                instruction.op, instruction.line_no, instruction.text, started, duration, result
+            )
+        )
+        return result
+
+    def _send(self, command):
+        rule = self.validator.rule_for(command) if self.validator else None
+        if rule is None and self.validator and command in self.validator.undecided:
+            self.log(
+                f"⚠️ [{command}] not validated: can't tell "
+                f"{' / '.join(self.validator.profiles_for(command))} apart. "
+                "Choose the device profile."
+            )
+        cached = self.validator.cached_response(rule) if rule else None
+        with self.condition:
+            self.lines.clear()
+            if cached is not None:
+                # Already confirmed on this IMEI; replay the reply so the
+                # macro's own wait still matches.
+                self.lines.append(cached)
+        if cached is not None:
+            self.log(f"⏭️ [{command}] already confirmed: {cached}")
+            return 1
+        reply = self.send(command)
+        if rule:
+            self._validate(command, rule, reply)
+        return 1
+
+    def _reply(self, rule, reply):
+        # A session's command scheduler hands back a future already paired
+        # with this command's STATUS# line; plain send functions don't, so
+        # fall back to watching the line stream.
+        if not isinstance(reply, Future):
+            return self.env["inputstr"] if self._wait([rule.reply], keep=True) else None
+        timeout = self._wait_timeout()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self.cancelled:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                response = reply.result(0.2 if remaining is None else min(remaining, 0.2)).response
+            except FutureTimeout:
+                # Also what the scheduler fails a future with when the
+                # reply never came.
+                if reply.done():
+                    break
+                continue
+            except Exception:
+                break
+            if response is None:
+                # Written, but there was no STATUS# prefix to pair it with.
+                return self.env["inputstr"] if self._wait([rule.reply], keep=True) else None
+            self.env["result"] = 1
+            self.env["inputstr"] = response
+            return response
+        self.env["result"] = 0
+        return None
+
+    def _validate(self, command, rule, reply=None):
+        response = self._reply(rule, reply)
+        if response is None:
+            self.log(f"❌ [{command}] no reply. Expected: {rule.expected}")
+            self.mismatches.append(
+                {"command": command, "expected": rule.expected, "received": None}
+            )
+            return
+        passed = rule.matches(response)
+        self.validator.replied(rule)
+        self.validator.record(rule, response, passed)
+        if passed:
+            self.log(f"✅ [{command}] matched: {rule.expected}")
+            return
+        self.log(f"❌ [{command}] mismatch. Expected: {rule.expected}, got: {response}")
+        self.mismatches.append(
+            {"command": command, "expected": rule.expected, "received": response}
+        )
+        if rule.set_command:
+            self.log(f"⚙️ Sending correction: {rule.set_command}")
+            self.send(rule.set_command)
+            self.corrections.append(rule.set_command)
+
+    def _wait_timeout(self):
+        seconds = self.env.get("timeout", 0) + self.env.get("mtimeout", 0) / 1000
+        return seconds if seconds > 0 else None
+
+    def _wait(self, patterns, regex=False, keep=False):
+        timeout = self._wait_timeout()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.condition:
+            while not self.cancelled:
+                while self.lines:
+                    line = self.lines.popleft()
+                    self.last_line = line
+                    for index, pattern in enumerate(patterns, 1):
+                        match = pattern.search(line) if regex else pattern in line
+                        if match:
+                            if keep:
+                                self.lines.appendleft(line)
+                            self.env["result"] = index
+                            self.env["inputstr"] = line
+                            if regex:
+                                for group, value in enumerate(match.groups(), 1):
+                                    self.env[f"groupmatchstr{group}"] = value or ""
+                            return index
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+        self.env["result"] = 0
+        return 0
+
+    def _sleep(self, seconds):
+        with self.condition:
+            deadline = time.monotonic() + seconds
+            while not self.cancelled:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+        return 1
+
+    @property
+    def timed_out_waits(self):
+        return [
+            step for step in self.steps if step.op in ("wait", "waitregex") and not step.result
+        ]
+
+    def summary(self):
+        total = (self.finished or time.monotonic()) - self.started
+        waits = [step for step in self.steps if step.op in ("wait", "waitregex")]
+        matched = [step for step in waits if step.result]
+        lines = [
+            f"Macro {self.program.name}: {total:.2f}s, {len(self.steps)} steps, "
+            f"{len(matched)}/{len(waits)} waits matched"
+        ]
+        for step in self.steps:
+            lines.append(
+                f"  line {step.line_no}: {step.text} -> {step.result} "
+                f"in {step.duration * 1000:.0f} ms"
+            )
+        return "\n".join(lines)
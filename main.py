@@ -1,7 +1,28 @@
-import tkinter as tk
-from ui import UI
+import sys
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = UI(root)
-    root.mainloop()
\ No newline at end of file
+    if "--headless" in sys.argv[1:]:
+        from headless import main
+
+        main([arg for arg in sys.argv[1:] if arg != "--headless"])
+    else:
+        # Capture starts before tkinter is even imported, so what a TCU sends
+        # while the window is still being built at boot is already logged.
+        from capture_process import CaptureProcess, gui_options
+
+        in_process, options = gui_options(sys.argv[1:])
+        capture = None
+        if not in_process:
+            import time
+            from metrics import process_start_time
+
+            started_at = process_start_time() or time.time()
+            capture = CaptureProcess(started_at=started_at, **options)
+
+        import tkinter as tk
+        from ui import UI
+
+        root = tk.Tk()
+        app = UI(root, capture=capture, options=options)
+        root.mainloop()
+        app.close()
\ No newline at end of file
@@ -0,0 +1,325 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Histogram:
+    # Observed from a single thread each (writer, UI tick, port monitor);
+    # scrapes only read, so no lock is needed.
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        return list(self.counts)
+
+    def quantile(self, q, since=None):
+        counts = self.counts
+        if since is not None:
+            counts = [now - before for now, before in zip(counts, since)]
+        total = sum(counts)
+        if not total:
+            return None
+        running = 0
+        for index, count in enumerate(counts):
+            running += count
+            if running >= q * total:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def render(self, name, labels=None):
+        labels = labels or {}
+        lines = []
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            running += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{format_labels(dict(labels, le=le))} {running}")
+        lines.append(f"{name}_sum{format_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        return lines
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def process_stats():
+    # CPU seconds and resident bytes. The resource module is Unix only, so
+    # on Windows the CPU time comes from os.times() and RSS is None.
+    times = os.times()
+    cpu = times.user + times.system
+    try:
+        with open("/proc/self/statm") as f:
+            return cpu, int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return cpu, None
+    return cpu, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def process_start_time():
+    # Wall-clock time the kernel started this process, so startup stages
+    # count the interpreter and imports too. None off Linux.
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        ticks = os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+    return time.time() - (uptime - int(fields[19]) / ticks)
+
+
+def collect(manager):
+    out = []
+
+    def metric(name, kind, help_text, samples):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            out.append(f"{name}{format_labels(labels)} {value}")
+
+    sessions = list(manager.sessions.values())
+    ports = [({"port": s.port_name}, s) for s in sessions]
+    metric("aepl_port_connected", "gauge", "1 while the port is being logged",
+           [(labels, int(s.is_alive)) for labels, s in ports])
+    metric("aepl_port_bytes_total", "counter", "Bytes read in the current session",
+           [(labels, s.reader_stats.bytes) for labels, s in ports])
+    metric("aepl_port_lines_total", "counter", "Lines framed in the current session",
+           [(labels, s.reader_stats.lines) for labels, s in ports])
+    metric("aepl_reader_cpu_seconds_total", "counter", "CPU time of the reader thread",
+           [(labels, round(s.reader_stats.cpu_time, 6)) for labels, s in ports])
+    metric("aepl_port_connects_total", "counter", "Sessions opened per port",
+           [({"port": port}, count) for port, count in sorted(manager.connects.items())])
+    metric("aepl_port_disconnects_total", "counter", "Sessions closed per port",
+           [({"port": port}, count) for port, count in sorted(manager.disconnects.items())])
+    metric("aepl_trigger_matches_total", "counter", "Lines matched by counting trigger rules",
+           [({"port": s.port_name, "rule": rule}, count)
+            for s in sessions if s.triggers
+            for rule, count in sorted(s.triggers.snapshot().items())])
+
+    metric("aepl_command_queue_depth", "gauge", "Commands queued or awaiting a reply",
+           [(labels, s.commands.depth()) for labels, s in ports])
+    metric("aepl_commands_sent_total", "counter", "Commands written to the port",
+           [(labels, s.commands.sent) for labels, s in ports])
+    metric("aepl_command_timeouts_total", "counter", "Commands whose reply never came",
+           [(labels, s.commands.timeouts) for labels, s in ports])
+    out.append("# HELP aepl_command_latency_seconds Time from write to STATUS# reply")
+    out.append("# TYPE aepl_command_latency_seconds histogram")
+    for labels, s in ports:
+        out.extend(s.commands.latency.render("aepl_command_latency_seconds", labels))
+
+    queues = [({"queue": "main"}, manager.log_queue)] + [
+        ({"queue": s.port_name}, s.log_queue) for s in sessions
+    ]
+    metric("aepl_display_queue_depth", "gauge", "Messages waiting for the display",
+           [(labels, q.qsize()) for labels, q in queues])
+    metric("aepl_display_dropped_total", "counter", "Messages the display queue dropped",
+           [(labels, q.dropped_total) for labels, q in queues])
+
+    writers = [({"writer": str(i)}, w) for i, w in enumerate(manager.writers.writers)]
+    metric("aepl_writer_queue_depth", "gauge", "Operations waiting for the log writer",
+           [(labels, w.queue.qsize()) for labels, w in writers])
+    metric("aepl_writer_bytes_total", "counter", "Bytes handed to log files",
+           [(labels, w.bytes_written) for labels, w in writers])
+    metric("aepl_writer_batches_total", "counter", "Group commits",
+           [(labels, w.batches) for labels, w in writers])
+    out.append("# HELP aepl_writer_commit_seconds Time to write and flush one batch")
+    out.append("# TYPE aepl_writer_commit_seconds histogram")
+    for labels, w in writers:
+        out.extend(w.commit_latency.render("aepl_writer_commit_seconds", labels))
+
+    out.append("# HELP aepl_ui_render_seconds Time the front end took per display tick")
+    out.append("# TYPE aepl_ui_render_seconds histogram")
+    out.extend(manager.render_time.render("aepl_ui_render_seconds"))
+    if manager.remote_ui:
+        metric("aepl_ui_backlog_lines", "gauge", "Lines sent to the GUI process, not yet rendered",
+               [({}, manager.ui.backlog())])
+    metric("aepl_startup_seconds", "gauge", "Time from process start to each startup stage",
+           [({"stage": stage}, round(seconds, 3)) for stage, seconds in list(manager.startup.items())])
+    out.append("# HELP aepl_port_probe_seconds Time to open and sniff a candidate port")
+    out.append("# TYPE aepl_port_probe_seconds histogram")
+    out.extend(manager.probe_time.render("aepl_port_probe_seconds"))
+
+    if manager.tap:
+        metric("aepl_tap_subscribers", "gauge", "Clients on the live stream tap",
+               [({}, len(manager.tap.subscribers))])
+        metric("aepl_tap_lagged_total", "counter", "Entries slow tap clients skipped",
+               [({}, manager.tap.lagged_total)])
+
+    cpu, rss = process_stats()
+    metric("aepl_process_cpu_seconds_total", "counter", "Process CPU time", [({}, round(cpu, 3))])
+    if rss is not None:
+        metric("aepl_process_resident_bytes", "gauge", "Resident set size", [({}, rss)])
+    metric("aepl_process_threads", "gauge", "Live threads", [({}, threading.active_count())])
+    return "\n".join(out) + "\n"
+
+
+class StatsReporter:
+    # Puts one summary line on the main queue every interval, with rates
+    # over the interval rather than since start.
+    def __init__(self, manager, interval):
+        self.manager = manager
+        self.interval = interval
+        self.last_time = time.monotonic()
+        self.last_ports = {}
+        self.last_dropped = 0
+        self.last_commit = [w.commit_latency.snapshot() for w in manager.writers.writers]
+        self.last_render = manager.render_time.snapshot()
+        manager.after(int(interval * 1000), self.report)
+
+    def report(self):
+        try:
+            self.manager.log_queue.put(self.line())
+        finally:
+            self.manager.after(int(self.interval * 1000), self.report)
+
+    def line(self):
+        manager = self.manager
+        now = time.monotonic()
+        elapsed = max(now - self.last_time, 1e-6)
+        self.last_time = now
+
+        parts = []
+        ports = {}
+        for session in list(manager.sessions.values()):
+            stats = session.reader_stats
+            ports[session.port_name] = (stats.started, stats.lines, stats.bytes)
+            started, lines, nbytes = self.last_ports.get(session.port_name, (None, 0, 0))
+            if started != stats.started:
+                lines = nbytes = 0
+            parts.append(
+                f"{os.path.basename(session.port_name)} {(stats.lines - lines) / elapsed:.0f} lines/s "
+                f"{(stats.bytes - nbytes) / elapsed / 1024:.1f} KB/s"
+            )
+        self.last_ports = ports
+
+        queues = [manager.log_queue] + [s.log_queue for s in list(manager.sessions.values())]
+        dropped = sum(q.dropped_total for q in queues)
+        commit = [
+            w.commit_latency.quantile(0.99, since)
+            for w, since in zip(manager.writers.writers, self.last_commit)
+        ]
+        commit = [value for value in commit if value is not None]
+        render = manager.render_time.quantile(0.99, self.last_render)
+        self.last_commit = [w.commit_latency.snapshot() for w in manager.writers.writers]
+        self.last_render = manager.render_time.snapshot()
+
+        fmt = lambda seconds: "-" if seconds is None else f"<={seconds * 1000:g} ms"
+        line = (
+            f"Stats: {' | '.join(parts) or 'no devices'} | "
+            f"queue {sum(q.qsize() for q in queues)} | dropped +{dropped - self.last_dropped} | "
+            f"commit p99 {fmt(max(commit) if commit else None)} | render p99 {fmt(render)}"
+        )
+        self.last_dropped = dropped
+        return line
+
+
+def sample_profile(seconds=10.0, interval=0.005):
+    # Collapsed stacks ("thread;outer;...;inner count"), the input format of
+    # flamegraph.pl, speedscope and similar tools.
+    me = threading.get_ident()
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                frame = frame.f_back
+            frames.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(frames))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def dump_profile(manager, seconds=10.0):
+    def run():
+        path = os.path.join("logs", f"profile_{time.strftime('%Y%m%d_%H%M%S')}.folded")
+        with open(path, "w") as f:
+            f.write(sample_profile(seconds))
+        manager.log_queue.put(f"Profile written to {path}")
+
+    manager.log_queue.put(f"Profiling for {seconds:g}s...")
+    threading.Thread(target=run, name="profiler", daemon=True).start()
+
+
+class MetricsServer:
+    def __init__(self, manager, port, host="127.0.0.1"):
+        # Imported here, not at the top: http.server is slow to import and
+        # SerialManager starts this after the port monitor is already running.
+        import http.server
+        from urllib.parse import parse_qs, urlparse
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/metrics":
+                    body = collect(manager)
+                    content_type = "text/plain; version=0.0.4"
+                elif url.path == "/profile":
+                    query = parse_qs(url.query)
+                    try:
+                        seconds = float(query.get("seconds", ["10"])[0])
+                    except ValueError:
+                        seconds = 0.0
+                    if not seconds > 0:
+                        self.send_error(400, "seconds must be a positive number")
+                        return
+                    body = sample_profile(min(seconds, 120.0))
+                    content_type = "text/plain"
+                else:
+                    self.send_error(404, "Try /metrics or /profile?seconds=10")
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="metrics", daemon=True
+        )
+        self.thread.start()
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
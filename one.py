@@ -1,13 +1,26 @@
 #!/usr/bin/env python3
 import os
+import sqlite3
 import subprocess
 import platform
+import tempfile
 import time
 from datetime import datetime
+from fs_watch import DirectoryWatcher
+from log_sink import SEGMENT_MANIFEST, publish_closed_segment
 
 BASE_LOG_DIR = "/home/Sharukh/CIAP/logs"
 ONEDRIVE_ROOT = "AEPL:/Rpi_Logs"
 UPLOADED_LOGS_FILE = f"{BASE_LOG_DIR}/uploaded_logs.txt"
+UPLOAD_STATE_DB = f"{BASE_LOG_DIR}/upload_state.db"
+SEGMENT_MANIFEST_FILE = f"{BASE_LOG_DIR}/{SEGMENT_MANIFEST}"
+LOG_EXTENSIONS = (".log", ".log.gz", ".log.zst")
+CYCLE_SECONDS = 30
+UPLOAD_DEBOUNCE_SECONDS = 0.5
+RCLONE_TRANSFERS = 4
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+MANIFEST_COMPACT_BYTES = 64 * 1024
 
 def is_connected_to_wifi():
     try:
@@ -23,22 +36,19 @@ def is_connected_to_wifi():
         print(f"Error checking Wi-Fi: {e}")
         return False
 
-def is_file_open(file_path):
-    try:
-        result = subprocess.run(['lsof', file_path], capture_output=True, text=True)
-        return bool(result.stdout.strip())
-    except Exception as e:
-        print(f"Error checking if file is open: {e}")
-        return False
+def is_log_file(file_path):
+    # The logger writes segments as "*.part" and renames them when they are
+    # closed, so anything matching here is complete and safe to upload.
+    file = os.path.basename(file_path)
+    return file.endswith(LOG_EXTENSIONS) and file.startswith("serial_log_")
 
 def get_all_log_files():
     log_files = []
     for root, dirs, files in os.walk(BASE_LOG_DIR):
         for file in files:
-            if file.endswith(".log") and file.startswith("serial_log_"):
-                full_path = os.path.join(root, file)
-                date_part = os.path.basename(os.path.dirname(full_path))
-                log_files.append((full_path, date_part))
+            full_path = os.path.join(root, file)
+            if is_log_file(full_path):
+                log_files.append(full_path)
     return log_files
 
 def load_uploaded_logs():
@@ -47,53 +57,244 @@ def load_uploaded_logs():
     with open(UPLOADED_LOGS_FILE, 'r') as f:
         return set(line.strip() for line in f.readlines())
 
-def mark_log_as_uploaded(log_file):
-    with open(UPLOADED_LOGS_FILE, 'a') as f:
-        f.write(log_file + '\n')
 
-def upload_to_onedrive(file_path, hostname, date_part):
-    if not os.path.isfile(file_path):
-        print(f"File not found: {file_path}")
-        return
+class UploadState:
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(db_path)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS uploads (
+                name TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime REAL,
+                uploaded_at TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0
+            )"""
+        )
+        self.db.commit()
+
+    def import_legacy(self, uploaded_logs_file):
+        if not os.path.exists(uploaded_logs_file):
+            return
+        names = load_uploaded_logs()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO uploads (name, uploaded_at) VALUES (?, 'legacy')",
+                [(name,) for name in names if name],
+            )
+        os.replace(uploaded_logs_file, uploaded_logs_file + ".imported")
+        print(f"Imported {len(names)} entries from {uploaded_logs_file}")
+
+    def needs_upload(self, file_path, stat=None):
+        row = self.db.execute(
+            "SELECT size, mtime, uploaded_at FROM uploads WHERE name = ?",
+            (os.path.basename(file_path),),
+        ).fetchone()
+        if row is None or row[2] is None:
+            return True
+        size, mtime, _ = row
+        if size is None:
+            return False
+        stat = stat or os.stat(file_path)
+        return stat.st_size != size or stat.st_mtime != mtime
+
+    def ready_at(self, file_path):
+        row = self.db.execute(
+            "SELECT next_attempt FROM uploads WHERE name = ?",
+            (os.path.basename(file_path),),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def mark_uploaded(self, file_paths):
+        now = datetime.now().isoformat(timespec="seconds")
+        rows = []
+        for file_path in file_paths:
+            stat = os.stat(file_path)
+            rows.append((os.path.basename(file_path), stat.st_size, stat.st_mtime, now))
+        with self.db:
+            self.db.executemany(
+                """INSERT INTO uploads (name, size, mtime, uploaded_at, attempts, next_attempt)
+                   VALUES (?, ?, ?, ?, 0, 0)
+                   ON CONFLICT(name) DO UPDATE SET size = excluded.size,
+                       mtime = excluded.mtime, uploaded_at = excluded.uploaded_at,
+                       attempts = 0, next_attempt = 0""",
+                rows,
+            )
+
+    def mark_failed(self, file_paths):
+        now = time.time()
+        with self.db:
+            for file_path in file_paths:
+                name = os.path.basename(file_path)
+                row = self.db.execute(
+                    "SELECT attempts FROM uploads WHERE name = ?", (name,)
+                ).fetchone()
+                attempts = (row[0] if row else 0) + 1
+                delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+                self.db.execute(
+                    """INSERT INTO uploads (name, attempts, next_attempt) VALUES (?, ?, ?)
+                       ON CONFLICT(name) DO UPDATE SET attempts = excluded.attempts,
+                           next_attempt = excluded.next_attempt""",
+                    (name, attempts, now + delay),
+                )
 
+
+def upload_batch(date_dir, file_paths, hostname):
+    date_part = os.path.basename(date_dir)
     remote_dir = f"{ONEDRIVE_ROOT}/{hostname}/{date_part}"
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("".join(os.path.basename(p) + "\n" for p in file_paths))
+        files_from = f.name
     try:
         result = subprocess.run(
-            ["/usr/bin/rclone", "copy", file_path, remote_dir],
+            [
+                "/usr/bin/rclone",
+                "copy",
+                date_dir,
+                remote_dir,
+                "--files-from",
+                files_from,
+                "--no-traverse",
+                "--transfers",
+                str(RCLONE_TRANSFERS),
+            ],
             capture_output=True,
-            text=True
+            text=True,
         )
         if result.returncode == 0:
-            print(f"Uploaded: {file_path} → {remote_dir}")
-            mark_log_as_uploaded(os.path.basename(file_path))
-        else:
-            print(f"Upload error: {result.stderr}")
+            print(f"Uploaded {len(file_paths)} file(s): {date_dir} → {remote_dir}")
+            return True
+        print(f"Upload error: {result.stderr}")
     except Exception as e:
         print(f"Upload failed: {e}")
+    finally:
+        os.remove(files_from)
+    return False
 
-def main():
-    if is_connected_to_wifi():
-        uploaded_logs = load_uploaded_logs()
-        hostname = platform.node()
 
-        for file_path, date_part in get_all_log_files():
-            file_name = os.path.basename(file_path)
+class Uploader:
+    def __init__(self):
+        self.state = UploadState(UPLOAD_STATE_DB)
+        self.state.import_legacy(UPLOADED_LOGS_FILE)
+        self.hostname = platform.node()
+        self.watcher = DirectoryWatcher.create(BASE_LOG_DIR)
+        if self.watcher is None:
+            print("inotify unavailable, following the closed segment manifest.")
+        self.manifest_offset = 0
+        self.pending = set()
+        self.rescan()
+        self.read_manifest()
+
+    def rescan(self):
+        for file_path in get_all_log_files():
+            if self.state.needs_upload(file_path):
+                self.pending.add(file_path)
+
+    def read_manifest(self, manifest_path=SEGMENT_MANIFEST_FILE):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                f.seek(self.manifest_offset)
+                chunk = f.read()
+        except OSError:
+            return False
+        # Only consume complete lines; a partial one is picked up next time.
+        complete = chunk[: chunk.rfind("\n") + 1]
+        self.manifest_offset += len(complete.encode("utf-8"))
+        found = False
+        for file_path in complete.splitlines():
+            if is_log_file(file_path) and self.state.needs_upload(file_path):
+                self.pending.add(file_path)
+                found = True
+        return found
+
+    def compact_manifest(self):
+        # The logger only ever appends to the manifest. Once enough has been
+        # read, swap in a fresh one that lists just what still waits for
+        # upload; uploaded entries live on in the sqlite state.
+        if self.manifest_offset < MANIFEST_COMPACT_BYTES:
+            return
+        old_path = SEGMENT_MANIFEST_FILE + ".old"
+        try:
+            os.replace(SEGMENT_MANIFEST_FILE, old_path)
+        except OSError:
+            return
+        # The logger opens the manifest for every line, so a line published
+        # during the swap went to the old file: let it finish, then read it.
+        time.sleep(UPLOAD_DEBOUNCE_SECONDS)
+        self.read_manifest(old_path)
+        self.manifest_offset = 0
+        for file_path in sorted(self.pending):
+            publish_closed_segment(SEGMENT_MANIFEST_FILE, file_path)
+        os.remove(old_path)
+
+    def wait_for_files(self, timeout):
+        # Return as soon as a segment is closed (plus a short debounce so a
+        # burst of rotations goes out as one batch), or when timeout expires.
+        deadline = time.monotonic() + timeout
+        found = False
+        while not found:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self.watcher is None:
+                time.sleep(min(remaining, 0.5))
+                found = self.read_manifest()
+                continue
+            for file_path in self.watcher.read(remaining):
+                if is_log_file(file_path):
+                    self.pending.add(file_path)
+                    found = True
+            if self.watcher.overflowed:
+                self.watcher.overflowed = False
+                self.rescan()
+
+        time.sleep(UPLOAD_DEBOUNCE_SECONDS)
+        if self.watcher is None:
+            self.read_manifest()
+            return
+        for file_path in self.watcher.read(0):
+            if is_log_file(file_path):
+                self.pending.add(file_path)
 
-            if file_name in uploaded_logs:
-                print(f"Already uploaded: {file_name}")
+    def run_cycle(self):
+        if not self.pending:
+            return
+        if not is_connected_to_wifi():
+            print("Wi-Fi not connected. Skipping upload.")
+            return
+
+        now = time.time()
+        batches = {}
+        for file_path in list(self.pending):
+            if not os.path.isfile(file_path):
+                self.pending.discard(file_path)
+                continue
+            if not self.state.needs_upload(file_path):
+                self.pending.discard(file_path)
                 continue
-            if is_file_open(file_path):
-                print(f"Skipping open file: {file_name}")
+            if self.state.ready_at(file_path) > now:
                 continue
+            batches.setdefault(os.path.dirname(file_path), []).append(file_path)
 
-            upload_to_onedrive(file_path, hostname, date_part)
-    else:
-        print("Wi-Fi not connected. Skipping upload.")
+        for date_dir, file_paths in sorted(batches.items()):
+            if upload_batch(date_dir, file_paths, self.hostname):
+                self.state.mark_uploaded(file_paths)
+                self.pending.difference_update(file_paths)
+            else:
+                self.state.mark_failed(file_paths)
+        self.compact_manifest()
+
+    def run_forever(self):
+        while True:
+            self.run_cycle()
+            self.wait_for_files(CYCLE_SECONDS)
+
+def main():
+    Uploader().run_cycle()
 
 def main_loop():
-    while True:
-        main()
-        time.sleep(30) 
+    Uploader().run_forever()
 
 if __name__ == "__main__":
     main_loop()
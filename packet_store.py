@@ -0,0 +1,410 @@
+import argparse
+import array
+import os
+import re
+import struct
+import sys
+import time
+from collections import Counter
+
+NPY_HEADER_SIZE = 128
+BYTE_ORDER = "<" if sys.byteorder == "little" else ">"
+NPY_DESCR = {"q": "i8", "d": "f8", "B": "u1", "H": "u2", "I": "u4"}
+NAN = float("nan")
+
+
+def load_numpy():
+    # numpy is only for reading stores back; the recorder runs in the
+    # capture path and must not pay for importing it.
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def npy_header(descr, count):
+    # Fixed size, so the record count can be rewritten in place as we append.
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, count)
+    header = header.ljust(NPY_HEADER_SIZE - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+def column_descr(kind):
+    if isinstance(kind, int):
+        return f"|S{kind}"
+    size = NPY_DESCR[kind]
+    return ("|" if size == "u1" else BYTE_ORDER) + size
+
+
+class NpyColumn:
+    def __init__(self, path, kind):
+        self.kind = kind
+        self.descr = column_descr(kind)
+        self.count = 0
+        self.file = open(path, "wb")
+        self.file.write(npy_header(self.descr, 0))
+
+    def append(self, data, count):
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(data)
+        self.count += count
+        self.file.seek(0)
+        self.file.write(npy_header(self.descr, self.count))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# ------------------------------------------------------------------ families
+
+def nmea_degrees(value, hemisphere):
+    if not value:
+        return NAN
+    point = value.find(".")
+    degrees = float(value[: point - 2]) + float(value[point - 2 :]) / 60
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+
+def signed(value, hemisphere):
+    if not value:
+        return NAN
+    return -float(value) if hemisphere in ("S", "W") else float(value)
+
+
+def number(value, default=NAN):
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+def integer(value):
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def parse_rmc(line):
+    # $GPRMC/$GNRMC,hhmmss.ss,A,llll.ll,a,yyyyy.yy,a,knots,course,ddmmyy,...
+    start = line.find("RMC,")
+    if start < 3 or line[start - 3] != "$":
+        return None
+    fields = line[start + 4 :].split(",")
+    if len(fields) < 9:
+        return None
+    return (
+        1 if fields[1] == "A" else 0,
+        nmea_degrees(fields[2], fields[3]),
+        nmea_degrees(fields[4], fields[5]),
+        number(fields[6]) * 1.852,
+        number(fields[7]),
+    )
+
+
+def parse_ais140(line):
+    # AIS-140 location packet: $Header,Vendor,Firmware,Type,AlertID,L/H,IMEI,
+    # RegNo,Fix,ddmmyyyy,hhmmss,Lat,N,Lon,E,Speed,Heading,Sats,Alt,PDOP,HDOP,
+    # Operator,Ignition,MainPower,MainVolts,BatteryVolts,Emergency,Tamper,GSM,...
+    start = line.find("$")
+    if start < 0:
+        return None
+    fields = line[start:].split(",")
+    if len(fields) < 29 or len(fields[6]) != 15 or not fields[6].isdigit():
+        return None
+    return (
+        integer(fields[4]),
+        fields[5][:1].encode(),
+        integer(fields[8]),
+        signed(fields[11], fields[12]),
+        signed(fields[13], fields[14]),
+        number(fields[15]),
+        number(fields[16]),
+        integer(fields[17]),
+        number(fields[18]),
+        number(fields[20]),
+        integer(fields[22]),
+        integer(fields[23]),
+        number(fields[24]),
+        number(fields[25]),
+        integer(fields[26]),
+        integer(fields[28]),
+    )
+
+
+CAN_FRAME = re.compile(
+    r"\bCAN\b[\s:,#]*(?:ID[\s:=]*)?(?:0x)?(?P<id>[0-9A-Fa-f]{3,8})[\s:,#]+"
+    r"(?:DLC[\s:=]*)?(?P<dlc>[0-8])[\s:,#]+"
+    r"(?P<data>[0-9A-Fa-f]{2}(?:[\s:,]?[0-9A-Fa-f]{2}){0,7})"
+)
+
+
+def parse_can(line):
+    match = CAN_FRAME.search(line)
+    if not match:
+        return None
+    data = bytes.fromhex(re.sub(r"[\s:,]", "", match.group("data")))
+    return (int(match.group("id"), 16), int(match.group("dlc")), data[:8])
+
+
+class PacketFamily:
+    def __init__(self, name, keyword, parse, columns):
+        self.name = name
+        self.keyword = keyword
+        self.parse = parse
+        # ts_ms is always the first column: the reader's timestamp for the line.
+        self.columns = [("ts_ms", "q")] + columns
+
+
+FAMILIES = [
+    PacketFamily("can", "CAN", parse_can, [("can_id", "I"), ("dlc", "B"), ("data", 8)]),
+    PacketFamily(
+        "gps",
+        "RMC,",
+        parse_rmc,
+        [("fix", "B"), ("lat", "d"), ("lon", "d"), ("speed_kmh", "d"), ("course", "d")],
+    ),
+    PacketFamily(
+        "ais",
+        "$",
+        parse_ais140,
+        [
+            ("alert_id", "H"), ("status", 1), ("fix", "B"), ("lat", "d"), ("lon", "d"),
+            ("speed_kmh", "d"), ("heading", "d"), ("satellites", "B"), ("altitude", "d"),
+            ("hdop", "d"), ("ignition", "B"), ("main_power", "B"), ("main_volts", "d"),
+            ("battery_volts", "d"), ("emergency", "B"), ("gsm_signal", "B"),
+        ],
+    ),
+]
+
+
+class ColumnBuffer:
+    def __init__(self, family):
+        self.family = family
+        self.columns = [
+            bytearray() if isinstance(kind, int) else array.array(kind)
+            for _, kind in family.columns
+        ]
+        self.widths = [kind if isinstance(kind, int) else None for _, kind in family.columns]
+        self.count = 0
+
+    def append(self, values):
+        for column, width, value in zip(self.columns, self.widths, values):
+            if width is None:
+                column.append(value)
+            else:
+                column += value[:width].ljust(width, b"\0")
+        self.count += 1
+
+
+class PacketStore:
+    def __init__(self, directory, families=FAMILIES):
+        self.directory = directory
+        self.families = {family.name: family for family in families}
+        self.files = {}
+        self.closed = False
+
+    def append(self, buffer):
+        # Reopening a column after close would truncate it with "wb".
+        if self.closed:
+            raise ValueError(f"packet store {self.directory} is closed")
+        family = buffer.family
+        files = self.files.get(family.name)
+        if files is None:
+            folder = os.path.join(self.directory, family.name)
+            os.makedirs(folder, exist_ok=True)
+            files = self.files[family.name] = [
+                NpyColumn(os.path.join(folder, f"{name}.npy"), kind)
+                for name, kind in family.columns
+            ]
+        for column_file, column in zip(files, buffer.columns):
+            column_file.append(
+                column if isinstance(column, bytearray) else column.tobytes(), buffer.count
+            )
+
+    def close(self):
+        for files in self.files.values():
+            for column_file in files:
+                column_file.close()
+        self.files = {}
+        self.closed = True
+
+
+class PacketRecorder:
+    # A line listener: decodes known packets on the reader thread and hands
+    # full column buffers to the session's log writer thread for the disk I/O.
+    def __init__(self, writer, directory_factory, families=FAMILIES, batch_records=4096):
+        self.writer = writer
+        self.directory_factory = directory_factory
+        self.families = families
+        self.batch_records = batch_records
+        self.buffers = {family.name: ColumnBuffer(family) for family in families}
+        self.store = None
+        self.closed = False
+        self.counts = Counter()
+        self.unparsed = Counter()
+        self._second = None
+        self._second_ms = 0
+
+    def timestamp_ms(self, timestamp):
+        second = timestamp[:19]
+        if second != self._second:
+            self._second = second
+            self._second_ms = int(time.mktime(time.strptime(second, "%Y-%m-%d %H:%M:%S"))) * 1000
+        return self._second_ms + int(timestamp[20:23] or 0)
+
+    def on_line(self, line, timestamp):
+        if self.closed:
+            return
+        for family in self.families:
+            if family.keyword not in line:
+                continue
+            try:
+                values = family.parse(line)
+            except (ValueError, IndexError):
+                values = None
+            if values is None:
+                self.unparsed[family.name] += 1
+                continue
+            buffer = self.buffers[family.name]
+            buffer.append((self.timestamp_ms(timestamp),) + values)
+            self.counts[family.name] += 1
+            if buffer.count >= self.batch_records:
+                self._hand_off(family)
+            return
+
+    def _hand_off(self, family):
+        buffer = self.buffers[family.name]
+        self.buffers[family.name] = ColumnBuffer(family)
+        self.writer.call(lambda: self._store().append(buffer))
+
+    def _store(self):
+        if self.store is None:
+            self.store = PacketStore(self.directory_factory())
+        return self.store
+
+    def close(self):
+        self.closed = True
+        for family in self.families:
+            if self.buffers[family.name].count:
+                self._hand_off(family)
+        self.writer.call(lambda: self.store and self.store.close())
+
+    def summary(self):
+        decoded = ", ".join(f"{name} {count}" for name, count in sorted(self.counts.items()))
+        return f"Packets: {decoded or 'none'} ({sum(self.unparsed.values())} unparsed)"
+
+
+# ------------------------------------------------------------------ reading
+
+def read_npy(path):
+    with open(path, "rb") as f:
+        prefix = f.read(10)
+        (header_length,) = struct.unpack("<H", prefix[8:10])
+        header = f.read(header_length).decode("latin1")
+    descr = re.search(r"'descr': '([^']+)'", header).group(1)
+    count = int(re.search(r"'shape': \((\d+),", header).group(1))
+    numpy = load_numpy()
+    if numpy is not None:
+        return numpy.memmap(path, dtype=descr, mode="r", offset=10 + header_length, shape=(count,))
+
+    with open(path, "rb") as f:
+        f.seek(10 + header_length)
+        data = f.read()
+    if descr.startswith("|S"):
+        width = int(descr[2:])
+        return [data[i : i + width] for i in range(0, count * width, width)]
+    code = {v: k for k, v in NPY_DESCR.items()}[descr[1:]]
+    values = array.array(code)
+    values.frombytes(data[: count * values.itemsize])
+    if descr[0] not in ("|", BYTE_ORDER):
+        values.byteswap()
+    return values
+
+
+def load_family(directory, family):
+    folder = os.path.join(directory, family)
+    if not os.path.isdir(folder):
+        return {}
+    return {
+        name[: -len(".npy")]: read_npy(os.path.join(folder, name))
+        for name in sorted(os.listdir(folder))
+        if name.endswith(".npy")
+    }
+
+
+def can_id_histogram(directory, top=10):
+    ids = load_family(directory, "can").get("can_id")
+    if ids is None or not len(ids):
+        return []
+    numpy = load_numpy()
+    if numpy is not None:
+        values, counts = numpy.unique(ids, return_counts=True)
+        order = numpy.argsort(counts)[::-1][:top]
+        return [(int(values[i]), int(counts[i])) for i in order]
+    return Counter(ids).most_common(top)
+
+
+def fix_gaps(directory, min_gap_s=5.0):
+    gaps = []
+    numpy = load_numpy()
+    for family in ("gps", "ais"):
+        columns = load_family(directory, family)
+        if not columns:
+            continue
+        ts, fix = columns["ts_ms"], columns["fix"]
+        if numpy is not None:
+            fixed = numpy.asarray(ts)[numpy.asarray(fix) == 1]
+            steps = numpy.diff(fixed)
+            for i in numpy.nonzero(steps > min_gap_s * 1000)[0]:
+                gaps.append((family, int(fixed[i]), int(steps[i])))
+        else:
+            fixed = [t for t, f in zip(ts, fix) if f == 1]
+            for previous, current in zip(fixed, fixed[1:]):
+                if current - previous > min_gap_s * 1000:
+                    gaps.append((family, previous, current - previous))
+    return gaps
+
+
+def export_parquet(directory, family):
+    import numpy
+    import pyarrow
+    import pyarrow.parquet
+
+    columns = load_family(directory, family)
+    table = pyarrow.table({name: numpy.asarray(values) for name, values in columns.items()})
+    path = os.path.join(directory, f"{family}.parquet")
+    pyarrow.parquet.write_table(table, path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise a session's decoded packets")
+    parser.add_argument("directory", help="a logs/<date>/packets_* folder")
+    parser.add_argument("--gap", type=float, default=5.0, help="report fix gaps over SECONDS")
+    parser.add_argument("--top", type=int, default=10, help="CAN IDs to list")
+    parser.add_argument("--parquet", action="store_true", help="also export .parquet files")
+    args = parser.parse_args(argv)
+
+    for family in FAMILIES:
+        columns = load_family(args.directory, family.name)
+        if columns:
+            print(f"{family.name}: {len(columns['ts_ms'])} records")
+            if args.parquet:
+                print(f"  -> {export_parquet(args.directory, family.name)}")
+
+    histogram = can_id_histogram(args.directory, args.top)
+    if histogram:
+        print("Top CAN IDs:")
+        for can_id, count in histogram:
+            print(f"  {can_id:08X}  {count}")
+
+    for family, started_ms, gap_ms in fix_gaps(args.directory, args.gap):
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started_ms / 1000))
+        print(f"{family} fix gap: {gap_ms / 1000:.1f}s after {started}")
+
+
+if __name__ == "__main__":
+    main()
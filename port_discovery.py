@@ -0,0 +1,153 @@
+import json
+import os
+import select
+import socket
+import time
+
+NETLINK_KOBJECT_UEVENT = 15
+HOTPLUG_SUBSYSTEMS = (b"SUBSYSTEM=tty", b"SUBSYSTEM=usb-serial", b"SUBSYSTEM=usb")
+
+
+class HotplugMonitor:
+    def __init__(self, sock, settle_time=0.3):
+        self.sock = sock
+        self.settle_time = settle_time
+        self.events = 0
+        self.added = set()
+
+    @classmethod
+    def create(cls):
+        if not hasattr(socket, "AF_NETLINK"):
+            return None
+        try:
+            sock = socket.socket(
+                socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT
+            )
+            # Group 1 carries kernel uevents and needs no privileges.
+            sock.bind((0, 1))
+            sock.setblocking(False)
+        except OSError:
+            return None
+        return cls(sock)
+
+    def wait(self, timeout=None):
+        if not self._readable(timeout):
+            return False
+
+        changed = self._drain()
+        # Devices arrive as a burst of uevents (usb, usb-serial, tty) and the
+        # /dev node shows up a moment later; wait for the burst to settle.
+        deadline = time.monotonic() + self.settle_time
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._readable(remaining):
+                break
+            changed |= self._drain()
+        return changed
+
+    def take_added(self):
+        # Device nodes added since the last call.
+        added, self.added = self.added, set()
+        return added
+
+    def close(self):
+        self.sock.close()
+
+    def _readable(self, timeout):
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        return bool(readable)
+
+    def _drain(self):
+        changed = False
+        while True:
+            try:
+                message = self.sock.recv(8192)
+            except (BlockingIOError, InterruptedError):
+                return changed
+            if any(subsystem in message for subsystem in HOTPLUG_SUBSYSTEMS):
+                self.events += 1
+                changed = True
+                fields = message.split(b"\0")
+                if b"ACTION=add" in fields:
+                    for field in fields:
+                        if field.startswith(b"DEVNAME="):
+                            self.added.add("/dev/" + field[8:].decode("utf-8", "replace"))
+
+
+class ProbeCache:
+    DEVICE = "device"
+    SILENT = "silent"
+
+    def __init__(self, path, silent_after=5, silent_ttl=600.0):
+        self.path = path
+        self.silent_after = silent_after
+        # A silent verdict is only trusted for this long: the TCU on that
+        # adapter may just have been unpowered or still booting.
+        self.silent_ttl = silent_ttl
+        self.entries = {}
+        self.load()
+
+    @staticmethod
+    def key(port_info):
+        if port_info is None or port_info.vid is None or port_info.pid is None:
+            return None
+        serial_number = port_info.serial_number or ""
+        return f"{port_info.vid:04x}:{port_info.pid:04x}:{serial_number}"
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def verdict(self, key):
+        if key is None:
+            return None
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+        if (
+            entry["verdict"] == self.SILENT
+            and time.time() - entry.get("silent_since", 0) >= self.silent_ttl
+        ):
+            return None
+        return entry["verdict"]
+
+    def record(self, key, found):
+        if key is None:
+            return
+        entry = self.entries.get(key) or {"verdict": None, "misses": 0}
+        previous = dict(entry)
+
+        if found:
+            entry["verdict"] = self.DEVICE
+            entry["misses"] = 0
+        elif entry["verdict"] != self.DEVICE:
+            entry["misses"] += 1
+            # Adapters without a serial number can't be told apart, and a TCU
+            # can be silent while it boots, so only blacklist after repeated
+            # misses on a uniquely identified adapter.
+            if not key.endswith(":") and entry["misses"] >= self.silent_after:
+                entry["verdict"] = self.SILENT
+                entry["silent_since"] = time.time()
+
+        entry["last_seen"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.entries[key] = entry
+        if entry["verdict"] != previous.get("verdict") or entry.get(
+            "silent_since"
+        ) != previous.get("silent_since"):
+            self.save()
+
+    def forget(self, key):
+        if self.entries.pop(key, None) is not None:
+            self.save()
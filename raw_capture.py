@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import serial
+
+CAPTURE_MAGIC = b"AEPLRAW1"
+CAPTURE_SUFFIX = ".cap"
+# nanoseconds since capture start, direction, payload length
+CHUNK = struct.Struct("<QBI")
+RX = 0
+TX = 1
+
+
+class CaptureWriter:
+    def __init__(self, path, port_name, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.file = open(path, "wb", buffering=1024 * 1024)
+        header = json.dumps(
+            {"port": port_name, "started": time.time(), "format": 1}
+        ).encode("utf-8")
+        self.file.write(CAPTURE_MAGIC + struct.pack("<I", len(header)) + header)
+        self.file.flush()
+        self.started_ns = time.monotonic_ns()
+        self.last_flush = time.monotonic()
+        self.chunks = 0
+        self.bytes = 0
+
+    def record(self, data, direction=RX):
+        now_ns = time.monotonic_ns()
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(CHUNK.pack(now_ns - self.started_ns, direction, len(data)))
+            self.file.write(data)
+            self.chunks += 1
+            self.bytes += len(data)
+            if now_ns / 1e9 - self.last_flush >= self.flush_interval:
+                self.last_flush = now_ns / 1e9
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_capture(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(CAPTURE_MAGIC):
+        raise ValueError(f"{path}: not a raw capture")
+    offset = len(CAPTURE_MAGIC)
+    (header_length,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    header = json.loads(data[offset : offset + header_length])
+    offset += header_length
+
+    chunks = []
+    view = memoryview(data)
+    while offset + CHUNK.size <= len(data):
+        t_ns, direction, length = CHUNK.unpack_from(data, offset)
+        offset += CHUNK.size
+        if offset + length > len(data):
+            break  # cut off by a crash
+        chunks.append((t_ns, direction, view[offset : offset + length]))
+        offset += length
+    return header, chunks
+
+
+class ReplayPort:
+    # Stands in for serial.Serial: every read returns (part of) one recorded
+    # chunk, so the reader sees the same byte stream and chunk boundaries it
+    # saw in the field. speed=0 replays as fast as the pipeline can take it.
+    def __init__(self, path, speed=1.0, timeout=None, port=None):
+        self.path = path
+        self.speed = speed
+        self.timeout = timeout
+        self.header, chunks = read_capture(path)
+        self.chunks = [chunk for chunk in chunks if chunk[1] == RX]
+        self.port = port or f"replay:{os.path.basename(path)}"
+        self.condition = threading.Condition()
+        self.is_open = False
+        self.written = []
+        self.open()
+
+    def open(self):
+        with self.condition:
+            self.position = 0
+            self.pending = b""
+            self.started = time.monotonic()
+            self.is_open = True
+
+    def close(self):
+        with self.condition:
+            self.is_open = False
+            self.condition.notify_all()
+
+    def _due(self, index):
+        if not self.speed:
+            return 0.0
+        return self.started + self.chunks[index][0] / 1e9 / self.speed
+
+    @property
+    def in_waiting(self):
+        with self.condition:
+            if self.pending:
+                return len(self.pending)
+            if not self.is_open or self.position >= len(self.chunks):
+                raise serial.SerialException("End of capture")
+            if self._due(self.position) <= time.monotonic():
+                self.pending = self.chunks[self.position][2]
+                self.position += 1
+            return len(self.pending)
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self.condition:
+            while not self.pending:
+                if not self.is_open:
+                    raise serial.SerialException("Replay port closed")
+                if self.position >= len(self.chunks):
+                    # Behave like an unplugged device so the session closes
+                    # its log the normal way.
+                    raise serial.SerialException("End of capture")
+                now = time.monotonic()
+                due = self._due(self.position)
+                if due <= now:
+                    self.pending = self.chunks[self.position][2]
+                    self.position += 1
+                    break
+                wait = due - now
+                if deadline is not None:
+                    if now >= deadline:
+                        return b""
+                    wait = min(wait, deadline - now)
+                self.condition.wait(wait)
+
+            data = bytes(self.pending[:size])
+            self.pending = self.pending[size:]
+            return data
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def capture_path(folder, port_name):
+    port_id = os.path.basename(port_name) or "port"
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    return os.path.join(folder, f"raw_{port_id}_{timestamp}{CAPTURE_SUFFIX}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise or dump a raw serial capture")
+    parser.add_argument("path")
+    parser.add_argument("--dump", action="store_true", help="write received bytes to stdout")
+    args = parser.parse_args(argv)
+
+    header, chunks = read_capture(args.path)
+    if args.dump:
+        for _, direction, data in chunks:
+            if direction == RX:
+                sys.stdout.buffer.write(data)
+        return
+
+    received = [chunk for chunk in chunks if chunk[1] == RX]
+    sent = [chunk for chunk in chunks if chunk[1] == TX]
+    duration = chunks[-1][0] / 1e9 if chunks else 0.0
+    print(f"Port:     {header.get('port')}")
+    print(f"Started:  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header.get('started', 0)))}")
+    print(f"Duration: {duration:.1f}s")
+    print(f"Received: {sum(len(c[2]) for c in received)} bytes in {len(received)} chunks")
+    print(f"Sent:     {sum(len(c[2]) for c in sent)} bytes in {len(sent)} commands")
+    for _, _, data in sent:
+        print(f"  > {bytes(data).decode('utf-8', errors='replace').rstrip()}")
+
+
+if __name__ == "__main__":
+    main()
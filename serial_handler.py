@@ -1,36 +1,176 @@
+import errno
 import serial
 import threading
 import time
-import serial.tools.list_ports
 import os
-import re
-import queue
-import platform
-from datetime import datetime
+from collections import Counter
+from log_writer import LogWriterPool
+from display_queue import DisplayQueue
+from port_discovery import HotplugMonitor, ProbeCache
+from device_session import DeviceSession, recover_spools
+from log_sink import SEGMENT_MANIFEST, publish_closed_segment
+from raw_capture import ReplayPort
+from metrics import Histogram, MetricsServer, StatsReporter, dump_profile, process_start_time
+from stream_tap import StreamTap
+from command_scheduler import URGENT
 
 
 class SerialManager:
-    def __init__(self, ui):
+    READER_ENGINES = ("event", "poll")
+
+    def __init__(
+        self,
+        ui,
+        reader_engine="event",
+        display_policy="drop",
+        writer_threads=1,
+        compression="gzip",
+        segment_bytes=32 * 1024 * 1024,
+        segment_seconds=3600,
+        raw_capture=False,
+        decode_packets=False,
+        monitor_ports=True,
+        metrics_port=None,
+        stats_interval=None,
+        triggers=None,
+        tap=None,
+        command_gap=0.05,
+        fsync_interval=None,
+        remote_ui=False,
+        started_at=None,
+        first_byte_budget=None,
+        device_profile=None,
+    ):
         self.ui = ui
-        self.serial_port = None
-        self.thread = None
-        self.logging_active = False
-        self.log_queue = queue.Queue()
-        self.log_file = None
-        self.fallback_log_file = None
-        self.buffered_lines = []
-        self.imei = None
-        self.detecting_imei = False
-
-        self.monitor_thread = threading.Thread(
-            target=self.auto_monitor_ports, daemon=True
+        # Seconds from process start to each startup stage; a GUI that
+        # starts capture in a child process passes its own start time.
+        self.started_at = started_at or process_start_time() or time.time()
+        self.first_byte_budget = first_byte_budget
+        self.startup = {}
+        # A GUI in another process renders on its own tick and reports back
+        # through note_render; see capture_process.py.
+        self.remote_ui = remote_ui
+        self.raw_capture = raw_capture
+        self.decode_packets = decode_packets
+        self.command_gap = command_gap
+        # The validation profile macros use; None detects it from replies.
+        self.device_profile = device_profile
+        self.triggers = triggers if triggers and triggers.rules else None
+        self.compression = compression
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.reader_engine = reader_engine
+        self.read_timeout = 0.2
+        self.display_policy = display_policy
+        self.log_queue = DisplayQueue(maxsize=5000, policy=display_policy)
+        self.frame_budget = 0.025
+        self.render_cost = 0.0001
+        self.last_queue_stats = None
+        self.render_time = Histogram()
+        self.writers = LogWriterPool(
+            writer_threads,
+            max_batch_bytes=64 * 1024,
+            max_delay=0.2,
+            fsync_interval=fsync_interval,
+            on_error=self.log_queue.put,
         )
-        self.monitor_thread.start()
+
+        self.sessions = {}
+        self.retired_sessions = []
+        self.views = set()
+        self.active_port = None
+        self.paused = False
 
         if not os.path.exists("logs"):
             os.makedirs("logs")
 
-        self.ui.root.after(50, self.process_log_queue)
+        self.segment_manifest = os.path.join("logs", SEGMENT_MANIFEST)
+        recovered = recover_spools("logs", self.publish_segment)
+        if recovered:
+            self.log_queue.put(
+                f"Recovered {len(recovered)} spooled segment(s) from an interrupted session."
+            )
+
+        self.use_hotplug = True
+        self.hotplug_heartbeat = 5.0
+        self.rescan_interval = 1.0
+        # Quiet ports are re-probed less and less often, up to this.
+        self.max_rescan_interval = 30.0
+        self.next_probe = {}
+        self.probe_misses = Counter()
+        self.busy_ports = set()
+        self.last_probe_duration = 0.0
+        self.probe_time = Histogram()
+        self.connects = Counter()
+        self.disconnects = Counter()
+        self.probe_cache = ProbeCache(os.path.join("logs", "probe_cache.json"))
+
+        # Loaded by the first macro, not at startup.
+        self.validation_rules = None
+        self.validation_cache = None
+        self.macro_runner = None
+        self.macro_thread = None
+
+        # Sessions look the tap up when they start, so it exists before any do.
+        self.tap = None
+        if tap:
+            try:
+                self.tap = StreamTap(tap, on_error=self.log_queue.put)
+                self.log_queue.put(f"Live stream tap on {self.tap.url}")
+            except (OSError, ValueError) as e:
+                self.log_queue.put(f"Could not start the stream tap on {tap}: {e}")
+
+        self.monitor_thread = None
+        if monitor_ports:
+            self.monitor_thread = threading.Thread(
+                target=self.auto_monitor_ports, daemon=True
+            )
+            self.monitor_thread.start()
+
+        self.metrics_server = None
+        if metrics_port is not None:
+            try:
+                self.metrics_server = MetricsServer(self, metrics_port)
+                self.log_queue.put(f"Metrics at {self.metrics_server.address}/metrics")
+            except OSError as e:
+                self.log_queue.put(f"Could not start metrics on port {metrics_port}: {e}")
+        self.stats_reporter = None
+        if stats_interval:
+            self.stats_reporter = StatsReporter(self, stats_interval)
+
+        self.note_startup("capture_ready")
+        self.ui.after(50, self.process_log_queue)
+
+    def after(self, ms, func):
+        return self.ui.after(ms, func)
+
+    @property
+    def active_session(self):
+        session = self.sessions.get(self.active_port)
+        if session is None:
+            for session in list(self.sessions.values()):
+                if session.is_alive:
+                    return session
+        return session
+
+    @property
+    def serial_port(self):
+        session = self.active_session
+        return session.serial_port if session else None
+
+    @property
+    def imei(self):
+        session = self.active_session
+        return session.imei if session else None
+
+    @property
+    def logging_active(self):
+        return any(session.logging_active for session in list(self.sessions.values()))
+
+    @property
+    def connected(self):
+        session = self.active_session
+        return bool(session and session.is_alive)
 
     def _get_log_folder(self):
         date_str = time.strftime("%Y-%m-%d")
@@ -39,210 +179,348 @@ class SerialManager:
             os.makedirs(folder_path)
         return folder_path
 
-    def _generate_log_path(self):
-        user = platform.node()
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        filename = f"serial_log_{self.imei}_{user}_{timestamp}.log"
-        return os.path.join(self._get_log_folder(), filename)
+    def publish_segment(self, segment_path):
+        try:
+            publish_closed_segment(self.segment_manifest, segment_path)
+        except OSError as e:
+            self.log_queue.put(f"Could not publish closed segment: {e}")
 
-    def _prepare_fallback_log(self):
-        fallback_path = os.path.join(self._get_log_folder(), "default.log")
-        self.fallback_log_file = open(
-            fallback_path, "a", encoding="utf-8", errors="ignore"
+    def _update_title(self):
+        ports = sorted(
+            port for port, session in list(self.sessions.items()) if session.is_alive
         )
+        if ports:
+            self.ui.set_title(f"AEPL Logger (Connected: {', '.join(ports)})")
+        else:
+            self.ui.set_title("AEPL Logger (Disconnected)")
 
     def auto_monitor_ports(self):
-        known_ports = set()
-        last_good_port = None
+        import serial.tools.list_ports
+
+        hotplug = HotplugMonitor.create() if self.use_hotplug else None
+        if hotplug is None:
+            self.log_queue.put("Hotplug events unavailable, polling serial ports.")
+
+        known_ports = None
 
         while True:
             try:
-                current_ports = set(
-                    p.device for p in serial.tools.list_ports.comports()
-                )
-                lost_ports = known_ports - current_ports
+                port_infos = {p.device: p for p in serial.tools.list_ports.comports()}
+                current_ports = set(port_infos)
+                if known_ports is None:
+                    known_ports = current_ports
 
                 # Handle disconnect
-                if (
-                    lost_ports
-                    and self.serial_port
-                    and self.serial_port.port in lost_ports
-                ):
-                    self.ui.root.title("AEPL Logger (Disconnected)")
-                    self.stop_logging()
-                    self.serial_port = None
-
-                # Try reconnecting
-                if not self.serial_port or not (
-                    self.serial_port.is_open and self.logging_active
-                ):
-                    ports_to_check = list(current_ports)
-                    if last_good_port in ports_to_check:
-                        ports_to_check.remove(last_good_port)
-                        ports_to_check.insert(0, last_good_port)
-
-                    for port in ports_to_check:
-                        try:
-                            temp_port = serial.Serial(
-                                port, baudrate=115200, timeout=0.05
-                            )
-                            data_found = False
-                            start_time = time.time()
-
-                            while time.time() - start_time < 0.15:
-                                if temp_port.in_waiting:
-                                    data = temp_port.read(temp_port.in_waiting)
-                                    if data:
-                                        data_found = True
-                                        break
-                                else:
-                                    data = temp_port.read(32)
-                                    if data:
-                                        data_found = True
-                                        break
-                                time.sleep(0.01)
-
-                            if data_found:
-                                if self.serial_port and self.serial_port.is_open:
-                                    self.serial_port.close()
-                                self.serial_port = temp_port
-                                last_good_port = port
-                                self.ui.root.title(f"AEPL Logger (Connected: {port})")
-                                self.start_logging()
-                                break
-                            else:
-                                temp_port.close()
-                        except (serial.SerialException, PermissionError) as e:
-                            self.log_queue.put(f"Could not open {port}: {e}")
+                for port in known_ports - current_ports:
+                    self.next_probe.pop(port, None)
+                    self.probe_misses.pop(port, None)
+                    if port in self.sessions:
+                        self._close_session(port)
+
+                # A replugged adapter is probed afresh, whatever it was before.
+                added = current_ports - known_ports
+                if hotplug is not None:
+                    added |= hotplug.take_added() & current_ports
+                for port in added:
+                    self.probe_cache.forget(self.probe_cache.key(port_infos[port]))
+                    self.next_probe.pop(port, None)
+                    self.probe_misses.pop(port, None)
+
+                # Connect every port that isn't logged yet
+                pending = False
+                if not self.paused:
+                    now = time.monotonic()
+                    for port in sorted(current_ports):
+                        session = self.sessions.get(port)
+                        if session and session.is_alive:
+                            continue
+                        if session:
+                            self._close_session(port)
+                        if self.next_probe.get(port, 0) > now:
+                            pending = True
+                            continue
+                        if not self._try_connect(port, port_infos[port]):
+                            delay = self.rescan_interval * 2 ** min(self.probe_misses[port], 5)
+                            self.next_probe[port] = now + min(delay, self.max_rescan_interval)
+                            self.probe_misses[port] += 1
+                            pending = True
 
                 known_ports = current_ports
-                time.sleep(0.05)  # Balanced delay
+                if hotplug is None:
+                    time.sleep(0.05)  # Balanced delay
+                else:
+                    # Keep retrying quiet ports slowly in case a TCU is booting.
+                    timeout = self.rescan_interval if pending else self.hotplug_heartbeat
+                    if hotplug.wait(timeout):
+                        self.next_probe.clear()
             except Exception as e:
                 self.log_queue.put(f"Port monitor error: {e}")
-
-    def start_logging(self):
-        if not self.serial_port or self.logging_active:
+                time.sleep(1)
+
+    def _try_connect(self, port, port_info):
+        key = self.probe_cache.key(port_info)
+        verdict = self.probe_cache.verdict(key)
+        if verdict == ProbeCache.SILENT:
+            return False
+
+        try:
+            started = time.monotonic()
+            temp_port = serial.Serial(port, baudrate=115200, timeout=0.05, exclusive=True)
+            # Known devices reconnect without sniffing.
+            data_found = verdict == ProbeCache.DEVICE or self._probe(temp_port)
+            self.last_probe_duration = time.monotonic() - started
+            self.probe_time.observe(self.last_probe_duration)
+        except (serial.SerialException, PermissionError) as e:
+            self._open_failed(port, e)
+            return False
+        self.busy_ports.discard(port)
+
+        self.probe_cache.record(key, data_found)
+        if not data_found:
+            temp_port.close()
+            return False
+
+        self.probe_misses.pop(port, None)
+        session = DeviceSession(self, temp_port)
+        self.sessions[port] = session
+        self.connects[port] += 1
+        session.start()
+        self.note_startup("first_port_open")
+        self._update_title()
+        return True
+
+    def _probe(self, temp_port):
+        start_time = time.time()
+        while time.time() - start_time < 0.15:
+            if temp_port.in_waiting:
+                data = temp_port.read(temp_port.in_waiting)
+            else:
+                data = temp_port.read(32)
+            if data:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def add_port(self, path, baudrate=115200):
+        # A port opened by name rather than found by the monitor, e.g. a pty.
+        try:
+            port = serial.Serial(path, baudrate=baudrate, timeout=0.05, exclusive=True)
+        except (serial.SerialException, PermissionError) as e:
+            self._open_failed(path, e)
+            return None
+        self.busy_ports.discard(path)
+        session = DeviceSession(self, port)
+        self.sessions[port.port] = session
+        self.connects[port.port] += 1
+        session.start()
+        self.note_startup("first_port_open")
+        self._update_title()
+        return session
+
+    def _open_failed(self, port, error):
+        # Ports are opened exclusive (a flock on the tty), so a second
+        # logger or a fleet run can't read a port this one is logging and
+        # split its bytes; the one that came second ends up here.
+        if getattr(error, "errno", None) in (errno.EAGAIN, errno.EWOULDBLOCK):
+            self.busy_ports.add(port)
+            self.log_queue.put(f"Could not open {port}: in use by another process")
+        else:
+            self.log_queue.put(f"Could not open {port}: {error}")
+
+    def add_replay(self, path, speed=1.0):
+        # A capture is replayed through the same session pipeline as a live
+        # port; the monitor never sees it, so it stays until the capture ends.
+        port = ReplayPort(path, speed=speed, timeout=self.read_timeout)
+        session = DeviceSession(self, port)
+        self.sessions[port.port] = session
+        self.connects[port.port] += 1
+        session.start()
+        self._update_title()
+        return session
+
+    def _close_session(self, port):
+        session = self.sessions.pop(port, None)
+        if session is None:
             return
+        self.disconnects[port] += 1
+        if session.logging_active:
+            session.stop()
+        self.retired_sessions.append(session)
+        self._update_title()
 
-        self.logging_active = True
-        self.detecting_imei = True
-        self.thread = threading.Thread(target=self.read_serial, daemon=True)
-        self.thread.start()
-        self.detect_and_send_imei_command()
+    def start_logging(self):
+        self.paused = False
+        for session in list(self.sessions.values()):
+            if not session.logging_active:
+                try:
+                    session.start()
+                except serial.SerialException as e:
+                    self.log_queue.put(f"Could not reopen {session.port_name}: {e}")
+        self._update_title()
 
     def stop_logging(self):
-        self.logging_active = False
-        if self.serial_port and self.serial_port.is_open:
-            self.serial_port.close()
-        if self.log_file:
-            try:
-                self.log_file.close()
-            except:
-                pass
-            self.log_file = None
-        if self.fallback_log_file:
-            try:
-                self.fallback_log_file.close()
-            except:
-                pass
-            self.fallback_log_file = None
-        self.buffered_lines.clear()
-        self.log_queue.put("Logging stopped.")
+        # Stay stopped until the user starts logging again.
+        self.paused = True
+        for session in list(self.sessions.values()):
+            if session.logging_active:
+                session.stop()
+        self.writers.flush()
+        self.log_queue.put(self.writers.summary())
+        self._update_title()
 
     def send_command(self, command):
-        if self.serial_port and self.serial_port.is_open:
-            self.serial_port.write((command + "\n").encode())
+        session = self.active_session
+        if session:
+            return session.send_command(command, URGENT)
 
-    def detect_and_send_imei_command(self):
-        commands = ["*GET#IMEI#", "*GET,IMEI#", "CMN *GET#IMEI#"]
-        for i, cmd in enumerate(commands):
-            self.ui.root.after(i * 2000, lambda c=cmd: self.send_command(c))
-        self.ui.root.after(7000, lambda: setattr(self, "detecting_imei", False))
+    def run_macro(self, source, name="macro"):
+        # Runs next to the session it drives, on its own thread.
+        from device_validation import DeviceValidator, ValidationCache, ValidationRules
+        from macro_engine import MacroError, MacroRunner, compile_macro
 
-    def read_serial(self):
-        ansi_escape = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
-        imei_pattern = re.compile(r"IMEI[:#\s]*(\d{14,17})", re.IGNORECASE)
-
-        buffer = ""
+        if self.macro_thread and self.macro_thread.is_alive():
+            self.log_queue.put("⚠️ A macro is already running.")
+            return
+        try:
+            program = compile_macro(source, name)
+        except MacroError as e:
+            self.log_queue.put(f"❌ Macro Error: {name}, {e}")
+            return
 
-        while self.logging_active:
+        session = self.active_session
+        if not session or not session.is_alive:
+            self.log_queue.put("⚠️ Serial port not open.")
+            return
+        if self.validation_rules is None:
             try:
-                if self.serial_port.in_waiting:
-                    raw_data = self.serial_port.read(
-                        self.serial_port.in_waiting
-                    ).decode("utf-8", errors="ignore")
-                    buffer += raw_data
-                    lines = buffer.splitlines(keepends=False)
-                    if raw_data and not raw_data.endswith("\n"):
-                        buffer = lines.pop() if lines else buffer
-                    else:
-                        buffer = ""
-
-                    for line in lines:
-                        clean_line = ansi_escape.sub("", line).rstrip()
-                        if not clean_line:
-                            continue
-
-                        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-
-                        if self.detecting_imei and self.imei is None:
-                            self.buffered_lines.append(clean_line)
-                            match = imei_pattern.search(clean_line)
-                            if match:
-                                self.imei = match.group(1)
-                                self.detecting_imei = False
-                                self.log_file = open(
-                                    self._generate_log_path(),
-                                    "a",
-                                    encoding="utf-8",
-                                    errors="ignore",
-                                )
-                                # self.log_queue.put(f"IMEI Detected: {self.imei}")
-
-                                for buffered in self.buffered_lines:
-                                    if buffered.rstrip():
-                                        self.log_file.write(
-                                            f"[{timestamp}] - {buffered.strip()}\n"
-                                        )
-
-                                self.log_file.flush()
-                                self.buffered_lines.clear()
-
-                                if self.fallback_log_file:
-                                    try:
-                                        self.fallback_log_file.close()
-                                        fallback_path = os.path.join(
-                                            self._get_log_folder(), "default.log"
-                                        )
-                                        if os.path.exists(fallback_path):
-                                            os.remove(fallback_path)
-                                    except Exception as e:
-                                        self.log_queue.put(
-                                            f"Error deleting fallback log: {e}"
-                                        )
-                                    finally:
-                                        self.fallback_log_file = None
-
-                        if self.imei and self.log_file:
-                            self.log_file.write(f"[{timestamp}] - {clean_line}\n")
-                            self.log_file.flush()
-                        else:
-                            if not self.fallback_log_file:
-                                self._prepare_fallback_log()
-                            self.fallback_log_file.write(
-                                f"[{timestamp}] - {clean_line}\n"
-                            )
-                            self.fallback_log_file.flush()
-
-                        self.log_queue.put(clean_line)
-
+                self.validation_rules = ValidationRules.load("Assets/device.json")
             except Exception as e:
-                self.log_queue.put(f"Error: {e}")
-                break
-            time.sleep(0.01)
+                self.log_queue.put(f"Could not load device validation file: {e}")
+                self.validation_rules = ValidationRules({})
+            if self.device_profile and self.device_profile not in self.validation_rules.profiles:
+                self.log_queue.put(
+                    f"⚠️ Unknown device profile {self.device_profile!r}, detecting it instead."
+                )
+        if self.validation_cache is None:
+            self.validation_cache = ValidationCache(os.path.join("logs", "validation_cache.json"))
+
+        self.macro_runner = MacroRunner(
+            program,
+            send=session.send_command,
+            log=session.log_queue.put,
+            validator=DeviceValidator(
+                self.validation_rules, session.imei, self.validation_cache, self.device_profile
+            ),
+        )
+        self.macro_thread = threading.Thread(
+            target=self._run_macro, args=(self.macro_runner, session), name="macro", daemon=True
+        )
+        self.macro_thread.start()
+
+    def _run_macro(self, runner, session):
+        # Responses come from the reader's line stream, so the macro never
+        # reads the port itself and the logger sees every byte.
+        session.add_line_listener(runner.on_line)
+        try:
+            runner.run()
+        except Exception as e:
+            session.log_queue.put(f"❌ Macro Error: {e}")
+        finally:
+            session.remove_line_listener(runner.on_line)
+
+        status = "stopped" if runner.cancelled else "completed"
+        session.log_queue.put(f"✅ Macro execution {status}.")
+        for line in runner.summary().splitlines():
+            session.log_queue.put(line)
+
+    def stop_macro(self):
+        if self.macro_runner:
+            self.macro_runner.cancel()
+
+    def record_profile(self, seconds=10.0):
+        dump_profile(self, seconds)
+
+    def close(self):
+        self.stop_macro()
+        self.stop_logging()
+        self.writers.stop()
+        if self.tap:
+            self.tap.close()
+        if self.metrics_server:
+            self.metrics_server.close()
+
+    def note_startup(self, stage, at=None):
+        if stage not in self.startup:
+            self.startup[stage] = (at or time.time()) - self.started_at
+
+    def _check_first_byte(self):
+        commits = [w.first_commit for w in self.writers.writers if w.first_commit]
+        if not commits:
+            return
+        self.note_startup("first_byte_logged", min(commits))
+        seconds = self.startup["first_byte_logged"]
+        stages = ", ".join(
+            f"{stage} {value:.2f} s"
+            for stage, value in sorted(list(self.startup.items()), key=lambda item: item[1])
+            if stage != "first_byte_logged"
+        )
+        message = f"Startup: first byte logged {seconds:.2f} s after process start ({stages})"
+        if self.first_byte_budget and seconds > self.first_byte_budget:
+            message = f"⚠️ {message}, over the {self.first_byte_budget:g} s budget"
+        self.log_queue.put(message)
+
+    def note_render(self, lines, seconds):
+        self.render_time.observe(seconds)
+        if lines:
+            self.render_cost = 0.8 * self.render_cost + 0.2 * seconds / lines
 
     def process_log_queue(self):
-        while not self.log_queue.empty():
-            message = self.log_queue.get_nowait()
-            self.ui.insert_log(message)
-        self.ui.root.after(50, self.process_log_queue)
+        if "first_byte_logged" not in self.startup:
+            self._check_first_byte()
+        sessions = list(self.sessions.values()) + self.retired_sessions
+
+        for session in sessions:
+            if session.port_name not in self.views:
+                self.views.add(session.port_name)
+                self.ui.add_device_view(session.port_name)
+        for session in list(self.retired_sessions):
+            if session.log_queue.empty():
+                self.retired_sessions.remove(session)
+                if session.port_name not in self.sessions:
+                    self.ui.set_device_connected(session.port_name, False)
+        for session in list(self.sessions.values()):
+            self.ui.set_device_connected(session.port_name, session.is_alive)
+
+        # Only take as many lines as the last ticks say we can render
+        # within the frame budget; the rest waits for the next tick. A
+        # remote GUI's unrendered lines count against the budget, so while
+        # it is stalled lines stay here under the display policy.
+        budget = max(50, int(self.frame_budget / self.render_cost))
+        if self.remote_ui:
+            budget -= self.ui.backlog()
+        queues = [(None, self.log_queue)] + [
+            (session.port_name, session.log_queue) for session in sessions
+        ]
+        share = max(10, budget // len(queues))
+
+        started = time.perf_counter()
+        rendered = 0
+        if budget > 0:
+            for device, log_queue in queues:
+                messages = log_queue.drain(share)
+                if messages:
+                    self.ui.insert_logs(messages, device=device)
+                    rendered += len(messages)
+        if rendered and not self.remote_ui:
+            self.note_render(rendered, time.perf_counter() - started)
+
+        depth = sum(log_queue.qsize() for _, log_queue in queues)
+        dropped = sum(log_queue.dropped_total for _, log_queue in queues)
+        queue_stats = (depth, dropped, len(self.sessions))
+        if queue_stats != self.last_queue_stats:
+            self.last_queue_stats = queue_stats
+            self.ui.set_status(
+                f"Devices: {len(self.sessions)} | Display queue: {depth} | "
+                f"Dropped: {dropped} ({self.display_policy})"
+            )
+        self.ui.after(50, self.process_log_queue)
@@ -0,0 +1,135 @@
+import re
+import time
+from datetime import datetime
+
+
+ANSI_ESCAPE = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
+
+
+class LineFramer:
+    def __init__(self, max_line_length=65536):
+        self.buffer = bytearray()
+        self.scan_from = 0
+        self.max_line_length = max_line_length
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        lines = []
+        start = 0
+
+        view = memoryview(buffer)
+        try:
+            pos = buffer.find(b"\n", self.scan_from)
+            while pos != -1:
+                self._emit(lines, view[start:pos])
+                start = pos + 1
+                pos = buffer.find(b"\n", start)
+
+            # A device spewing binary garbage without newlines must not grow
+            # the buffer forever.
+            if len(buffer) - start >= self.max_line_length:
+                self._emit(lines, view[start:])
+                start = len(buffer)
+        finally:
+            view.release()
+
+        if start:
+            del buffer[:start]
+        self.scan_from = len(buffer)
+        return lines
+
+    def flush(self):
+        lines = []
+        if self.buffer:
+            self._emit(lines, self.buffer)
+            self.buffer.clear()
+        self.scan_from = 0
+        return lines
+
+    @staticmethod
+    def _emit(lines, raw):
+        line = str(raw, "utf-8", "ignore")
+        if "\x1b" in line:
+            line = ANSI_ESCAPE.sub("", line)
+        if "\r" in line.rstrip():
+            for part in line.splitlines():
+                part = part.rstrip()
+                if part:
+                    lines.append(part)
+            return
+        line = line.rstrip()
+        if line:
+            lines.append(line)
+
+
+class TimestampCache:
+    def __init__(self):
+        self._second = None
+        self._prefix = ""
+        self._ms = None
+        self._text = ""
+
+    def now(self):
+        t = time.time()
+        ms = int(t * 1000)
+        if ms != self._ms:
+            second = ms // 1000
+            if second != self._second:
+                self._second = second
+                self._prefix = datetime.fromtimestamp(second).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                )
+            self._ms = ms
+            self._text = f"{self._prefix}.{ms % 1000:03d}"
+        return self._text
+
+
+class ReaderStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lines = 0
+        self.bytes = 0
+        self.chunks = 0
+        self.started = None
+        self.stopped = None
+        self._cpu_start = 0.0
+        self.cpu_time = 0.0
+
+    def start(self):
+        self.reset()
+        self.started = time.monotonic()
+        self._cpu_start = time.thread_time()
+
+    def record(self, nbytes, nlines):
+        self.chunks += 1
+        self.bytes += nbytes
+        self.lines += nlines
+        self.cpu_time = time.thread_time() - self._cpu_start
+
+    def stop(self):
+        self.cpu_time = time.thread_time() - self._cpu_start
+        self.stopped = time.monotonic()
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.stopped or time.monotonic()) - self.started
+
+    @property
+    def lines_per_second(self):
+        elapsed = self.elapsed
+        return self.lines / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def cpu_per_line_us(self):
+        return self.cpu_time / self.lines * 1e6 if self.lines else 0.0
+
+    def summary(self):
+        return (
+            f"Reader: {self.lines} lines, {self.bytes} bytes in {self.elapsed:.1f}s "
+            f"({self.lines_per_second:.0f} lines/s, {self.cpu_per_line_us:.1f} us CPU/line)"
+        )
@@ -0,0 +1,298 @@
+import os
+import selectors
+import socket
+import sys
+import threading
+from collections import deque
+from itertools import islice
+
+LINES = 0
+RAW = 1
+HELLO = b"# AEPL tap: send 'port <name>' to filter, 'raw' for raw bytes, 'lines' for lines\n"
+
+
+def parse_address(address):
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+class Subscriber:
+    def __init__(self, sock, cursor, peer):
+        self.sock = sock
+        self.cursor = cursor
+        self.peer = peer
+        self.port = None
+        self.kind = LINES
+        self.pending = b""
+        self.inbox = b""
+        self.lagged = 0
+
+    def wants(self, kind, port):
+        return kind == self.kind and (
+            self.port is None or port == self.port or os.path.basename(port) == self.port
+        )
+
+
+class StreamTap:
+    # Readers append to one shared ring; each subscriber only has a cursor
+    # into it, so publishing costs the same with one client or fifty. The
+    # tap thread copies from the ring to the sockets. A client that falls
+    # more than ring_size entries behind skips ahead and is told how much
+    # it missed (policy "lag"), or is disconnected (policy "drop").
+    def __init__(
+        self,
+        address,
+        ring_size=16384,
+        max_batch=256 * 1024,
+        send_buffer=256 * 1024,
+        policy="lag",
+        on_error=None,
+    ):
+        if policy not in ("lag", "drop"):
+            raise ValueError(f"Unknown slow-subscriber policy: {policy}")
+        self.address = address
+        self.policy = policy
+        self.max_batch = max_batch
+        self.send_buffer = send_buffer
+        self.on_error = on_error
+        self.ring = deque(maxlen=ring_size)
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.line_subscribers = 0
+        self.raw_subscribers = 0
+        self.lagged_total = 0
+        self.closed = False
+
+        family, bind_address = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(bind_address):
+            os.unlink(bind_address)
+        self.server = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(bind_address)
+        self.server.listen(16)
+        self.server.setblocking(False)
+        self.bound = self.server.getsockname()
+
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.wake_pending = False
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server, selectors.EVENT_READ, "accept")
+        self.selector.register(self.wake_r, selectors.EVENT_READ, "wake")
+        self.thread = threading.Thread(target=self._run, name="stream-tap", daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        if isinstance(self.bound, tuple):
+            return f"{self.bound[0]}:{self.bound[1]}"
+        return f"unix:{self.bound}"
+
+    def publish_line(self, port, line, timestamp):
+        if self.line_subscribers:
+            self._publish(LINES, port, f"[{timestamp}] {port} - {line}\n".encode("utf-8", "ignore"))
+
+    def publish_raw(self, port, data):
+        if self.raw_subscribers:
+            self._publish(RAW, port, data)
+
+    def _publish(self, kind, port, data):
+        with self.lock:
+            self.ring.append((kind, port, data))
+            self.seq += 1
+        if not self.wake_pending:
+            self.wake_pending = True
+            self._wake()
+
+    def _wake(self):
+        try:
+            self.wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def close(self):
+        self.closed = True
+        self._wake()
+        self.thread.join(2.0)
+
+    def _run(self):
+        try:
+            while not self.closed:
+                for key, events in self.selector.select(timeout=1.0):
+                    if key.data == "accept":
+                        self._accept()
+                    elif key.data == "wake":
+                        # Drain before clearing the flag: a publisher that
+                        # still sees it set has its entry in the ring already.
+                        try:
+                            while self.wake_r.recv(4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                        self.wake_pending = False
+                    elif events & selectors.EVENT_READ:
+                        self._receive(key.data)
+                self._pump()
+        except Exception as e:
+            if self.on_error:
+                self.on_error(f"Stream tap stopped: {e}")
+        finally:
+            for subscriber in list(self.subscribers):
+                self._drop(subscriber)
+            self.selector.close()
+            self.server.close()
+            if isinstance(self.bound, str) and os.path.exists(self.bound):
+                os.unlink(self.bound)
+
+    def _accept(self):
+        try:
+            sock, peer = self.server.accept()
+        except (BlockingIOError, OSError):
+            return
+        sock.setblocking(False)
+        # Keep the kernel from buffering megabytes for a stalled client;
+        # past this the ring decides what it misses.
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+        subscriber = Subscriber(sock, self.seq, peer or "unix")
+        subscriber.pending = HELLO
+        self.subscribers.append(subscriber)
+        self.selector.register(sock, selectors.EVENT_READ, subscriber)
+        self._count()
+
+    def _receive(self, subscriber):
+        try:
+            data = subscriber.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(subscriber)
+            return
+        subscriber.inbox += data
+        while b"\n" in subscriber.inbox:
+            line, subscriber.inbox = subscriber.inbox.split(b"\n", 1)
+            self._command(subscriber, line.decode("utf-8", "ignore").strip())
+        subscriber.inbox = subscriber.inbox[-4096:]
+
+    def _command(self, subscriber, command):
+        name, _, argument = command.partition(" ")
+        if name == "port":
+            subscriber.port = argument.strip() or None
+        elif name in ("raw", "lines"):
+            subscriber.kind = RAW if name == "raw" else LINES
+            self._count()
+        else:
+            return
+        subscriber.pending += f"# ok {command}\n".encode()
+
+    def _drop(self, subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+            try:
+                self.selector.unregister(subscriber.sock)
+            except (KeyError, ValueError):
+                pass
+            subscriber.sock.close()
+            self._count()
+
+    def _count(self):
+        self.line_subscribers = sum(1 for s in self.subscribers if s.kind == LINES)
+        self.raw_subscribers = sum(1 for s in self.subscribers if s.kind == RAW)
+
+    def _pump(self):
+        # Subscribers at the same cursor with the same filter share one
+        # batch, so the usual case joins the bytes once for everybody.
+        batches = {}
+        for subscriber in list(self.subscribers):
+            if not subscriber.pending:
+                key = (subscriber.cursor, subscriber.kind, subscriber.port)
+                if key not in batches:
+                    batches[key] = self._batch(subscriber)
+                data, cursor, missed = batches[key]
+                subscriber.cursor = cursor
+                if missed:
+                    subscriber.lagged += missed
+                    self.lagged_total += missed
+                    if self.policy == "drop":
+                        self._drop(subscriber)
+                        continue
+                    if subscriber.kind == LINES:
+                        data = f"# lagged, {missed} entries skipped\n".encode() + data
+                subscriber.pending = data
+            if subscriber.pending:
+                self._send(subscriber)
+
+    def _batch(self, subscriber):
+        with self.lock:
+            first = self.seq - len(self.ring)
+            missed = max(first - subscriber.cursor, 0)
+            start = max(subscriber.cursor, first)
+            parts = []
+            size = 0
+            cursor = start
+            for kind, port, data in islice(self.ring, start - first, None):
+                cursor += 1
+                if subscriber.wants(kind, port):
+                    parts.append(data)
+                    size += len(data)
+                    if size >= self.max_batch:
+                        break
+        return b"".join(parts), cursor, missed
+
+    def _send(self, subscriber):
+        try:
+            sent = subscriber.sock.send(subscriber.pending)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._drop(subscriber)
+            return
+        subscriber.pending = subscriber.pending[sent:]
+        events = selectors.EVENT_READ
+        if subscriber.pending or subscriber.cursor < self.seq:
+            events |= selectors.EVENT_WRITE
+        try:
+            self.selector.modify(subscriber.sock, events, subscriber)
+        except (KeyError, ValueError):
+            pass
+
+
+def main(argv=None):
+    # A minimal subscriber, for when nc/socat aren't at hand.
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print the logger's live stream")
+    parser.add_argument("address", nargs="?", default="127.0.0.1:9109",
+                        help="host:port or unix:/path")
+    parser.add_argument("--port", help="only this serial port")
+    parser.add_argument("--raw", action="store_true", help="raw bytes instead of lines")
+    args = parser.parse_args(argv)
+
+    family, address = parse_address(args.address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.connect(address)
+        if args.port:
+            sock.sendall(f"port {args.port}\n".encode())
+        if args.raw:
+            sock.sendall(b"raw\n")
+        out = sys.stdout.buffer
+        try:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                out.write(data)
+                out.flush()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import json
+import re
+import threading
+import time
+from collections import Counter
+from command_scheduler import BACKGROUND
+
+DEFAULT_RULES = [
+    {"name": "AIS", "match": "AIS", "color": "#0039a6"},
+    {"name": "CVP", "match": "CVP", "color": "#0000ff"},
+    {"name": "CAN", "match": "CAN", "color": "#ff00ff"},
+    {"name": "NET", "match": "NET", "color": "#008000"},
+    {"name": "PLA", "match": "PLA", "color": "#ffff00"},
+    {"name": "FOT", "match": "FOT", "color": "#bd309f"},
+]
+ALERT_TAG = "alert"
+ALERT_COLOR = "#ff4040"
+
+
+class TaggedLine(str):
+    # A line plus where tag rules matched in it, as (position, priority, tag).
+    # Consumers that only want the text can treat it as a plain str.
+    marks = ()
+
+
+def trie_pattern(words):
+    # Factor the literals by common prefix so the regex engine walks one
+    # branch per character instead of trying every literal in turn.
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class TriggerRule:
+    def __init__(self, index, spec):
+        self.index = index
+        literals = spec.get("match")
+        if isinstance(literals, str):
+            literals = [literals]
+        self.literals = [literal for literal in literals or () if literal]
+        self.regex = spec.get("regex")
+        self.name = spec.get("name") or (self.literals[0] if self.literals else self.regex)
+        if bool(self.literals) == bool(self.regex):
+            raise ValueError(f"Trigger {self.name!r} needs exactly one of 'match' or 'regex'")
+        if spec.get("ignore_case") and self.literals:
+            self.regex = "(?i:" + "|".join(map(re.escape, self.literals)) + ")"
+            self.literals = []
+        elif spec.get("ignore_case"):
+            self.regex = f"(?i:{self.regex})"
+        self.color = spec.get("color")
+        self.tag = spec.get("tag") or (self.name.lower() if self.color else None)
+        self.count = bool(spec.get("count"))
+        alert = spec.get("alert")
+        self.alert = self.name if alert is True else alert
+        self.send = spec.get("send")
+        self.cooldown = float(spec.get("cooldown", 10.0))
+        self.reacts = bool(self.count or self.alert or self.send)
+
+
+class TriggerEngine:
+    def __init__(self, specs, tags=True):
+        # tags=False keeps only rules with reactions, for front ends that
+        # don't colour anything.
+        rules = [TriggerRule(index, spec) for index, spec in enumerate(specs)]
+        self.rules = [rule for rule in rules if tags or rule.reacts]
+        self.colors = {rule.tag: rule.color for rule in self.rules if rule.tag and rule.color}
+
+        # Literal rules share one trie regex inside a lookahead, so it
+        # reports the longest literal at every position, overlapping or not.
+        # Every literal also fires the rules of the literals that are its
+        # prefixes.
+        by_literal = {}
+        for rule in self.rules:
+            for literal in rule.literals:
+                by_literal.setdefault(literal, []).append(rule)
+        self.literal_rules = {
+            literal: [
+                rule
+                for prefix, rules in by_literal.items()
+                if literal.startswith(prefix)
+                for rule in rules
+            ]
+            for literal in by_literal
+        }
+        self.literal_regex = re.compile(f"(?=({trie_pattern(by_literal)}))") if by_literal else None
+
+        # Regex rules share one alternation that only says whether any of
+        # them matches. An alternation stops at the first rule that matches,
+        # so a matching line is then searched rule by rule.
+        self.regex_rules = []
+        for rule in self.rules:
+            if rule.regex:
+                try:
+                    self.regex_rules.append((re.compile(rule.regex), rule))
+                except re.error as e:
+                    raise ValueError(f"Trigger {rule.name!r}: {e}") from None
+        try:
+            self.combined_regex = (
+                re.compile("|".join(f"(?:{rule.regex})" for _, rule in self.regex_rules))
+                if self.regex_rules else None
+            )
+        except re.error as e:
+            raise ValueError(f"Trigger regexes don't combine: {e}") from None
+
+    @classmethod
+    def load(cls, path, tags=True):
+        with open(path, "r") as f:
+            spec = json.load(f)
+        return cls(spec["rules"] if isinstance(spec, dict) else spec, tags)
+
+    def scan(self, line):
+        hits = []
+        if self.literal_regex is not None:
+            for match in self.literal_regex.finditer(line):
+                for rule in self.literal_rules[match.group(1)]:
+                    hits.append((match.start(), rule))
+        if self.combined_regex is not None and self.combined_regex.search(line):
+            for regex, rule in self.regex_rules:
+                for match in regex.finditer(line):
+                    hits.append((match.start(), rule))
+        return hits
+
+    def marks(self, line, hits=None):
+        if hits is None:
+            hits = self.scan(line)
+        return [(pos, rule.index, rule.tag) for pos, rule in hits if rule.tag]
+
+
+def load_triggers(path, on_error=None, tags=True):
+    try:
+        return TriggerEngine.load(path, tags)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if on_error:
+            on_error(f"Could not load triggers from {path}: {e}")
+    return TriggerEngine(DEFAULT_RULES, tags)
+
+
+class TriggerRunner:
+    # Per-session state for one engine: match counts and action cooldowns.
+    # on_line runs on the session's reader thread.
+    def __init__(self, engine, session):
+        self.engine = engine
+        self.session = session
+        self.counts = Counter()
+        self.last_fired = {}
+        self.lock = threading.Lock()
+
+    def on_line(self, line, timestamp):
+        hits = self.engine.scan(line)
+        if not hits:
+            return line
+        fired = set()
+        for _, rule in hits:
+            if rule.reacts and rule.index not in fired:
+                fired.add(rule.index)
+                self._react(rule, line)
+        marks = self.engine.marks(line, hits)
+        if not marks:
+            return line
+        tagged = TaggedLine(line)
+        tagged.marks = marks
+        return tagged
+
+    def _react(self, rule, line):
+        if rule.count:
+            with self.lock:
+                self.counts[rule.name] += 1
+        if not (rule.alert or rule.send):
+            return
+        now = time.monotonic()
+        if now - self.last_fired.get(rule.index, -rule.cooldown) < rule.cooldown:
+            return
+        self.last_fired[rule.index] = now
+
+        session = self.session
+        if rule.alert:
+            alert = TaggedLine(f"ALERT [{session.port_name}] {rule.alert}: {line}")
+            alert.marks = [(0, -1, ALERT_TAG)]
+            session.manager.log_queue.put(alert)
+        if rule.send:
+            session.send_command(rule.send, BACKGROUND)
+            session.log_queue.put(f"{rule.send}  (trigger {rule.name})")
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def summary(self):
+        counts = self.snapshot()
+        if not counts:
+            return None
+        return "Triggers: " + ", ".join(f"{name} x{count}" for name, count in sorted(counts.items()))
@@ -1,15 +1,19 @@
 import tkinter as tk
-from tkinter import scrolledtext, filedialog, messagebox, PhotoImage
-from serial_handler import SerialManager
+from tkinter import ttk, filedialog, messagebox, PhotoImage
+from capture_process import GUI_OPTIONS
+from log_console import LogConsole
 from macro_executor import MacroExecutor
+from triggers import ALERT_COLOR, ALERT_TAG, load_triggers
 import re
 import sys
 
 
 class UI:
     dev_name = "Suraj Bhalerao"
+    max_console_lines = 20000
+    triggers_path = GUI_OPTIONS["triggers"]
 
-    def __init__(self, root):
+    def __init__(self, root, capture=None, options=GUI_OPTIONS):
         self.root = root
         self.root.title("AEPL Logger (Disconnected)")
         self.root.geometry("800x600")
@@ -23,24 +27,33 @@ class UI:
         except Exception as e:
             print(f"Error setting icon: {e}")
 
-        self.log_console = scrolledtext.ScrolledText(
-            self.root, wrap=tk.NONE, bg="black", fg="white", font=("Consolas", 10)
-        )
-        self.log_console.pack(expand=True, fill=tk.BOTH)
-        self.log_console.bind("<KeyPress>", self.block_typing_during_logging)
-
-        self.color_tags = {
-        "AIS": "#0039a6",  # Deep blue
-        "CVP": "#0000ff",  # Blue
-        "CAN": "#ff00ff",  # Magenta
-        "NET": "#008000",  # Green
-        "PLA": "#ffff00",  # Yellow
-        "FOT": "#bd309f",  # Magenta 
-    }
-        for tag, color in self.color_tags.items():
-            self.log_console.tag_configure(tag.lower(), foreground=color)
-
-        self.serial_manager = SerialManager(self)
+        # Colours and reactions come from the trigger rules; the session
+        # readers tag device lines, so the UI only maps tags to colours.
+        self.triggers = load_triggers(self.triggers_path, on_error=print)
+        self.split_pattern = re.compile(r"(?<!\n)[|+](?=\w)")
+
+        self.status_bar = tk.Label(self.root, anchor=tk.W, font=("Consolas", 9))
+        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.notebook = ttk.Notebook(self.root)
+        self.notebook.pack(expand=True, fill=tk.BOTH)
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+
+        # One console per device, plus the main console for app messages.
+        self.consoles = {}
+        self.device_tabs = {}
+        self.device_connected = {}
+        self.log_console = self.create_console(None, "Main")
+
+        # Capture runs in its own process by default, so neither Tk nor this
+        # process's GIL can hold up the readers or the log writers. main.py
+        # starts it before building the window and hands it over here.
+        if capture is not None:
+            self.serial_manager = capture
+            capture.attach(self)
+        else:
+            from serial_handler import SerialManager
+
+            self.serial_manager = SerialManager(self, **dict(options, triggers=self.triggers))
         self.macro_executor = MacroExecutor(self)
 
         self.create_menu()
@@ -51,15 +64,62 @@ class UI:
         self.root.bind_all("<Control-m>", lambda e: self.root.iconify())
         self.root.bind_all("<space>", lambda e: self.scroll_to_bottom())
         self.root.bind_all("<Return>", lambda e: self.scroll_to_bottom())
-        self.log_console.bind("<Control-c>", self.copy_text)
-        self.log_console.bind("<Control-v>", self.paste_text)
-        self.log_console.bind("<Control-a>", self.select_all)
+        self.serial_manager.note_startup("gui_ready")
+
+    def create_console(self, device, title):
+        frame = tk.Frame(self.notebook)
+        console = LogConsole(
+            frame,
+            max_lines=self.max_console_lines,
+            wrap=tk.NONE,
+            bg="black",
+            fg="white",
+            font=("Consolas", 10),
+        )
+        console.pack(expand=True, fill=tk.BOTH)
+        for tag, color in self.triggers.colors.items():
+            console.tag_configure(tag, foreground=color)
+        console.tag_configure(ALERT_TAG, foreground=ALERT_COLOR)
+
+        console.bind("<KeyPress>", self.block_typing_during_logging)
+        console.bind("<Control-c>", self.copy_text)
+        console.bind("<Control-v>", self.paste_text)
+        console.bind("<Control-a>", self.select_all)
+        console.bind("<MouseWheel>", self.on_mouse_scroll)
+        console.bind("<Button-4>", self.on_mouse_scroll_linux_up)
+        console.bind("<Button-5>", self.on_mouse_scroll_linux_down)
+
+        self.notebook.add(frame, text=title)
+        self.consoles[device] = console
+        self.device_tabs[str(frame)] = device
+        return console
+
+    def add_device_view(self, device):
+        if device not in self.consoles:
+            self.create_console(device, device)
+            self.device_connected[device] = True
+
+    def set_device_connected(self, device, connected):
+        if device not in self.consoles or self.device_connected.get(device) == connected:
+            return
+        self.device_connected[device] = connected
+        frame = self.consoles[device].master
+        title = device if connected else f"{device} (disconnected)"
+        self.notebook.tab(frame, text=title)
+
+    def current_device(self):
+        try:
+            return self.device_tabs.get(self.notebook.select())
+        except tk.TclError:
+            return None
 
-        self.log_console.bind("<MouseWheel>", self.on_mouse_scroll)
-        self.log_console.bind("<Button-4>", self.on_mouse_scroll_linux_up)
-        self.log_console.bind("<Button-5>", self.on_mouse_scroll_linux_down)
+    def current_console(self):
+        return self.consoles.get(self.current_device(), self.log_console)
 
-        self.user_scrolled = False
+    def on_tab_changed(self, event=None):
+        device = self.current_device()
+        if device is not None:
+            self.serial_manager.active_port = device
 
     def create_menu(self):
         menu_bar = tk.Menu(self.root)
@@ -92,6 +152,7 @@ class UI:
         macro_menu.add_command(
             label="Run Macro", command=self.macro_executor.load_and_run
         )
+        macro_menu.add_command(label="Stop Macro", command=self.macro_executor.stop)
         menu_bar.add_cascade(label="Macros", menu=macro_menu)
 
         window_menu = tk.Menu(menu_bar, tearoff=0)
@@ -102,36 +163,56 @@ class UI:
         menu_bar.add_cascade(label="Window", menu=window_menu)
 
         help_menu = tk.Menu(menu_bar, tearoff=0)
+        help_menu.add_command(
+            label="Record Profile (10 s)",
+            command=lambda: self.serial_manager.record_profile(10.0),
+        )
         help_menu.add_command(label="About", command=self.show_about)
         menu_bar.add_cascade(label="Help", menu=help_menu)
 
         self.root.config(menu=menu_bar)
 
-    def insert_log(self, message):
-        split_lines = re.split(r"(?<!\n)[|+](?=\w)", message)
+    def insert_log(self, message, device=None):
+        self.insert_logs([message], device)
 
-        for line in split_lines:
-            line = line.strip()
-            if not line:
-                continue
+    def insert_logs(self, messages, device=None):
+        items = []
+        for message in messages:
+            marks = getattr(message, "marks", None)
+            if marks is None:
+                marks = self.triggers.marks(message) if device is None else ()
 
-            tag = None
-            for keyword in self.color_tags:
-                if keyword in line:
-                    tag = keyword.lower()
-                    break
+            start = 0
+            ends = [match.start() for match in self.split_pattern.finditer(message)]
+            for end in ends + [len(message)]:
+                line = message[start:end].strip()
+                if line:
+                    # The highest-priority rule that matched inside this part.
+                    tags = [(priority, tag) for pos, priority, tag in marks if start <= pos < end]
+                    items.append((line, min(tags)[1] if tags else None))
+                start = end + 1
 
-            if tag:
-                self.log_console.insert(tk.END, line + "\n", tag)
-            else:
-                self.log_console.insert(tk.END, line + "\n")
+        console = self.consoles.get(device, self.log_console)
+        console.append_lines(items, follow=not console.user_scrolled)
+
+    def after(self, ms, func):
+        return self.root.after(ms, func)
+
+    def close(self):
+        self.serial_manager.close()
+
+    def set_title(self, text):
+        try:
+            self.root.title(text)
+        except tk.TclError:
+            pass  # closing the window already destroyed it
 
-        if not self.user_scrolled:
-            self.log_console.yview(tk.END)
+    def set_status(self, text):
+        self.status_bar.config(text=text)
 
     def copy_text(self, event=None):
         try:
-            selected = self.log_console.get("sel.first", "sel.last")
+            selected = self.current_console().get("sel.first", "sel.last")
             self.root.clipboard_clear()
             self.root.clipboard_append(selected)
         except tk.TclError:
@@ -141,43 +222,42 @@ class UI:
     def paste_text(self, event=None):
         try:
             clipboard = self.root.clipboard_get()
-            self.log_console.insert(tk.END, clipboard + "\n")
-            self.log_console.yview(tk.END)
+            device = self.current_device()
+            self.insert_logs(clipboard.splitlines(), device)
 
-            if (
-                self.serial_manager.serial_port
-                and self.serial_manager.serial_port.is_open
-            ):
+            if self.serial_manager.connected:
                 for line in clipboard.strip().splitlines():
                     if line.startswith("*"):
-                        self.serial_manager.serial_port.write((line + "\n").encode())
-                        self.insert_log(f"{line}")
+                        self.serial_manager.send_command(line)
+                        self.insert_log(f"{line}", device)
         except tk.TclError:
             messagebox.showwarning("Paste", "Clipboard is empty or cannot be accessed.")
         return "break"
 
     def select_all(self, event=None):
-        self.log_console.tag_add("sel", "1.0", "end")
+        self.current_console().tag_add("sel", "1.0", "end")
         return "break"
 
     def on_mouse_scroll(self, event):
-        self.user_scrolled = not self.at_bottom()
+        event.widget.user_scrolled = not self.at_bottom(event.widget)
 
     def scroll_to_bottom(self):
-        self.user_scrolled = False
-        self.root.after(10, lambda: self.log_console.yview_moveto(1.0))
+        console = self.current_console()
+        console.user_scrolled = False
+        self.root.after(10, lambda: console.yview_moveto(1.0))
 
-    def at_bottom(self):
-        return self.log_console.yview()[1] == 1.0
+    def at_bottom(self, console=None):
+        console = console or self.current_console()
+        return console.yview()[1] == 1.0
 
     def on_mouse_scroll_linux_up(self, event):
-        self.log_console.yview_scroll(-1, "units")
-        self.user_scrolled = not self.at_bottom()
+        event.widget.yview_scroll(-1, "units")
+        event.widget.user_scrolled = not self.at_bottom(event.widget)
         return "break"
 
     def on_mouse_scroll_linux_down(self, event):
-        self.log_console.yview_scroll(1, "units")
-        self.user_scrolled = not self.at_bottom()
+        event.widget.yview_scroll(1, "units")
+        event.widget.user_scrolled = not self.at_bottom(event.widget)
         return "break"
 
     def maximize_window(self):